@@ -0,0 +1,65 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmarks of building and serializing sequences of commands, see benchmarks/README.md.
+"""
+
+from benchlib import commands_sequence, put_commands, rounds_for
+
+
+def test_construct_command_headers(benchmark, mock_cqc, num_commands):
+    commands = commands_sequence(num_commands)
+
+    def construct():
+        for command, kwargs in commands:
+            mock_cqc.construct_command_headers(1, command, notify=False, **kwargs)
+
+    benchmark.pedantic(construct, rounds=rounds_for(num_commands))
+
+
+def test_put_command(benchmark, mock_cqc, num_commands):
+    commands = commands_sequence(num_commands)
+    mock_cqc.set_pending(True)
+    benchmark.pedantic(put_commands, args=(mock_cqc, commands), setup=mock_cqc.reset_pending_headers,
+                       rounds=rounds_for(num_commands))
+    assert len(mock_cqc._pending_headers) > num_commands
+
+
+def test_flush_factory(benchmark, mock_cqc, reply_socket, num_commands):
+    mock_cqc.set_pending(True)
+    put_commands(mock_cqc, commands_sequence(num_commands))
+    headers = mock_cqc._pending_headers
+    mock_cqc.reset_pending_headers()
+
+    def pend():
+        mock_cqc._set_pending_headers(list(headers))
+
+    benchmark.pedantic(mock_cqc.flush_factory, args=(10,), setup=pend, rounds=rounds_for(num_commands))
+    assert reply_socket.bytes_sent > sum(header.HDR_LENGTH for header in headers)
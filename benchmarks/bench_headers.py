@@ -0,0 +1,122 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmarks of packing and unpacking every type of header, see benchmarks/README.md.
+"""
+
+import pytest
+
+from cqc.cqcHeader import (
+    CQC_CMD_H,
+    CQC_TP_COMMAND,
+    CQC_VERSION,
+    CQCAggregateMode,
+    CQCAssignExprHeader,
+    CQCAssignHeader,
+    CQCCmdHeader,
+    CQCCommunicationHeader,
+    CQCEPRRequestHeader,
+    CQCExprHeader,
+    CQCExprOpcode,
+    CQCFactoryHeader,
+    CQCHeader,
+    CQCIfExprHeader,
+    CQCIfHeader,
+    CQCLogicalOperator,
+    CQCMeasCountHeader,
+    CQCMeasOutHeader,
+    CQCMeasSummaryHeader,
+    CQCPackedMeasOutHeader,
+    CQCRotationHeader,
+    CQCSequenceHeader,
+    CQCTimeinfoHeader,
+    CQCType,
+    CQCTypeHeader,
+    CQCXtraQubitHeader,
+)
+from cqc.entInfoHeader import EntInfoCreateKeepHeader, EntInfoHeader, EntInfoMeasDirectHeader
+
+
+def _header(header_class, marks=(), **values):
+    return pytest.param(header_class, values, id=header_class.__name__, marks=marks)
+
+
+# Every type of header with the values to set, the ones packed using bitstring are marked as such
+HEADERS = [
+    _header(CQCHeader, version=CQC_VERSION, tp=CQC_TP_COMMAND, app_id=1, length=8),
+    _header(CQCTypeHeader, tp=CQCType.COMMAND, length=8),
+    _header(CQCCmdHeader, qubit_id=1, instr=CQC_CMD_H, notify=True, block=True),
+    _header(CQCXtraQubitHeader, qubit_id=2),
+    _header(CQCRotationHeader, step=64),
+    _header(CQCAssignHeader, ref_id=3),
+    _header(CQCCommunicationHeader, remote_app_id=1, remote_node=2130706433, remote_port=8004),
+    _header(CQCSequenceHeader, cmd_length=16),
+    _header(CQCFactoryHeader, num_iter=255, notify=True, block=True, aggregate=CQCAggregateMode.COUNTS),
+    _header(CQCIfHeader, first_operand=3, operator=CQCLogicalOperator.EQ,
+            type_of_second_operand=CQCIfHeader.TYPE_VALUE, second_operand=1, length=8),
+    _header(CQCIfExprHeader, expr_length=10, length=8),
+    _header(CQCAssignExprHeader, ref_id=3, expr_length=10),
+    _header(CQCExprHeader, opcode=CQCExprOpcode.PUSH_VALUE, operand=1),
+    _header(CQCMeasOutHeader, outcome=1),
+    _header(CQCMeasSummaryHeader, aggregate=CQCAggregateMode.COUNTS, num_slots=4, num_iter=1000, num_entries=4),
+    _header(CQCMeasCountHeader, key=5, count=1000),
+    _header(CQCPackedMeasOutHeader, num_outcomes=4000, num_slots=4),
+    _header(CQCTimeinfoHeader, datetime=1000),
+    _header(EntInfoHeader, node_A=2130706433, port_A=8004, app_id_A=1, node_B=2130706433, port_B=8005, app_id_B=2,
+            id_AB=3, timestamp=1000, ToG=1000, goodness=1, DF=1),
+    _header(CQCEPRRequestHeader, marks=pytest.mark.bitstring, remote_ip=2130706433, remote_port=8004, num_pairs=2,
+            min_fidelity=0.5, max_time=1.5, priority=1),
+    _header(EntInfoCreateKeepHeader, marks=pytest.mark.bitstring, ip_A=2130706433, port_A=8004, ip_B=2130706433,
+            port_B=8005, mhp_seq=3, t_create=1.5, t_goodness=1.5, goodness=0.5, DF=1, create_id=4),
+    _header(EntInfoMeasDirectHeader, marks=pytest.mark.bitstring, ip_A=2130706433, port_A=8004, ip_B=2130706433,
+            port_B=8005, mhp_seq=3, meas_out=1, basis=1, t_create=1.5, goodness=0.5, DF=1, create_id=4),
+]
+
+
+@pytest.mark.parametrize("header_class, values", HEADERS)
+def test_set_vals(benchmark, header_class, values):
+    header = header_class()
+    benchmark(header.setVals, **values)
+
+
+@pytest.mark.parametrize("header_class, values", HEADERS)
+def test_pack(benchmark, header_class, values):
+    header = header_class()
+    header.setVals(**values)
+    benchmark(header.pack)
+
+
+@pytest.mark.parametrize("header_class, values", HEADERS)
+def test_unpack(benchmark, header_class, values):
+    header = header_class()
+    header.setVals(**values)
+    data = header.pack()
+    unpacked = benchmark(header_class, data)
+    assert unpacked.pack() == data
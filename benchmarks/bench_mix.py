@@ -0,0 +1,99 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmarks of building CQCMix programs, see benchmarks/README.md.
+"""
+
+import pytest
+
+from benchlib import done_reply, new_ok_reply, rounds_for
+
+from cqc.pythonLib import CQCMix, mix_qubit
+
+# Number of conditionals and of gates in the loop of a program
+MIX_SIZES = [10, 1000, 100000]
+
+# Rounds of the benchmarks on the loopback backend, where the time is mostly spent simulating
+LOOPBACK_ROUNDS = 10
+
+
+def _body(pgrm, q, num_instructions):
+    """num_instructions conditional X gates followed by a loop of num_instructions X gates, as in mix_builder.py"""
+    m = q.measure(inplace=True)
+    for _ in range(num_instructions):
+        with pgrm.cqc_if(m == 1):
+            q.X()
+    with pgrm.loop(1):
+        for _ in range(num_instructions):
+            q.X()
+
+
+@pytest.fixture
+def mock_qubit(mock_mix_cqc, reply_socket):
+    reply_socket.queue(new_ok_reply(1) + done_reply())
+    q = mix_qubit(mock_mix_cqc)
+    yield q
+    mock_mix_cqc._active_qubits.clear()
+
+
+@pytest.mark.parametrize("num_instructions", MIX_SIZES)
+def test_build(benchmark, mock_mix_cqc, reply_socket, mock_qubit, num_instructions):
+    """Builds and serializes a program, the backend only acknowledges it."""
+    def build():
+        with CQCMix(mock_mix_cqc) as pgrm:
+            _body(pgrm, mock_qubit, num_instructions)
+
+    benchmark.pedantic(build, setup=lambda: reply_socket.queue(done_reply()), rounds=rounds_for(num_instructions))
+
+
+@pytest.mark.parametrize("num_instructions", MIX_SIZES)
+def test_compile(benchmark, mock_mix_cqc, num_instructions):
+    def compile_program():
+        CQCMix.compile(mock_mix_cqc, lambda pgrm, q: _body(pgrm, q, num_instructions), num_qubits=1)
+
+    benchmark.pedantic(compile_program, rounds=rounds_for(num_instructions))
+
+
+def test_run_loopback(benchmark, loopback_mix_cqc):
+    """Builds and runs a program with 100 conditionals on the loopback backend."""
+    q = mix_qubit(loopback_mix_cqc)
+
+    def run():
+        with CQCMix(loopback_mix_cqc) as pgrm:
+            _body(pgrm, q, 100)
+
+    benchmark.pedantic(run, rounds=LOOPBACK_ROUNDS)
+
+
+def test_run_compiled_loopback(benchmark, loopback_mix_cqc):
+    """Runs a compiled program with 100 conditionals on the loopback backend."""
+    q = mix_qubit(loopback_mix_cqc)
+    program = CQCMix.compile(loopback_mix_cqc, lambda pgrm, q: _body(pgrm, q, 100), num_qubits=1)
+    benchmark.pedantic(program.run, args=(q,), rounds=LOOPBACK_ROUNDS)
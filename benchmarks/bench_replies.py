@@ -0,0 +1,102 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmarks of reading and parsing the replies of the backend, see benchmarks/README.md.
+"""
+
+import pytest
+
+from benchlib import done_reply, measout_reply, new_ok_reply, rounds_for
+
+from cqc.cqcHeader import CQC_CMD_MEASURE_INPLACE
+from cqc.pythonLib import qubit
+
+# Number of replies in a burst
+BURST_SIZES = [10, 1000, 100000]
+
+# Number of iterations of a factory
+FACTORY_SIZES = [255, 10000]
+
+# Rounds of the benchmarks on the loopback backend, where the time is mostly spent simulating
+LOOPBACK_ROUNDS = 10
+
+
+def _burst(num_replies):
+    """A burst of replies as sent back for qubits which are created, measured and released."""
+    replies = [new_ok_reply(1), measout_reply(1), done_reply()]
+    return b''.join(replies[i % len(replies)] for i in range(num_replies))
+
+
+@pytest.mark.parametrize("num_replies", BURST_SIZES)
+def test_read_message(benchmark, mock_cqc, reply_socket, num_replies):
+    """Reads and parses a burst of replies which were all received already."""
+    burst = _burst(num_replies)
+
+    def read():
+        for _ in range(num_replies):
+            mock_cqc.readMessage()
+
+    benchmark.pedantic(read, setup=lambda: reply_socket.queue(burst), rounds=rounds_for(num_replies))
+
+
+@pytest.mark.parametrize("num_iter", FACTORY_SIZES)
+def test_factory_outcomes(benchmark, mock_cqc, reply_socket, num_iter):
+    """Reads and parses the outcomes of a factory, one message per outcome."""
+    mock_cqc.set_pending(True)
+    mock_cqc.put_command(1, CQC_CMD_MEASURE_INPLACE, notify=False)
+    headers = mock_cqc._pending_headers
+    mock_cqc.reset_pending_headers()
+    outcomes = measout_reply(1) * num_iter
+
+    def setup():
+        mock_cqc._set_pending_headers(list(headers))
+        reply_socket.queue(outcomes)
+
+    results = benchmark.pedantic(mock_cqc.flush_factory, args=(num_iter,), setup=setup, rounds=rounds_for(num_iter))
+    assert results == [1] * num_iter
+
+
+@pytest.mark.parametrize("aggregate", [None, "counts", "histogram", "packed"])
+def test_factory_loopback(benchmark, loopback_cqc, aggregate):
+    """Runs a factory measuring two qubits on the loopback backend, with the outcomes aggregated or not."""
+    q1 = qubit(loopback_cqc)
+    q2 = qubit(loopback_cqc)
+
+    def run():
+        loopback_cqc.set_pending(True)
+        q1.H()
+        q1.cnot(q2)
+        q1.measure(inplace=True)
+        q2.measure(inplace=True)
+        results = loopback_cqc.flush_factory(255, aggregate=aggregate)
+        loopback_cqc.set_pending(False)
+        return results
+
+    benchmark.pedantic(run, rounds=LOOPBACK_ROUNDS)
@@ -0,0 +1,62 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmarks of the overhead of dispatching messages in CQCMessageHandler and CQCProtocol, see server_dispatch.py.
+"""
+
+import pytest
+
+from server_dispatch import STREAMS, CountingTransport, NoOpMessageHandler, connect, count_deferreds
+
+# Number of messages in a stream
+NUM_MESSAGES = {
+    "commands": 10000,
+    "factories": 100,
+    "mixes": 1000,
+}
+
+
+@pytest.mark.parametrize("stream", list(STREAMS))
+def test_dispatch(benchmark, stream):
+    messages = STREAMS[stream](NUM_MESSAGES[stream])
+    data = b''.join(messages)
+
+    def setup():
+        return (connect(NoOpMessageHandler(), CountingTransport()),), {}
+
+    benchmark.pedantic(lambda protocol: protocol.dataReceived(data), setup=setup, rounds=10)
+
+    transport = CountingTransport(check_errors=True)
+    protocol = connect(NoOpMessageHandler(), transport)
+    with count_deferreds() as deferreds:
+        protocol.dataReceived(data)
+    assert transport.num_replies == len(messages)
+    assert transport.num_errors == 0
+    benchmark.extra_info["deferreds_per_message"] = deferreds[0] / len(messages)
@@ -0,0 +1,62 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmarks of writing commands to a file with CQCToFile, see benchmarks/README.md.
+"""
+
+import os
+
+import pytest
+
+from benchlib import commands_sequence, put_commands, rounds_for
+
+from cqc.pythonLib import CQCToFile
+
+MODES = {
+    "binary": dict(binary=True),
+    "gzip": dict(binary=True, compression="gzip"),
+    "text": dict(binary=False),
+}
+
+
+@pytest.mark.parametrize("mode", list(MODES))
+def test_write(benchmark, tmpdir, num_commands, mode):
+    commands = commands_sequence(num_commands)
+    file = str(tmpdir.join("CQC_File"))
+
+    def setup():
+        return (CQCToFile(file=file, overwrite=True, **MODES[mode]),), {}
+
+    def write(cqc):
+        put_commands(cqc, commands)
+        cqc.close(release_qubits=False)
+
+    benchmark.pedantic(write, setup=setup, rounds=rounds_for(num_commands))
+    benchmark.extra_info["bytes_written"] = os.path.getsize(file)
@@ -0,0 +1,136 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Helpers for the benchmarks of the client library.
+"""
+
+from itertools import cycle, islice
+
+from cqc.cqcHeader import (
+    CQC_CMD_CNOT,
+    CQC_CMD_H,
+    CQC_CMD_ROT_X,
+    CQC_CMD_X,
+    CQC_VERSION,
+    CQCHeader,
+    CQCMeasOutHeader,
+    CQCType,
+    CQCXtraQubitHeader,
+)
+
+# Number of commands used by the benchmarks which scale with the size of a sequence, up to --max-commands
+COMMAND_COUNTS = [10, 1000, 100000, 1000000]
+
+# Number of rounds of a benchmark of a sequence of the given size, such that large sizes don't take minutes
+ROUNDS_BUDGET = 10 ** 5
+
+
+def rounds_for(num_commands):
+    """Number of rounds to run a benchmark over num_commands commands."""
+    return max(3, min(100, ROUNDS_BUDGET // num_commands))
+
+
+# The commands of the sequences, with and without extra headers, none of them sends a reply
+COMMANDS = [
+    (CQC_CMD_H, {}),
+    (CQC_CMD_ROT_X, {"step": 32}),
+    (CQC_CMD_CNOT, {"xtra_qID": 2}),
+    (CQC_CMD_X, {}),
+]
+
+
+def commands_sequence(num_commands):
+    """A sequence of num_commands commands, as tuples (command, keyword arguments of put_command)."""
+    return list(islice(cycle(COMMANDS), num_commands))
+
+
+def put_commands(cqc, commands):
+    """Puts the commands of a sequence on qubit 1, without waiting for notifications."""
+    for command, kwargs in commands:
+        cqc.put_command(1, command, notify=False, **kwargs)
+
+
+class ReplySocket:
+    """Stands in for the socket to the backend: sent data is counted and dropped, queued replies are received."""
+
+    def __init__(self, *args, **kwargs):
+        self.bytes_sent = 0
+        self._replies = bytearray()
+        self._pos = 0
+
+    def connect(self, *args, **kwargs):
+        pass
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        return len(data)
+
+    def sendall(self, data):
+        self.bytes_sent += len(data)
+
+    def queue(self, data):
+        """Queues data to be received."""
+        del self._replies[:self._pos]
+        self._pos = 0
+        self._replies += data
+
+    def recv(self, maxsize):
+        data = bytes(self._replies[self._pos:self._pos + maxsize])
+        self._pos += len(data)
+        return data
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        pass
+
+
+def reply(tp, app_id=0, body=b''):
+    """Packs a reply from the backend of the given type with the given body."""
+    hdr = CQCHeader()
+    hdr.setVals(CQC_VERSION, tp, app_id, len(body))
+    return hdr.pack() + body
+
+
+def new_ok_reply(qubit_id, app_id=0):
+    xtra_hdr = CQCXtraQubitHeader()
+    xtra_hdr.setVals(qubit_id)
+    return reply(CQCType.NEW_OK, app_id, xtra_hdr.pack())
+
+
+def measout_reply(outcome, app_id=0):
+    meas_hdr = CQCMeasOutHeader()
+    meas_hdr.setVals(outcome)
+    return reply(CQCType.MEASOUT, app_id, meas_hdr.pack())
+
+
+def done_reply(app_id=0):
+    return reply(CQCType.DONE, app_id)
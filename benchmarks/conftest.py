@@ -0,0 +1,106 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Fixtures for the benchmarks of the client library, see benchmarks/README.md.
+
+The connections either talk to a ReplySocket (see benchlib.py), such that only the work of the library is
+measured, or to a LoopbackBackend running in the same process.
+"""
+
+import socket
+
+import pytest
+
+from benchlib import COMMAND_COUNTS, ReplySocket
+
+from cqc.loopback import LoopbackBackend
+from cqc.pythonLib import CQCConnection, CQCMixConnection, CQCVariable
+
+
+def pytest_addoption(parser):
+    parser.addoption("--max-commands", type=int, default=max(COMMAND_COUNTS),
+                     help="Largest number of commands in the benchmarks of sequences (default: %(default)s)")
+
+
+def pytest_generate_tests(metafunc):
+    if "num_commands" in metafunc.fixturenames:
+        max_commands = metafunc.config.getoption("max_commands")
+        metafunc.parametrize("num_commands", [n for n in COMMAND_COUNTS if n <= max_commands])
+
+
+@pytest.fixture
+def reply_socket(monkeypatch):
+    """Makes connections use a ReplySocket, which is returned."""
+    reply_socket = ReplySocket()
+    monkeypatch.setattr(socket, "socket", lambda *args, **kwargs: reply_socket)
+    CQCVariable._next_ref_id = 0
+    return reply_socket
+
+
+def _open(connection_class, socket_address, **kwargs):
+    return connection_class("Alice", socket_address=socket_address, use_classical_communication=False, **kwargs)
+
+
+@pytest.fixture
+def mock_cqc(reply_socket):
+    """A CQCConnection to a ReplySocket."""
+    cqc = _open(CQCConnection, ("localhost", 8004))
+    yield cqc
+    cqc.reset_pending_headers()
+    cqc.close(release_qubits=False)
+
+
+@pytest.fixture
+def mock_mix_cqc(reply_socket):
+    """A CQCMixConnection to a ReplySocket."""
+    cqc = _open(CQCMixConnection, ("localhost", 8004))
+    yield cqc
+    cqc.reset_pending_headers()
+    cqc.close(release_qubits=False)
+
+
+@pytest.fixture(scope="module")
+def loopback():
+    with LoopbackBackend(seed=1) as backend:
+        yield backend
+
+
+@pytest.fixture
+def loopback_cqc(loopback):
+    """A CQCConnection to a LoopbackBackend."""
+    with _open(CQCConnection, loopback.socket_address) as cqc:
+        yield cqc
+
+
+@pytest.fixture
+def loopback_mix_cqc(loopback):
+    """A CQCMixConnection to a LoopbackBackend."""
+    with _open(CQCMixConnection, loopback.socket_address) as cqc:
+        yield cqc
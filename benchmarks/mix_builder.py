@@ -0,0 +1,77 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmark for building CQCMix programs, which should take time linear in the number of instructions.
+The programs are run on the loopback backend.
+
+Usage: python benchmarks/mix_builder.py [number of instructions ...]
+"""
+
+import sys
+import time
+
+from cqc.loopback import LoopbackBackend
+from cqc.pythonLib import CQCMix, CQCMixConnection, mix_qubit
+
+
+def bench_mix(cqc, num_instructions):
+    """
+    Builds and sends a program with num_instructions conditional X gates followed by a loop of num_instructions
+    X gates, returns the build time and the time to send and run it.
+    """
+    q = mix_qubit(cqc)
+    with CQCMix(cqc) as pgrm:
+        start = time.perf_counter()
+        m = q.measure(inplace=True)
+        for _ in range(num_instructions):
+            with pgrm.cqc_if(m == 1):
+                q.X()
+        with pgrm.loop(1):
+            for _ in range(num_instructions):
+                q.X()
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+    send = time.perf_counter() - start
+    q.measure()
+    return build, send
+
+
+def main(sizes):
+    with LoopbackBackend() as backend:
+        with CQCMixConnection("Alice", socket_address=backend.socket_address,
+                              use_classical_communication=False) as cqc:
+            for num_instructions in sizes:
+                build, send = bench_mix(cqc, num_instructions)
+                print("{:>8} instructions  build {:>7.3f} s ({:>5.2f} us/instr)  send and run {:>7.3f} s".format(
+                    num_instructions, build, 1e6 * build / num_instructions, send))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [25000, 50000, 100000])
@@ -0,0 +1,83 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Microbenchmark for creating qubit objects, as done for every qubit returned by the backend.
+
+Usage: python benchmarks/qubit_handles.py [number of qubits]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+from cqc.pythonLib import CQCToFile, qubit
+
+
+def bench_from_backend(cqc, num_qubits):
+    start = time.perf_counter()
+    for q_id in range(num_qubits):
+        qubit._from_backend(cqc, q_id)
+    return time.perf_counter() - start
+
+
+def bench_init(cqc, num_qubits):
+    start = time.perf_counter()
+    for q_id in range(num_qubits):
+        q = qubit(cqc, createNew=False, q_id=q_id)
+        q._set_active(True)
+    return time.perf_counter() - start
+
+
+def memory_per_qubit(cqc, num_qubits):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    qubits = [qubit._from_backend(cqc, q_id) for q_id in range(num_qubits)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del qubits
+    return (after - before) / num_qubits
+
+
+def main(num_qubits):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cqc = CQCToFile(file=os.path.join(tmpdir, "CQC_File"))
+        for name, bench in [("qubit._from_backend", bench_from_backend), ("qubit.__init__", bench_init)]:
+            duration = bench(cqc, num_qubits)
+            cqc._active_qubits.clear()
+            print("{:<20} {:>8.3f} s  {:>6.0f} ns/qubit".format(name, duration, 1e9 * duration / num_qubits))
+        print("{:<20} {:>8.0f} bytes/qubit (incl. registry)".format("memory", memory_per_qubit(cqc, num_qubits)))
+        cqc._active_qubits.clear()
+        cqc.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,328 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Benchmark harness for the overhead of dispatching CQC messages in CQCMessageHandler and CQCProtocol.
+
+A NoOpMessageHandler, whose cmd_* methods return immediately, is run behind a CQCProtocol with a
+CountingTransport, such that only the work of the framework is measured and not that of a simulator.
+It is fed generated streams of commands, factories and mixes with IFs, or recorded binary traces
+(for example written by CQCToFile). For every stream the messages per second, the overhead per command,
+the number of Deferreds created and the growth of the memory are reported. The Deferreds and the memory are
+measured on a sample of the first messages of a stream only, since tracing them is much slower than the
+dispatching itself.
+
+To measure another backend, pass a function creating its CQCMessageHandler to run_stream.
+
+Usage: python benchmarks/server_dispatch.py [--messages N] [--sample N] [--trace FILE ...]
+"""
+
+import gc
+import sys
+import time
+import argparse
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+from twisted.internet import defer
+
+from cqc.MessageHandler import CQCMessageHandler, is_error_message
+from cqc.Protocol import CQCProtocol
+from cqc.cqcHeader import (
+    CQC_CMD_CNOT,
+    CQC_CMD_H,
+    CQC_CMD_MEASURE_INPLACE,
+    CQC_CMD_ROT_X,
+    CQC_CMD_X,
+    CQC_VERSION,
+    CQCAssignHeader,
+    CQCCmdHeader,
+    CQCFactoryHeader,
+    CQCHeader,
+    CQCIfHeader,
+    CQCLogicalOperator,
+    CQCRotationHeader,
+    CQCType,
+    CQCTypeHeader,
+    CQCXtraQubitHeader,
+)
+from cqc.trace import CQCTraceReader
+
+APP_ID = 1
+
+DispatchResult = namedtuple("DispatchResult", [
+    "num_messages",  # Number of messages fed to the protocol
+    "num_commands",  # Number of commands executed by the handler, including those in factories and IFs
+    "num_replies",  # Number of replies written to the transport while handling the sampled messages
+    "num_errors",  # Number of error replies to the sampled messages, should be 0 for a valid stream
+    "duration",  # Seconds to handle all messages
+    "num_sampled",  # Number of messages of which the Deferreds and the memory are measured
+    "deferreds",  # Number of Deferreds created while handling the sampled messages
+    "memory_growth",  # Bytes allocated while handling the sampled messages and not freed after
+    "memory_peak",  # Peak of the bytes allocated while handling the sampled messages
+])
+
+
+class _Factory:
+    """The parts of a CQC factory used by CQCProtocol and CQCMessageHandler"""
+
+    def __init__(self, name, backend):
+        self.name = name
+        self.backend = backend
+
+
+class NoOpMessageHandler(CQCMessageHandler):
+    """
+    A message handler whose commands return immediately and send nothing back, apart from the notifications.
+    Measurements only store the outcome 0 in their reference ID, such that IFs on them can be evaluated.
+    """
+
+    def __init__(self, name="NoOp"):
+        super().__init__(_Factory(name, self))
+        # Number of commands executed
+        self.num_commands = 0
+
+    def _noop(self, cqc_header, cmd, xtra, **kwargs):
+        self.num_commands += 1
+
+    def handle_hello(self, header, data):
+        return True
+
+    def handle_time(self, header, data):
+        return True
+
+    def cmd_measure(self, cqc_header, cmd, xtra, inplace=False):
+        self.num_commands += 1
+        self.references[cqc_header.app_id][xtra.ref_id] = 0
+
+    def cmd_measure_inplace(self, cqc_header, cmd, xtra):
+        self.cmd_measure(cqc_header, cmd, xtra, inplace=True)
+
+    cmd_i = cmd_x = cmd_y = cmd_z = cmd_t = cmd_h = cmd_k = _noop
+    cmd_rotx = cmd_roty = cmd_rotz = cmd_cnot = cmd_cphase = cmd_reset = _noop
+    cmd_send = cmd_recv = cmd_epr = cmd_epr_recv = cmd_new = cmd_allocate = cmd_release = _noop
+
+
+class CountingTransport:
+    """Transport of a CQCProtocol which only counts the replies, and if check_errors the error replies."""
+
+    def __init__(self, check_errors=False):
+        self.check_errors = check_errors
+        self.num_replies = 0
+        self.num_errors = 0
+
+    def write(self, data):
+        self.num_replies += 1
+        if self.check_errors and is_error_message(data):
+            self.num_errors += 1
+
+
+@contextmanager
+def count_deferreds():
+    """Counts the Deferreds created in the context, the count is in the first element of the yielded list."""
+    count = [0]
+    init = defer.Deferred.__init__
+
+    def counting_init(self, *args, **kwargs):
+        count[0] += 1
+        init(self, *args, **kwargs)
+
+    defer.Deferred.__init__ = counting_init
+    try:
+        yield count
+    finally:
+        defer.Deferred.__init__ = init
+
+
+def _pack(*headers):
+    return b''.join(header.pack() for header in headers)
+
+
+def _message(tp, body):
+    hdr = CQCHeader()
+    hdr.setVals(CQC_VERSION, tp, APP_ID, len(body))
+    return hdr.pack() + body
+
+
+def _command(instr, notify=True, ref_id=0):
+    """The headers of a command on qubit 1, with its extra header if any"""
+    cmd_hdr = CQCCmdHeader()
+    cmd_hdr.setVals(1, instr, notify=notify, block=True)
+    if instr == CQC_CMD_ROT_X:
+        xtra_hdr = CQCRotationHeader()
+        xtra_hdr.setVals(32)
+    elif instr == CQC_CMD_CNOT:
+        xtra_hdr = CQCXtraQubitHeader()
+        xtra_hdr.setVals(2)
+    elif instr == CQC_CMD_MEASURE_INPLACE:
+        xtra_hdr = CQCAssignHeader()
+        xtra_hdr.setVals(ref_id)
+    else:
+        return _pack(cmd_hdr)
+    return _pack(cmd_hdr, xtra_hdr)
+
+
+# The commands of the generated streams
+_COMMANDS = [CQC_CMD_H, CQC_CMD_ROT_X, CQC_CMD_CNOT, CQC_CMD_X, CQC_CMD_MEASURE_INPLACE]
+
+
+def command_stream(num_messages):
+    """Messages with a single command each, all notified."""
+    return [_message(CQCType.COMMAND, _command(_COMMANDS[i % len(_COMMANDS)])) for i in range(num_messages)]
+
+
+def factory_stream(num_messages, num_iter=CQCFactoryHeader.MAX_NUM_ITER):
+    """Factories of num_iter iterations of a sequence of all commands."""
+    factory_hdr = CQCFactoryHeader()
+    factory_hdr.setVals(num_iter, notify=True, block=True)
+    body = factory_hdr.pack() + b''.join(_command(instr, notify=False) for instr in _COMMANDS)
+    return [_message(CQCType.FACTORY, body)] * num_messages
+
+
+def mix_stream(num_messages, num_ifs=10):
+    """Mixes with a measurement followed by num_ifs IFs on its outcome, half of which are true, with an X inside."""
+    measure = _command(CQC_CMD_MEASURE_INPLACE, notify=False)
+    x = _command(CQC_CMD_X, notify=False)
+    command_type_hdr = CQCTypeHeader()
+    command_type_hdr.setVals(CQCType.COMMAND, len(measure))
+    body = [command_type_hdr.pack() + measure]
+    command_type_hdr.setVals(CQCType.COMMAND, len(x))
+    if_body = command_type_hdr.pack() + x
+    if_type_hdr = CQCTypeHeader()
+    if_type_hdr.setVals(CQCType.IF, CQCIfHeader.HDR_LENGTH)
+    if_hdr = CQCIfHeader()
+    for i in range(num_ifs):
+        if_hdr.setVals(0, CQCLogicalOperator.EQ, CQCIfHeader.TYPE_VALUE, i % 2, len(if_body))
+        body.append(_pack(if_type_hdr, if_hdr) + if_body)
+    return [_message(CQCType.MIX, b''.join(body))] * num_messages
+
+
+def trace_stream(file):
+    """The messages of a binary trace, for example written by CQCToFile."""
+    with CQCTraceReader(file, use_index=False) as reader:
+        return [bytes(message.data) for message in reader]
+
+
+STREAMS = {
+    "commands": command_stream,
+    "factories": factory_stream,
+    "mixes": mix_stream,
+}
+
+
+def _feed(protocol, data, chunk_size):
+    for start in range(0, len(data), chunk_size):
+        protocol.dataReceived(data[start:start + chunk_size])
+
+
+def connect(handler, transport):
+    """Returns a CQCProtocol for the handler, writing its replies to the transport."""
+    protocol = CQCProtocol(_Factory(handler.name, handler))
+    protocol.makeConnection(transport)
+    return protocol
+
+
+def run_stream(messages, handler_factory=NoOpMessageHandler, chunk_size=1 << 16, sample=None):
+    """
+    Feeds the messages to a CQCProtocol with a handler made by handler_factory, in chunks of chunk_size bytes
+    as if they were received from a socket, and returns a DispatchResult.
+
+    The messages are handled twice, each time by a new handler: once to measure the duration and
+    once with the Deferreds counted and the memory traced. The second time only the first sample messages are
+    handled, or all of them if sample is None.
+    """
+    data = b''.join(messages)
+    sampled = messages if sample is None else messages[:sample]
+
+    handler = handler_factory()
+    transport = CountingTransport()
+    protocol = connect(handler, transport)
+    gc.collect()
+    start = time.perf_counter()
+    _feed(protocol, data, chunk_size)
+    duration = time.perf_counter() - start
+    num_commands = getattr(handler, "num_commands", None)
+
+    handler = handler_factory()
+    transport = CountingTransport(check_errors=True)
+    protocol = connect(handler, transport)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        with count_deferreds() as deferreds:
+            _feed(protocol, b''.join(sampled), chunk_size)
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return DispatchResult(
+        num_messages=len(messages),
+        num_commands=num_commands,
+        num_replies=transport.num_replies,
+        num_errors=transport.num_errors,
+        duration=duration,
+        num_sampled=len(sampled),
+        deferreds=deferreds[0],
+        memory_growth=after - before,
+        memory_peak=peak - before,
+    )
+
+
+def format_result(name, result):
+    line = "{:<12} {:>8} msgs {:>10.0f} msgs/s".format(
+        name, result.num_messages, result.num_messages / result.duration)
+    if result.num_commands:
+        line += " {:>7.2f} us/cmd".format(1e6 * result.duration / result.num_commands)
+    line += " {:>6.1f} deferreds/msg {:>9} B growth {:>9} B peak".format(
+        result.deferreds / result.num_sampled, result.memory_growth, result.memory_peak)
+    if result.num_errors:
+        line += "  ({} errors)".format(result.num_errors)
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the dispatch overhead of CQCMessageHandler and CQCProtocol")
+    parser.add_argument("--messages", type=int, default=1000, help="Number of messages of the generated streams")
+    parser.add_argument("--sample", type=int, default=100,
+                        help="Number of messages of every stream of which the Deferreds and the memory are measured")
+    parser.add_argument("--trace", action="append", default=[], help="Binary trace to feed, e.g. written by CQCToFile")
+    parser.add_argument("--chunk-size", type=int, default=1 << 16, help="Number of bytes fed at once")
+    args = parser.parse_args(argv)
+
+    streams = [(name, stream(args.messages)) for name, stream in STREAMS.items()]
+    streams += [(file, trace_stream(file)) for file in args.trace]
+    for name, messages in streams:
+        print(format_result(name, run_stream(messages, chunk_size=args.chunk_size, sample=args.sample)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
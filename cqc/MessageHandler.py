@@ -30,6 +30,8 @@ import logging
 from collections import defaultdict
 from abc import ABC, abstractmethod
 
+import numpy as np
+
 from cqc.cqcHeader import (
     CQCCmdHeader,
     CQC_CMD_SEND,
@@ -69,7 +71,16 @@ from cqc.cqcHeader import (
     CQCTypeHeader,
     CQCAssignHeader,
     CQCIfHeader,
-    CQCLogicalOperator
+    CQCIfExprHeader,
+    CQCAssignExprHeader,
+    CQCExprHeader,
+    CQCExprOpcode,
+    CQCLogicalOperator,
+    CQCAggregateMode,
+    CQCMeasOutHeader,
+    CQCMeasSummaryHeader,
+    CQCMeasCountHeader,
+    CQCPackedMeasOutHeader,
 )
 from twisted.internet.defer import DeferredLock, inlineCallbacks
 
@@ -147,7 +158,9 @@ class CQCMessageHandler(ABC):
             CQCType.FACTORY: self.handle_factory,
             CQCType.GET_TIME: self.handle_time,
             CQCType.MIX: self.handle_mix,
-            CQCType.IF: self.handle_conditional
+            CQCType.IF: self.handle_conditional,
+            CQCType.IF_EXPR: self.handle_conditional_expression,
+            CQCType.ASSIGN_EXPR: self.handle_assign_expression,
         }
 
         # Functions to invoke when receiving a certain command
@@ -358,11 +371,31 @@ class CQCMessageHandler(ABC):
             logging.debug("CQC %s: Acquire lock for factory", self.name)
             self._sequence_lock.acquire()
 
+        aggregate = fact_header.aggregate
+        # Number of 1-outcomes per slot or number of occurrences per bitstring, depending on the aggregate mode
+        aggregated = defaultdict(int)
+        # All outcomes in order, for the packed mode
+        packed_outcomes = []
+        num_slots = 0
         for _ in range(num_iter):
+            first_message = len(self.return_messages[header.app_id])
             try:
                 succ, _ = yield self._process_command(header, header.length - fact_l, data[fact_l:], block_factory)
                 if succ is False:
+                    if aggregate:
+                        # Drop the outcomes of the failed iteration, such that only the error is returned
+                        self._take_outcomes(header.app_id, first_message)
                     return False
+                if aggregate:
+                    outcomes = self._take_outcomes(header.app_id, first_message)
+                    num_slots = max(num_slots, len(outcomes))
+                    if aggregate == CQCAggregateMode.PACKED:
+                        packed_outcomes.extend(outcomes)
+                    elif aggregate == CQCAggregateMode.COUNTS:
+                        for slot, outcome in enumerate(outcomes):
+                            aggregated[slot] += outcome
+                    else:
+                        aggregated[sum(outcome << slot for slot, outcome in enumerate(outcomes))] += 1
             except Exception as err:
                 logging.error(
                     "CQC {}: Got the following unexpected error when processing factory: {}".format(self.name, err)
@@ -375,8 +408,75 @@ class CQCMessageHandler(ABC):
             logging.debug("CQC %s: Releasing lock for factory", self.name)
             self._sequence_lock.release()
 
+        if aggregate == CQCAggregateMode.PACKED:
+            self.return_messages[header.app_id].append(
+                self.create_packed_message(header, num_slots, packed_outcomes))
+        elif aggregate:
+            self.return_messages[header.app_id].append(
+                self.create_summary_message(header, aggregate, num_slots, num_iter, aggregated))
+
         return succ and should_notify
 
+    def _take_outcomes(self, app_id, first_message):
+        """
+        Removes the measurement outcome messages from the return messages of app_id, starting at index
+        first_message, and returns the outcomes in order.
+        """
+        messages = self.return_messages[app_id]
+        outcomes = []
+        kept = []
+        for message in messages[first_message:]:
+            if CQCHeader(message[:CQCHeader.HDR_LENGTH]).tp == CQCType.MEASOUT:
+                start = CQCHeader.HDR_LENGTH
+                outcomes.append(CQCMeasOutHeader(message[start:start + CQCMeasOutHeader.HDR_LENGTH]).outcome)
+            else:
+                kept.append(message)
+        messages[first_message:] = kept
+        return outcomes
+
+    @staticmethod
+    def create_packed_message(header, num_slots, outcomes):
+        """
+        Creates the message with all measurement outcomes of a factory packed in bits
+        :param header: the CQC header of the factory
+        :param num_slots: the number of measurements per iteration
+        :param outcomes: list of all outcomes in the order they were measured
+        :return: the packed message
+        """
+        packed_header = CQCPackedMeasOutHeader()
+        packed_header.setVals(len(outcomes), num_slots)
+        body = packed_header.pack() + np.packbits(np.array(outcomes, dtype=np.uint8)).tobytes()
+        return CQCMessageHandler.create_return_message(
+            header.app_id, CQCType.MEASOUT_PACKED, length=len(body), cqc_version=header.version
+        ) + body
+
+    @staticmethod
+    def create_summary_message(header, aggregate, num_slots, num_iter, aggregated):
+        """
+        Creates the message with the aggregated measurement outcomes of a factory
+        :param header: the CQC header of the factory
+        :param aggregate: the CQCAggregateMode of the factory
+        :param num_slots: the number of measurements per iteration
+        :param num_iter: the number of iterations
+        :param aggregated: dict from slot (COUNTS) or bitstring (HISTOGRAM) to count
+        :return: the packed message
+        """
+        if aggregate == CQCAggregateMode.COUNTS:
+            entries = [(slot, aggregated[slot]) for slot in range(num_slots)]
+        else:
+            entries = sorted(aggregated.items())
+        summary_header = CQCMeasSummaryHeader()
+        summary_header.setVals(aggregate, num_slots, num_iter, len(entries))
+        body = [summary_header.pack()]
+        for key, count in entries:
+            count_header = CQCMeasCountHeader()
+            count_header.setVals(key, count)
+            body.append(count_header.pack())
+        body = b''.join(body)
+        return CQCMessageHandler.create_return_message(
+            header.app_id, CQCType.MEASOUT_SUMMARY, length=len(body), cqc_version=header.version
+        ) + body
+
     @inlineCallbacks
     def handle_mix(self, header: CQCHeader, data: bytes):
         """
@@ -408,7 +508,7 @@ class CQCMessageHandler(ABC):
             
             current_position += type_header.length
 
-            if type_header.type == CQCType.IF:
+            if type_header.type in (CQCType.IF, CQCType.IF_EXPR):
                 current_position += result
 
         # A TP_MIX should return the first error if there is an error message present, and otherwise return one TP_DONE
@@ -462,6 +562,62 @@ class CQCMessageHandler(ABC):
         else:
             return if_header.length
 
+    def handle_conditional_expression(self, header: CQCHeader, data: bytes):
+        """
+        Handler for messages of TP_IF_EXPR.
+        As for TP_IF, returns the body length of the IF if the expression evaluates to zero, and otherwise 0.
+        """
+        if_header = CQCIfExprHeader(data[:CQCIfExprHeader.HDR_LENGTH])
+        value = self._evaluate_expression(header, data[CQCIfExprHeader.HDR_LENGTH:], if_header.expr_length)
+
+        # If the expression cannot be evaluated, we consider this IF-statement to evaluate to False.
+        if value:
+            return 0
+        else:
+            return if_header.length
+
+    def handle_assign_expression(self, header: CQCHeader, data: bytes):
+        """
+        Handler for messages of TP_ASSIGN_EXPR, which assigns the value of an expression to a reference ID.
+        """
+        assign_header = CQCAssignExprHeader(data[:CQCAssignExprHeader.HDR_LENGTH])
+        value = self._evaluate_expression(header, data[CQCAssignExprHeader.HDR_LENGTH:], assign_header.expr_length)
+        if value is None:
+            return False
+        self.references[header.app_id][assign_header.ref_id] = value
+        return True
+
+    def _evaluate_expression(self, header: CQCHeader, data: bytes, expr_length: int):
+        """
+        Evaluates the expression in the first expr_length bytes of data, see CQCExprOpcode.
+        Returns None, and appends an error message, if the expression cannot be evaluated.
+        """
+        stack = []
+        references = self.references[header.app_id]
+        try:
+            for offset in range(0, expr_length, CQCExprHeader.HDR_LENGTH):
+                instr = CQCExprHeader(data[offset:offset + CQCExprHeader.HDR_LENGTH])
+                if instr.opcode == CQCExprOpcode.PUSH_VALUE:
+                    stack.append(instr.operand)
+                elif instr.opcode == CQCExprOpcode.PUSH_REF:
+                    stack.append(references[instr.operand])
+                elif instr.opcode == CQCExprOpcode.NOT:
+                    stack.append(CQCExprOpcode.apply(instr.opcode, stack.pop()))
+                else:
+                    second_operand = stack.pop()
+                    stack.append(CQCExprOpcode.apply(instr.opcode, stack.pop(), second_operand))
+            if len(stack) != 1:
+                raise ValueError("Expression leaves {} values on the stack".format(len(stack)))
+        # A KeyError is raised if a reference ID has not been assigned earlier, an IndexError if the stack is
+        # empty and a ValueError for an unknown opcode or a malformed expression
+        except (KeyError, IndexError, ValueError) as err:
+            logging.debug("CQC %s: Cannot evaluate expression: %s", self.name, err)
+            self.return_messages[header.app_id].append(
+                self.create_return_message(header.app_id, CQC_ERR_GENERAL, cqc_version=header.version)
+            )
+            return None
+        return stack[0]
+
     @abstractmethod
     def handle_hello(self, header, data):
         pass
@@ -32,6 +32,7 @@ from twisted.internet.defer import inlineCallbacks
 from twisted.internet.protocol import Protocol, connectionDone
 
 from cqc.cqcHeader import CQC_VERSION, CQCHeader
+from cqc.util import CQCMessageReader
 
 ###############################################################################
 #
@@ -63,14 +64,11 @@ class CQCProtocol(Protocol):
         # Define the backend to use.
         self.messageHandler = factory.backend
 
-        # Flag to determine whether we already received _all_ of the CQC header
-        self.gotCQCHeader = False
-
         # Header for which we are currently processing a packet
         self.currHeader = None
 
-        # Buffer received data (which may arrive in chunks)
-        self.buf = None
+        # Splits the received data (which may arrive in chunks) into complete messages
+        self._reader = CQCMessageReader()
 
         # Convenience
         self.name = self.factory.name
@@ -88,66 +86,27 @@ class CQCProtocol(Protocol):
         Receive data. We will always wait to receive enough data for the
         header, and then the entire packet first before commencing processing.
         """
-        # Read whatever we received into a buffer
-        if self.buf:
-            self.buf = self.buf + data
-        else:
-            self.buf = data
-
-            # If we don't have the CQC header yet, try and read it in full.
-        if not self.gotCQCHeader:
-            if len(self.buf) < CQCHeader.HDR_LENGTH:
-                # Not enough data for CQC header, return and wait for the rest
-                return
-
-                # Got enough data for the CQC Header so read it in
-            self.gotCQCHeader = True
-            raw_header = self.buf[0:CQCHeader.HDR_LENGTH]
-            self.currHeader = CQCHeader(raw_header)
-
-            # Remove the header from the buffer
-            self.buf = self.buf[CQCHeader.HDR_LENGTH: len(self.buf)]
-
-            logging.debug("CQC %s: Read CQC Header: %s", self.name, self.currHeader.printable())
-
-            # Check whether we already received all the data
-        if len(self.buf) < self.currHeader.length:
-            # Still waiting for data
-            logging.debug(
-                "CQC %s: Incomplete data. Waiting. Current length %s, " "required length %s",
-                self.name,
-                len(self.buf),
-                self.currHeader.length,
-            )
-            return
+        self._reader.feed(data)
+
+        for header, body in self._reader.messages():
+            self.currHeader = header
+            logging.debug("CQC %s: Read CQC Header: %s", self.name, header.printable())
 
             # We got the header and all the data for this packet. Start processing.
             # Update our app ID
-        self.app_id = self.currHeader.app_id
-        # Invoke the relevant message handler, processing the possibly
-        # remaining data
-        try:
-            self._parseData(self.currHeader, self.buf[0: self.currHeader.length])
-        except Exception as e:
-            print(e)
-            import traceback
-
-            traceback.print_exc()
-
-            # if self.currHeader.tp in self.messageHandlers:
-            # 	self.messageHandlers[self.currHeader.tp](self.currHeader, )
-            # else:
-            # 	self._send_back_cqc(self.currHeader, CQC_ERR_UNSUPP)
-
-            # Reset and await the next packet
-        self.gotCQCHeader = False
-
-        # Check if we received data already for the next packet, if so save it
-        if self.currHeader.length < len(self.buf):
-            self.buf = self.buf[self.currHeader.length: len(self.buf)]
-            self.dataReceived(b"")
-        else:
-            self.buf = None
+            self.app_id = header.app_id
+            # Invoke the relevant message handler, processing the possibly
+            # remaining data
+            try:
+                self._parseData(header, body)
+            except Exception as e:
+                print(e)
+                import traceback
+
+                traceback.print_exc()
+
+        if len(self._reader) > 0:
+            logging.debug("CQC %s: Incomplete data. Waiting. Current length %s", self.name, len(self._reader))
 
     @inlineCallbacks
     def _parseData(self, header, data):
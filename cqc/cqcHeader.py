@@ -114,6 +114,9 @@ CQC_CMD_RELEASE = 23  # Release a qubit
 CQC_OPT_NOTIFY = 0x01  # Send a notification when cmd done
 CQC_OPT_ACTION = 0x02  # On if there are actions to execute when done
 CQC_OPT_BLOCK = 0x04  # Block until command is done
+CQC_OPT_COUNTS = 0x08  # Factory only: return the number of 1-outcomes per measurement instead of every outcome
+CQC_OPT_HISTOGRAM = 0x10  # Factory only: return a histogram of the outcomes per iteration instead of every outcome
+CQC_OPT_PACKED = 0x20  # Factory only: return all outcomes bit-packed in one message instead of a message per outcome
 
 _CMD_TO_STRING = {
     CQC_CMD_I: "I",
@@ -162,6 +165,10 @@ class CQCType(IntEnum):
     NEW_OK = 10  # Created a new qubit
     MIX = 11  # Indicate that the CQC program will contain multiple header types
     IF = 12  # Announce a CQC IF header
+    IF_EXPR = 13  # Announce a CQC IF header with an expression as condition
+    ASSIGN_EXPR = 14  # Announce the assignment of an expression to a reference
+    MEASOUT_SUMMARY = 15  # Aggregated measurement outcomes of a factory
+    MEASOUT_PACKED = 16  # Bit-packed measurement outcomes of a factory
 
     ERR_GENERAL = 20  # General purpose error (no details
     ERR_NOQUBIT = 21  # No more qubits available
@@ -192,6 +199,62 @@ class CQCLogicalOperator(IntEnum):
         return comparison_method[operator](second_operand)
 
 
+class CQCExprOpcode(IntEnum):
+    """
+    Opcodes of the instructions of a classical expression. Expressions are evaluated on a stack:
+    PUSH_VALUE and PUSH_REF push their operand (or the value behind the reference ID), NOT replaces the
+    top of the stack and the binary operators replace the two topmost values by the result.
+    Comparisons and NOT evaluate to 0 or 1.
+    """
+    PUSH_VALUE = 0  # Push the operand
+    PUSH_REF = 1  # Push the value behind the reference ID given as operand
+    NOT = 2  # Logical not
+    AND = 3  # Bitwise and
+    OR = 4  # Bitwise or
+    XOR = 5  # Bitwise exclusive or
+    ADD = 6  # Addition
+    SUB = 7  # Subtraction
+    EQ = 8  # Equal
+    NEQ = 9  # Not equal
+    LT = 10  # Less than
+    LE = 11  # Less than or equal
+    GT = 12  # Greater than
+    GE = 13  # Greater than or equal
+
+    @staticmethod
+    def apply(opcode: 'CQCExprOpcode', first_operand: int, second_operand: int = None) -> int:
+        """Applies the operator given by opcode (not PUSH_VALUE or PUSH_REF) to the operand(s)"""
+        if opcode == CQCExprOpcode.NOT:
+            return int(not first_operand)
+        return _EXPR_BINARY_OPERATORS[opcode](first_operand, second_operand)
+
+
+class CQCAggregateMode(IntEnum):
+    """
+    How the backend returns the measurement outcomes of a factory.
+    The measurements of one iteration are numbered in the order they are performed, these are called slots.
+    """
+    NONE = 0  # Return every outcome
+    COUNTS = 1  # Return, per slot, the number of iterations in which the outcome was 1
+    HISTOGRAM = 2  # Return, per bitstring of outcomes of an iteration, the number of iterations it occurred in
+    PACKED = 3  # Return every outcome, bit-packed in a single message
+
+
+_EXPR_BINARY_OPERATORS = {
+    CQCExprOpcode.AND: lambda a, b: a & b,
+    CQCExprOpcode.OR: lambda a, b: a | b,
+    CQCExprOpcode.XOR: lambda a, b: a ^ b,
+    CQCExprOpcode.ADD: lambda a, b: a + b,
+    CQCExprOpcode.SUB: lambda a, b: a - b,
+    CQCExprOpcode.EQ: lambda a, b: int(a == b),
+    CQCExprOpcode.NEQ: lambda a, b: int(a != b),
+    CQCExprOpcode.LT: lambda a, b: int(a < b),
+    CQCExprOpcode.LE: lambda a, b: int(a <= b),
+    CQCExprOpcode.GT: lambda a, b: int(a > b),
+    CQCExprOpcode.GE: lambda a, b: int(a >= b),
+}
+
+
 class Header(metaclass=abc.ABCMeta):
     """
     Abstact class for headers.
@@ -487,6 +550,124 @@ class CQCIfHeader(Header):
         )
 
 
+class CQCIfExprHeader(Header):
+    """
+        Definition of the CQC IF header with an expression as condition.
+        It is followed by the expression, as expr_length bytes of CQCExprHeaders, and then the body.
+        The body is executed if the expression evaluates to a non-zero value.
+    """
+
+    PACKAGING_FORMAT = "!HI"
+    HDR_LENGTH = struct.calcsize(PACKAGING_FORMAT)
+
+    def _setVals(self, expr_length: int = 0, length: int = 0) -> None:
+        """
+        Set using given values.
+        expr_length is the length of the expression in bytes, and length the length of the body.
+        """
+        self.expr_length = expr_length
+        self.length = length
+
+    def _pack(self) -> bytes:
+        """
+        Pack data into packet format.
+        """
+        return struct.pack(self.PACKAGING_FORMAT, self.expr_length, self.length)
+
+    def _unpack(self, headerBytes) -> None:
+        """
+        Unpack packet data.
+        """
+        unpacked = struct.unpack(self.PACKAGING_FORMAT, headerBytes)
+
+        self.expr_length = unpacked[0]
+        self.length = unpacked[1]
+
+    def _printable(self) -> str:
+        """
+        Produce a printable string for information purposes.
+        """
+        return "CQC IF expression header. Expression_length=" + str(self.expr_length) \
+            + " | Body_length=" + str(self.length)
+
+
+class CQCAssignExprHeader(Header):
+    """
+        Definition of the CQC assign header, which assigns the value of an expression to a reference ID.
+        It is followed by the expression, as expr_length bytes of CQCExprHeaders.
+    """
+
+    PACKAGING_FORMAT = "!IH"
+    HDR_LENGTH = struct.calcsize(PACKAGING_FORMAT)
+
+    def _setVals(self, ref_id: int = 0, expr_length: int = 0) -> None:
+        """
+        Set using given values.
+        """
+        self.ref_id = ref_id
+        self.expr_length = expr_length
+
+    def _pack(self) -> bytes:
+        """
+        Pack data into packet format.
+        """
+        return struct.pack(self.PACKAGING_FORMAT, self.ref_id, self.expr_length)
+
+    def _unpack(self, headerBytes) -> None:
+        """
+        Unpack packet data.
+        """
+        unpacked = struct.unpack(self.PACKAGING_FORMAT, headerBytes)
+
+        self.ref_id = unpacked[0]
+        self.expr_length = unpacked[1]
+
+    def _printable(self) -> str:
+        """
+        Produce a printable string for information purposes.
+        """
+        return "CQC Assign expression header. RefID=" + str(self.ref_id) \
+            + " | Expression_length=" + str(self.expr_length)
+
+
+class CQCExprHeader(Header):
+    """
+        One instruction of a classical expression, see CQCExprOpcode.
+    """
+
+    PACKAGING_FORMAT = "!BI"
+    HDR_LENGTH = struct.calcsize(PACKAGING_FORMAT)
+
+    def _setVals(self, opcode: CQCExprOpcode = 0, operand: int = 0) -> None:
+        """
+        Set using given values.
+        operand is only used by PUSH_VALUE (a value) and PUSH_REF (a reference ID).
+        """
+        self.opcode = opcode
+        self.operand = operand
+
+    def _pack(self) -> bytes:
+        """
+        Pack data into packet format.
+        """
+        return struct.pack(self.PACKAGING_FORMAT, self.opcode, self.operand)
+
+    def _unpack(self, headerBytes) -> None:
+        """
+        Unpack packet data.
+        """
+        unpacked = struct.unpack(self.PACKAGING_FORMAT, headerBytes)
+
+        self.opcode = unpacked[0]
+        self.operand = unpacked[1]
+
+    def _printable(self) -> str:
+        """
+        Produce a printable string for information purposes.
+        """
+        return "CQC expression instruction. Opcode=" + str(self.opcode) + " | Operand=" + str(self.operand)
+
+
 class CQCCmdHeader(Header):
     """
         Header for a command instruction packet.
@@ -870,16 +1051,21 @@ class CQCFactoryHeader(Header):
     PACKAGING_FORMAT = "!BB"
     HDR_LENGTH = struct.calcsize(PACKAGING_FORMAT)
 
-    def _setVals(self, num_iter=0, notify=0, block=0):
+    # Largest number of iterations that fits in a single factory
+    MAX_NUM_ITER = 255
+
+    def _setVals(self, num_iter=0, notify=0, block=0, aggregate=CQCAggregateMode.NONE):
         """
         Set using give values
         :param num_iter: The amount of iterations to this factory
         :param notify: 		True if the factory should send a done message back
         :param block:		True if all commands in this factory should be blocked
+        :param aggregate:	CQCAggregateMode, how the measurement outcomes should be sent back
         """
         self.num_iter = num_iter
         self.notify = notify
         self.block = block
+        self.aggregate = CQCAggregateMode(aggregate)
 
     def _pack(self):
         """
@@ -890,6 +1076,12 @@ class CQCFactoryHeader(Header):
             opt = opt | CQC_OPT_NOTIFY
         if self.block:
             opt = opt | CQC_OPT_BLOCK
+        if self.aggregate == CQCAggregateMode.COUNTS:
+            opt = opt | CQC_OPT_COUNTS
+        elif self.aggregate == CQCAggregateMode.HISTOGRAM:
+            opt = opt | CQC_OPT_HISTOGRAM
+        elif self.aggregate == CQCAggregateMode.PACKED:
+            opt = opt | CQC_OPT_PACKED
 
         factH = struct.pack(self.PACKAGING_FORMAT, self.num_iter, opt)
         return factH
@@ -902,6 +1094,14 @@ class CQCFactoryHeader(Header):
 
         self.notify = fact_hdr[1] & CQC_OPT_NOTIFY
         self.block = fact_hdr[1] & CQC_OPT_BLOCK
+        if fact_hdr[1] & CQC_OPT_COUNTS:
+            self.aggregate = CQCAggregateMode.COUNTS
+        elif fact_hdr[1] & CQC_OPT_HISTOGRAM:
+            self.aggregate = CQCAggregateMode.HISTOGRAM
+        elif fact_hdr[1] & CQC_OPT_PACKED:
+            self.aggregate = CQCAggregateMode.PACKED
+        else:
+            self.aggregate = CQCAggregateMode.NONE
 
         self.num_iter = fact_hdr[0]
 
@@ -911,6 +1111,8 @@ class CQCFactoryHeader(Header):
         """
         toPrint = "Factory Header. "
         toPrint += "Number of iterations: " + str(self.num_iter) + " "
+        if self.aggregate:
+            toPrint += "Aggregate: " + self.aggregate.name + " "
         return toPrint
 
 
@@ -1024,6 +1226,144 @@ class CQCMeasOutHeader(Header):
         return toPrint
 
 
+class CQCMeasSummaryHeader(Header):
+    """
+    Header used to send the aggregated measurement outcomes of a factory (type MEASOUT_SUMMARY).
+    It is followed by `num_entries` CQCMeasCountHeaders.
+    """
+
+    PACKAGING_FORMAT = "!BHII"
+    HDR_LENGTH = struct.calcsize(PACKAGING_FORMAT)
+
+    def _setVals(self, aggregate=CQCAggregateMode.COUNTS, num_slots=0, num_iter=0, num_entries=0):
+        """
+        Set header using given values
+        :param aggregate: CQCAggregateMode that was used
+        :param num_slots: The number of measurements per iteration
+        :param num_iter: The number of iterations that were aggregated
+        :param num_entries: The number of CQCMeasCountHeaders that follow
+        """
+        self.aggregate = CQCAggregateMode(aggregate)
+        self.num_slots = num_slots
+        self.num_iter = num_iter
+        self.num_entries = num_entries
+
+    def _pack(self):
+        """
+        Pack data into packet form.
+        :returns the packed header
+        """
+        return struct.pack(self.PACKAGING_FORMAT, self.aggregate, self.num_slots, self.num_iter, self.num_entries)
+
+    def _unpack(self, headerBytes):
+        """
+        Unpack packet data.
+        :param headerBytes: The unpacked headers.
+        """
+        header = struct.unpack(self.PACKAGING_FORMAT, headerBytes)
+        self.aggregate = CQCAggregateMode(header[0])
+        self.num_slots = header[1]
+        self.num_iter = header[2]
+        self.num_entries = header[3]
+
+    def _printable(self):
+        """
+            Produce a printable string for information purposes.
+        """
+        return "Measurement Summary header. Aggregate: {} | Slots: {} | Iterations: {} | Entries: {}".format(
+            self.aggregate.name, self.num_slots, self.num_iter, self.num_entries
+        )
+
+
+class CQCMeasCountHeader(Header):
+    """
+    Header used to send one entry of aggregated measurement outcomes.
+    For CQCAggregateMode.COUNTS, key is the slot and count the number of iterations where its outcome was 1.
+    For CQCAggregateMode.HISTOGRAM, key is the bitstring of outcomes of an iteration, with the outcome of slot i
+    as bit i, and count the number of iterations where it occurred.
+    """
+
+    PACKAGING_FORMAT = "!QI"
+    HDR_LENGTH = struct.calcsize(PACKAGING_FORMAT)
+
+    # Most measurements per iteration that fit in a key
+    MAX_SLOTS = 64
+
+    def _setVals(self, key=0, count=0):
+        """
+        Set header using given values
+        :param key: The slot or bitstring
+        :param count: The number of occurrences
+        """
+        self.key = key
+        self.count = count
+
+    def _pack(self):
+        """
+        Pack data into packet form.
+        :returns the packed header
+        """
+        return struct.pack(self.PACKAGING_FORMAT, self.key, self.count)
+
+    def _unpack(self, headerBytes):
+        """
+        Unpack packet data.
+        :param headerBytes: The unpacked headers.
+        """
+        self.key, self.count = struct.unpack(self.PACKAGING_FORMAT, headerBytes)
+
+    def _printable(self):
+        """
+            Produce a printable string for information purposes.
+        """
+        return "Measurement Count header. Key: {} | Count: {}".format(self.key, self.count)
+
+
+class CQCPackedMeasOutHeader(Header):
+    """
+    Header used to send all measurement outcomes of a factory (type MEASOUT_PACKED).
+    It is followed by the outcomes in the order they were measured, packed as 8 bits per byte with the first outcome
+    in the most significant bit (as numpy.packbits), padded with zeros to a whole number of bytes.
+    """
+
+    PACKAGING_FORMAT = "!IH"
+    HDR_LENGTH = struct.calcsize(PACKAGING_FORMAT)
+
+    def _setVals(self, num_outcomes=0, num_slots=0):
+        """
+        Set header using given values
+        :param num_outcomes: The total number of outcomes
+        :param num_slots: The number of measurements per iteration
+        """
+        self.num_outcomes = num_outcomes
+        self.num_slots = num_slots
+
+    @property
+    def payload_length(self):
+        """The number of bytes of packed outcomes following this header"""
+        return (self.num_outcomes + 7) // 8
+
+    def _pack(self):
+        """
+        Pack data into packet form.
+        :returns the packed header
+        """
+        return struct.pack(self.PACKAGING_FORMAT, self.num_outcomes, self.num_slots)
+
+    def _unpack(self, headerBytes):
+        """
+        Unpack packet data.
+        :param headerBytes: The unpacked headers.
+        """
+        self.num_outcomes, self.num_slots = struct.unpack(self.PACKAGING_FORMAT, headerBytes)
+
+    def _printable(self):
+        """
+            Produce a printable string for information purposes.
+        """
+        return "Packed Measurement Outcome header. Outcomes: {} | Slots: {}".format(self.num_outcomes, self.num_slots)
+
+
 class CQCTimeinfoHeader(Header):
     """
     Header used to send timing information
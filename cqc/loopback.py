@@ -0,0 +1,501 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+A lightweight CQC backend running in the same process, for tests and benchmarks.
+
+The backend simulates the qubits of a single node with a small state-vector simulator and
+serves CQC connections over real sockets through CQCProtocol. For example:
+
+    with LoopbackBackend() as backend:
+        with CQCConnection("Alice", socket_address=backend.socket_address,
+                           use_classical_communication=False) as cqc:
+            q = qubit(cqc)
+            q.H()
+            m = q.measure()
+
+EPR pairs and sent qubits stay on the same node and can be received by any application
+connected to the backend (using the app ID given as remote app ID).
+"""
+
+import time
+import socket
+import logging
+import threading
+from collections import defaultdict, deque
+
+import numpy as np
+
+from cqc.MessageHandler import CQCMessageHandler
+from cqc.Protocol import CQCProtocol
+from cqc.cqcHeader import (
+    CQCAssignHeader,
+    CQCXtraQubitHeader,
+    CQCMeasOutHeader,
+    CQCTimeinfoHeader,
+    CQCCmdHeader,
+    CQC_TP_NEW_OK,
+    CQC_TP_RECV,
+    CQC_TP_EPR_OK,
+    CQC_TP_MEASOUT,
+    CQC_TP_INF_TIME,
+    CQC_ERR_NOQUBIT,
+    CQC_ERR_UNKNOWN,
+    CQC_ERR_TIMEOUT,
+)
+from cqc.entInfoHeader import EntInfoHeader
+
+_SQRT2 = np.sqrt(2)
+
+GATES = {
+    "I": np.eye(2, dtype=complex),
+    "X": np.array([[0, 1], [1, 0]], dtype=complex),
+    "Y": np.array([[0, -1j], [1j, 0]], dtype=complex),
+    "Z": np.array([[1, 0], [0, -1]], dtype=complex),
+    "T": np.array([[1, 0], [0, np.exp(1j * np.pi / 4)]], dtype=complex),
+    "H": np.array([[1, 1], [1, -1]], dtype=complex) / _SQRT2,
+    # K = (Y + Z) / sqrt(2) maps the computational basis to the Y eigenbasis
+    "K": np.array([[1, -1j], [1j, -1]], dtype=complex) / _SQRT2,
+}
+
+
+def rotation(axis, step):
+    """Rotation around the given axis ('X', 'Y' or 'Z') over step * 2 * pi / 256"""
+    theta = step * 2 * np.pi / 256
+    return np.cos(theta / 2) * GATES["I"] - 1j * np.sin(theta / 2) * GATES[axis]
+
+
+class StateVectorSimulator:
+    """
+    Simulates a number of qubits by their joint state vector.
+    Qubits are referred to by a key which is given when they are created.
+    """
+
+    def __init__(self, max_qubits=16, seed=None):
+        self.max_qubits = max_qubits
+        self._rng = np.random.RandomState(seed)
+        # State with one axis per qubit, the axes are in the order of self._keys
+        self._state = np.ones((), dtype=complex)
+        self._keys = []
+
+    @property
+    def num_qubits(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def new(self, key):
+        """Adds a qubit in the state |0>, returns False if there is no space"""
+        if self.num_qubits >= self.max_qubits:
+            return False
+        self._state = np.multiply.outer(self._state, np.array([1, 0], dtype=complex))
+        self._keys.append(key)
+        return True
+
+    def apply(self, gate, *keys):
+        """Applies a gate (2**n x 2**n matrix) to the qubits with the given keys"""
+        n = len(keys)
+        axes = [self._keys.index(key) for key in keys]
+        gate = gate.reshape((2,) * (2 * n))
+        state = np.tensordot(gate, self._state, axes=(list(range(n, 2 * n)), axes))
+        self._state = np.moveaxis(state, list(range(n)), axes)
+
+    def cnot(self, control, target):
+        gate = np.eye(4, dtype=complex)
+        gate[2:, 2:] = GATES["X"]
+        self.apply(gate, control, target)
+
+    def cphase(self, control, target):
+        self.apply(np.diag([1, 1, 1, -1]).astype(complex), control, target)
+
+    def measure(self, key, inplace=False):
+        """Measures a qubit in the standard basis, and removes it unless inplace"""
+        axis = self._keys.index(key)
+        state = np.moveaxis(self._state, axis, 0)
+        prob_one = np.sum(np.abs(state[1]) ** 2)
+        outcome = int(self._rng.random_sample() < prob_one)
+        collapsed = state[outcome] / np.sqrt(prob_one if outcome else 1 - prob_one)
+        if inplace:
+            state = np.zeros_like(state)
+            state[outcome] = collapsed
+            self._state = np.moveaxis(state, 0, axis)
+        else:
+            self._state = collapsed
+            self._keys.pop(axis)
+        return outcome
+
+    def reset(self, key):
+        if self.measure(key, inplace=True) == 1:
+            self.apply(GATES["X"], key)
+
+    def release(self, key):
+        self.measure(key, inplace=False)
+
+    def state(self, *keys):
+        """Returns the state vector of the given qubits (which should not be entangled with the others)."""
+        axes = [self._keys.index(key) for key in keys]
+        state = np.moveaxis(self._state, axes, list(range(len(keys))))
+        return state.reshape(2 ** len(keys), -1)[:, 0] if self.num_qubits > len(keys) else state.reshape(-1)
+
+
+class _BackendFactory:
+    """The parts of a CQC factory used by CQCProtocol and CQCMessageHandler"""
+
+    def __init__(self, name, backend):
+        self.name = name
+        self.backend = backend
+
+
+class LoopbackMessageHandler(CQCMessageHandler):
+    """Executes CQC commands on a StateVectorSimulator"""
+
+    def __init__(self, name="Loopback", max_qubits=16, seed=None, node_id=0x7f000001, port=0):
+        self.factory = _BackendFactory(name, self)
+        super().__init__(self.factory)
+        self.simulator = StateVectorSimulator(max_qubits=max_qubits, seed=seed)
+        self.node_id = node_id
+        self.port = port
+        self._next_q_id = defaultdict(lambda: 1)
+        self._next_ent_id = 0
+        self._creation_times = {}
+        # Qubits (and their entanglement info) waiting to be received, per app ID
+        self._received_qubits = defaultdict(deque)
+        self._received_epr = defaultdict(deque)
+
+    def _append(self, app_id, tp, *headers, cqc_version=2):
+        body = b''.join(header.pack() for header in headers)
+        msg = self.create_return_message(app_id, tp, length=len(body), cqc_version=cqc_version)
+        self.return_messages[app_id].append(msg + body)
+
+    def _qubit_key(self, cqc_header, qubit_id):
+        key = (cqc_header.app_id, qubit_id)
+        if key not in self.simulator:
+            self._append(cqc_header.app_id, CQC_ERR_UNKNOWN, cqc_version=cqc_header.version)
+            return None
+        return key
+
+    def _new_qubit(self, cqc_header):
+        """Creates a qubit for the app and returns its ID, or None if there is no space"""
+        app_id = cqc_header.app_id
+        q_id = self._next_q_id[app_id]
+        if not self.simulator.new((app_id, q_id)):
+            self._append(app_id, CQC_ERR_NOQUBIT, cqc_version=cqc_header.version)
+            return None
+        self._next_q_id[app_id] += 1
+        self._creation_times[(app_id, q_id)] = int(time.time())
+        return q_id
+
+    def _take_qubit(self, key, app_id):
+        """Moves the qubit with the given key to the given app, and returns the new ID"""
+        new_id = self._next_q_id[app_id]
+        self._next_q_id[app_id] += 1
+        index = self.simulator._keys.index(key)
+        self.simulator._keys[index] = (app_id, new_id)
+        self._creation_times[(app_id, new_id)] = self._creation_times.pop(key, 0)
+        return new_id
+
+    def _single_qubit_gate(self, cqc_header, cmd, gate):
+        key = self._qubit_key(cqc_header, cmd.qubit_id)
+        if key is None:
+            return False
+        self.simulator.apply(gate, key)
+
+    def _two_qubit_gate(self, cqc_header, cmd, xtra, operation):
+        control = self._qubit_key(cqc_header, cmd.qubit_id)
+        if control is None:
+            return False
+        target = self._qubit_key(cqc_header, xtra.qubit_id)
+        if target is None:
+            return False
+        operation(control, target)
+
+    def handle_hello(self, header, data):
+        return True
+
+    def handle_time(self, header, data):
+        cmd = CQCCmdHeader(data[:CQCCmdHeader.HDR_LENGTH])
+        key = self._qubit_key(header, cmd.qubit_id)
+        if key is None:
+            return False
+        time_header = CQCTimeinfoHeader()
+        time_header.setVals(self._creation_times.get(key, 0))
+        self._append(header.app_id, CQC_TP_INF_TIME, time_header, cqc_version=header.version)
+        return False
+
+    def cmd_i(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, GATES["I"])
+
+    def cmd_x(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, GATES["X"])
+
+    def cmd_y(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, GATES["Y"])
+
+    def cmd_z(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, GATES["Z"])
+
+    def cmd_t(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, GATES["T"])
+
+    def cmd_h(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, GATES["H"])
+
+    def cmd_k(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, GATES["K"])
+
+    def cmd_rotx(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, rotation("X", xtra.step))
+
+    def cmd_roty(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, rotation("Y", xtra.step))
+
+    def cmd_rotz(self, cqc_header, cmd, xtra):
+        return self._single_qubit_gate(cqc_header, cmd, rotation("Z", xtra.step))
+
+    def cmd_cnot(self, cqc_header, cmd, xtra):
+        return self._two_qubit_gate(cqc_header, cmd, xtra, self.simulator.cnot)
+
+    def cmd_cphase(self, cqc_header, cmd, xtra):
+        return self._two_qubit_gate(cqc_header, cmd, xtra, self.simulator.cphase)
+
+    def cmd_measure(self, cqc_header, cmd, xtra, inplace=False):
+        key = self._qubit_key(cqc_header, cmd.qubit_id)
+        if key is None:
+            return False
+        outcome = self.simulator.measure(key, inplace=inplace)
+        if isinstance(xtra, CQCAssignHeader):
+            self.references[cqc_header.app_id][xtra.ref_id] = outcome
+        meas_out_header = CQCMeasOutHeader()
+        meas_out_header.setVals(outcome)
+        self._append(cqc_header.app_id, CQC_TP_MEASOUT, meas_out_header, cqc_version=cqc_header.version)
+
+    def cmd_measure_inplace(self, cqc_header, cmd, xtra):
+        return self.cmd_measure(cqc_header, cmd, xtra, inplace=True)
+
+    def cmd_reset(self, cqc_header, cmd, xtra):
+        key = self._qubit_key(cqc_header, cmd.qubit_id)
+        if key is None:
+            return False
+        self.simulator.reset(key)
+
+    def cmd_send(self, cqc_header, cmd, xtra):
+        key = self._qubit_key(cqc_header, cmd.qubit_id)
+        if key is None:
+            return False
+        self._received_qubits[xtra.remote_app_id].append(key)
+
+    def cmd_recv(self, cqc_header, cmd, xtra):
+        queue = self._received_qubits[cqc_header.app_id]
+        if not queue:
+            self._append(cqc_header.app_id, CQC_ERR_TIMEOUT, cqc_version=cqc_header.version)
+            return False
+        q_id = self._take_qubit(queue.popleft(), cqc_header.app_id)
+        self._append_qubit_message(cqc_header, CQC_TP_RECV, q_id)
+
+    def _append_qubit_message(self, cqc_header, tp, q_id, *headers):
+        xtra_qubit_header = CQCXtraQubitHeader()
+        xtra_qubit_header.setVals(q_id)
+        self._append(cqc_header.app_id, tp, xtra_qubit_header, *headers, cqc_version=cqc_header.version)
+
+    def cmd_epr(self, cqc_header, cmd, xtra):
+        app_id = cqc_header.app_id
+        q_id = self._new_qubit(cqc_header)
+        if q_id is None:
+            return False
+        # The other half is first owned by this app, and moved to the remote app when received
+        other_id = self._new_qubit(cqc_header)
+        if other_id is None:
+            self.simulator.release((app_id, q_id))
+            return False
+        self.simulator.apply(GATES["H"], (app_id, q_id))
+        self.simulator.cnot((app_id, q_id), (app_id, other_id))
+
+        ent_info = EntInfoHeader()
+        ent_info.setVals(
+            node_A=self.node_id, port_A=self.port, app_id_A=app_id,
+            node_B=xtra.remote_node, port_B=xtra.remote_port, app_id_B=xtra.remote_app_id,
+            id_AB=self._next_ent_id, timestamp=int(time.time()), ToG=0, goodness=1, DF=0,
+        )
+        self._next_ent_id += 1
+        remote_ent_info = EntInfoHeader(ent_info.pack())
+        remote_ent_info.switch_nodes()
+        self._received_epr[xtra.remote_app_id].append(((app_id, other_id), remote_ent_info))
+
+        self._append_qubit_message(cqc_header, CQC_TP_EPR_OK, q_id, ent_info)
+
+    def cmd_epr_recv(self, cqc_header, cmd, xtra):
+        queue = self._received_epr[cqc_header.app_id]
+        if not queue:
+            self._append(cqc_header.app_id, CQC_ERR_TIMEOUT, cqc_version=cqc_header.version)
+            return False
+        key, ent_info = queue.popleft()
+        q_id = self._take_qubit(key, cqc_header.app_id)
+        self._append_qubit_message(cqc_header, CQC_TP_EPR_OK, q_id, ent_info)
+
+    def cmd_new(self, cqc_header, cmd, xtra, return_q_id=False):
+        q_id = self._new_qubit(cqc_header)
+        if q_id is None:
+            return False
+        if return_q_id:
+            return q_id
+        self._append_qubit_message(cqc_header, CQC_TP_NEW_OK, q_id)
+
+    def cmd_allocate(self, cqc_header, cmd, xtra):
+        for _ in range(cmd.qubit_id):
+            if self.cmd_new(cqc_header, cmd, xtra) is False:
+                return False
+
+    def cmd_release(self, cqc_header, cmd, xtra):
+        key = self._qubit_key(cqc_header, cmd.qubit_id)
+        if key is None:
+            return False
+        self.simulator.release(key)
+        self._creation_times.pop(key, None)
+
+
+class _SocketTransport:
+    """The transport used by CQCProtocol, writing to a socket"""
+
+    def __init__(self, sock):
+        self._socket = sock
+
+    def write(self, data):
+        self._socket.sendall(data)
+
+
+class LoopbackBackend:
+    """
+    Serves CQC connections from a background thread, executing the commands with a LoopbackMessageHandler.
+    """
+
+    def __init__(self, name="Loopback", max_qubits=16, seed=None, host="127.0.0.1", port=0):
+        """
+        - **Arguments**
+
+            :name:          Name of the node
+            :max_qubits:    Maximum number of qubits that can be alive at the same time
+            :seed:          Seed for the measurement outcomes
+            :host:          Host to listen on
+            :port:          Port to listen on, 0 picks a free port
+        """
+        self.name = name
+        self.host = host
+        self.port = port
+        self.message_handler = LoopbackMessageHandler(name=name, max_qubits=max_qubits, seed=seed)
+        self.factory = self.message_handler.factory
+        # CQC messages from different connections are handled one at a time
+        self._lock = threading.Lock()
+        self._server_socket = None
+        self._threads = []
+        self._connections = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def socket_address(self):
+        """(host, port) to pass as socket_address to CQCConnection"""
+        return self.host, self.port
+
+    def start(self):
+        """Starts listening for connections in a background thread."""
+        self._server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_socket.bind((self.host, self.port))
+        self._server_socket.listen()
+        self.port = self._server_socket.getsockname()[1]
+        self._start_thread(self._accept_loop)
+
+    def stop(self):
+        """Stops accepting connections and closes the open ones."""
+        if self._server_socket is not None:
+            try:
+                self._server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server_socket.close()
+            self._server_socket = None
+        for conn in self._connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=1)
+        self._connections = []
+        self._threads = []
+
+    def socketpair(self):
+        """Serves one end of a new socket pair and returns the other end."""
+        client, server = socket.socketpair()
+        self.serve_socket(server)
+        return client
+
+    def serve_socket(self, sock):
+        """Serves CQC on the given connected socket in a background thread."""
+        self._connections.append(sock)
+        self._start_thread(self._serve, sock)
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._server_socket.accept()
+            except (OSError, AttributeError):
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.serve_socket(conn)
+
+    def _serve(self, sock):
+        protocol = CQCProtocol(self.factory)
+        protocol.transport = _SocketTransport(sock)
+        while True:
+            try:
+                data = sock.recv(1 << 16)
+            except OSError:
+                return
+            if not data:
+                return
+            with self._lock:
+                try:
+                    protocol.dataReceived(data)
+                except OSError as err:
+                    logging.debug("Loopback %s: connection lost: %s", self.name, err)
+                    return
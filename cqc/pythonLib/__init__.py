@@ -1,14 +1,19 @@
 from .cqc_handler import CQCHandler
 from .cqc_connection import CQCConnection
-from .cqc_mix import CQCMix, CQCVariable, CQCMixConnection, mix_qubit
+from .cqc_mix import CQCMix, CQCMixProgram, CQCVariable, CQCExpression, CQCMixConnection, mix_qubit
 from .cqc_to_file import CQCToFile
 from .qubit import qubit
+from .qubit_register import QubitRegister
+from .peephole import PeepholeOptimizer, PeepholeStats
+from .scheduler import GateScheduler
+from .profiler import CQCProfiler
 from .util import (
     ProgressBar,
     CQCGeneralError,
     CQCNoQubitError,
     CQCUnsuppError,
     CQCTimeoutError,
+    CQCCancelledError,
     CQCInuseError,
     CQCUnknownError,
     QubitNotActiveError,
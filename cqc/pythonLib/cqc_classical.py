@@ -0,0 +1,525 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import json
+import time
+import errno
+import socket
+import struct
+import logging
+import selectors
+from collections import defaultdict, deque
+
+import numpy as np
+
+from .util import CQCCancelledError
+
+# Every classical message is sent as a frame: a header with the type and length of the payload, then the payload
+_FRAME_HEADER = struct.Struct("!BI")
+FRAME_MSG = 0
+FRAME_HELLO = 1
+# A bulk frame carries json metadata (dtype, shape and nbytes), and is followed by nbytes of raw data
+FRAME_BULK = 2
+
+BULK_CHUNK_SIZE = 1 << 20
+
+
+class _BulkTransfer:
+    """
+    Bulk data being received on a socket, the socket is not read by the selector until the data is consumed
+    by recv_array or buffered because a message following it is waited for.
+    """
+
+    def __init__(self, sock, meta, prefix):
+        self.sock = sock
+        self.dtype = meta["dtype"]
+        self.shape = meta["shape"]
+        self.nbytes = meta["nbytes"]
+        # Bytes following the bulk frame which were already received
+        self.prefix = prefix
+        # The data, once it is read from the socket before recv_array is called
+        self.data = None
+
+
+class CQCClassicalChannels:
+    """
+    Persistent classical channels between applications in the application network.
+
+    Connections are opened once per peer and kept open. The first frame on a new connection carries the name
+    of the sender, so that the receiving side can queue messages per sender and reuse the same connection
+    to send messages back. Incoming connections and data are handled by a selector, so waiting for a message
+    does not involve any polling.
+    """
+
+    def __init__(self, name, app_net, conn_retry_time=0.1):
+        """
+        - **Arguments**
+
+            :name:              Name of this host in the application network.
+            :app_net:           The application network config (with a hostDict of addresses).
+            :conn_retry_time:   How many seconds to wait between each connection retry.
+        """
+        self.name = name
+        self._app_net = app_net
+        self._conn_retry_time = conn_retry_time
+
+        self._selector = selectors.DefaultSelector()
+        self._server = None
+
+        # Writing to this socket pair wakes up a waiting thread, to cancel the wait
+        self._wake_recv, self._wake_send = socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._wake_send.setblocking(False)
+        self._selector.register(self._wake_recv, selectors.EVENT_READ)
+
+        # Socket to use for sending to each peer, by name
+        self._peers = {}
+        # Per socket: the name of the peer (None until its hello frame is received) and the received bytes
+        self._names = {}
+        self._buffers = {}
+
+        # Received messages per sender, and the order in which senders sent them
+        self._queues = defaultdict(deque)
+        self._arrivals = deque()
+
+        # Bulk transfers per sender, and the order in which senders started them
+        self._bulk = defaultdict(deque)
+        self._bulk_arrivals = deque()
+
+    def _get_addr(self, name):
+        if name in self._app_net.hostDict:
+            return self._app_net.hostDict[name].addr
+        raise ValueError("Host name '{}' is not in the cqc network".format(name))
+
+    @property
+    def server_started(self):
+        return self._server is not None
+
+    def start_server(self):
+        """Starts listening for connections from other hosts, if not already listening."""
+        if self._server is not None:
+            return
+        logging.debug("App {}: Starting classical server".format(self.name))
+        addr = self._get_addr(self.name)
+        s = socket.socket(addr[0], addr[1], addr[2])
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(addr[4])
+        s.listen()
+        s.setblocking(False)
+        self._selector.register(s, selectors.EVENT_READ)
+        self._server = s
+        logging.debug("App {}: Classical server started".format(self.name))
+
+    def close_server(self):
+        """Stops listening and closes the connections opened by other hosts."""
+        if self._server is None:
+            return
+        logging.debug("App {}: Closing classical server".format(self.name))
+        self._selector.unregister(self._server)
+        self._server.close()
+        self._server = None
+        for s in [s for s in self._names if s not in self._peers.values()]:
+            self._drop(s)
+        logging.debug("App {}: Classical server closed".format(self.name))
+
+    def open(self, name, timeout=None):
+        """
+        Opens a connection to another host, if there is not one already.
+
+        - **Arguments**
+
+            :name:      Name of the host to connect to.
+            :timeout:   Seconds to keep trying to connect while the host is not listening, None tries forever.
+        """
+        if name in self._peers:
+            return
+        logging.debug("App {}: Opening classical channel to {}".format(self.name, name))
+        addr = self._get_addr(name)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            s = socket.socket(addr[0], addr[1], addr[2])
+            err = self._connect(s, addr[4], deadline)
+            if err == 0:
+                break
+            s.close()
+            if err == errno.ETIMEDOUT:
+                raise RuntimeError("Timeout: Could not open classical channel to {}".format(name))
+            if err != errno.ECONNREFUSED:
+                raise OSError(err, "Could not open classical channel to {}: {}".format(name, os.strerror(err)))
+            logging.debug("App {}: Could not open classical channel to {}, trying again..".format(self.name, name))
+            retry_time = self._conn_retry_time
+            if deadline is not None:
+                retry_time = min(retry_time, deadline - time.monotonic())
+                if retry_time <= 0:
+                    raise RuntimeError("Timeout: Could not open classical channel to {}".format(name))
+            self._wait_for(None, retry_time)
+        s.setblocking(True)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._add_socket(s, name)
+        self._peers[name] = s
+        self._send_frame(s, FRAME_HELLO, self.name.encode("utf-8"))
+        logging.debug("App {}: Classical channel to {} opened".format(self.name, name))
+
+    def _connect(self, s, addr, deadline):
+        """Connects without blocking past the deadline, returns the errno (0 on success)"""
+        s.setblocking(False)
+        err = s.connect_ex(addr)
+        if err in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not self._wait_for(s, timeout):
+                return errno.ETIMEDOUT
+            err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        return err
+
+    def _wait_for(self, s, timeout):
+        """
+        Waits until the socket s (if not None) is writable, returns False on timeout.
+        Raises CQCCancelledError if cancel is called meanwhile.
+        """
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._wake_recv, selectors.EVENT_READ)
+            if s is not None:
+                selector.register(s, selectors.EVENT_WRITE)
+            for key, _ in selector.select(timeout):
+                if key.fileobj is self._wake_recv:
+                    self._cancelled()
+                return True
+        return False
+
+    def cancel(self):
+        """
+        Cancels waiting for a message or connection, which raises a CQCCancelledError in the waiting thread.
+        Can be called from any thread. If nothing is waiting, the next wait is cancelled.
+        """
+        try:
+            self._wake_send.send(b"\0")
+        except BlockingIOError:
+            # A cancel is already pending
+            pass
+
+    def _cancelled(self):
+        try:
+            while self._wake_recv.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+        raise CQCCancelledError("Waiting for classical communication was cancelled")
+
+    def close_channel(self, name):
+        """Closes the connection to another host, if there is one."""
+        if name in self._peers:
+            logging.debug("App {}: Closing classical channel to {}".format(self.name, name))
+            self._drop(self._peers[name])
+            logging.debug("App {}: Classical channel to {} closed".format(self.name, name))
+
+    def close(self):
+        """Closes the server and all connections."""
+        self.close_server()
+        for s in list(self._names):
+            self._drop(s)
+        self._selector.close()
+        self._wake_recv.close()
+        self._wake_send.close()
+
+    def send(self, name, payload):
+        """Sends a message to another host, opening a connection if needed."""
+        # Handle pending events first, so that connections closed by the peer are noticed
+        self._process_events(0, cancellable=False)
+        self.open(name)
+        try:
+            self._send_frame(self._peers[name], FRAME_MSG, payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The peer closed the connection since we last used it, open a new one
+            logging.debug("App {}: Classical channel to {} was closed, reopening".format(self.name, name))
+            self.close_channel(name)
+            self.open(name)
+            self._send_frame(self._peers[name], FRAME_MSG, payload)
+
+    def recv(self, name=None, timeout=None):
+        """
+        Receives a message, from a specific host if name is given, otherwise from any host.
+
+        - **Arguments**
+
+            :name:      Name of the host to receive from, or None for any host.
+            :timeout:   Seconds to wait for a message, None waits forever.
+        """
+        if name is None:
+            return self._recv_first(None, timeout)[1]
+        return self._recv_first([name], timeout)[1]
+
+    def recv_any(self, names, timeout=None):
+        """
+        Receives the first message which arrives from any of the given hosts.
+
+        - **Arguments**
+
+            :names:     Names of the hosts to receive from.
+            :timeout:   Seconds to wait for a message, None waits forever.
+
+        Returns a tuple (name, message).
+        """
+        return self._recv_first(set(names), timeout)
+
+    def _recv_first(self, names, timeout):
+        """Receives the first message from one of names, or from any host if names is None"""
+        self.start_server()
+
+        def first_sender():
+            for sender in self._arrivals:
+                if names is None or sender in names:
+                    return sender
+            return None
+
+        def received():
+            if first_sender() is not None:
+                return True
+            # Messages sent after bulk data can only be read once the bulk data is read
+            self._buffer_bulk(names, deadline)
+            return first_sender() is not None
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._wait(received, timeout)
+        name = first_sender()
+        self._arrivals.remove(name)
+        logging.debug("App {}: Received classical message from {}".format(self.name, name))
+        return name, self._queues[name].popleft()
+
+    def send_array(self, name, data, chunk_size=BULK_CHUNK_SIZE):
+        """
+        Sends a numpy array or a bytes-like object to another host.
+
+        The data is sent in chunks directly from the memory of the array. Sending blocks when the receiver
+        does not keep up, so two hosts should not send large arrays to each other at the same time.
+        """
+        if isinstance(data, np.ndarray):
+            data = np.ascontiguousarray(data)
+            meta = {"dtype": data.dtype.str, "shape": list(data.shape)}
+        else:
+            meta = {"dtype": None, "shape": None}
+        view = memoryview(data).cast("B")
+        meta["nbytes"] = view.nbytes
+
+        self._process_events(0, cancellable=False)
+        self.open(name)
+        s = self._peers[name]
+        self._send_frame(s, FRAME_BULK, json.dumps(meta).encode("utf-8"))
+        for start in range(0, view.nbytes, chunk_size):
+            s.sendall(view[start:start + chunk_size])
+        logging.debug("App {}: Sent {} bytes of bulk data to {}".format(self.name, view.nbytes, name))
+
+    def recv_array(self, name=None, out=None, timeout=None):
+        """
+        Receives data sent by send_array, from a specific host if name is given, otherwise from any host.
+
+        - **Arguments**
+
+            :name:      Name of the host to receive from, or None for any host.
+            :out:       Optional preallocated writable buffer (for example a numpy array) to receive the data in.
+            :timeout:   Seconds to wait for the data, None waits forever.
+
+        Returns a numpy array (or a bytearray if bytes were sent), or out if it is given.
+        The data is received directly into the result, unless a message sent after it was received first.
+        """
+        self.start_server()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if name is None:
+            self._wait(lambda: len(self._bulk_arrivals) > 0, timeout)
+            name = self._bulk_arrivals[0]
+        else:
+            self._wait(lambda: len(self._bulk[name]) > 0, timeout)
+        transfer = self._bulk[name][0]
+        if out is not None and memoryview(out).nbytes < transfer.nbytes:
+            raise ValueError(
+                "Buffer of {} bytes too small for {} bytes of data".format(memoryview(out).nbytes, transfer.nbytes)
+            )
+        self._bulk[name].popleft()
+        self._bulk_arrivals.remove(name)
+
+        if out is None:
+            if transfer.dtype is None:
+                result = bytearray(transfer.nbytes)
+            else:
+                result = np.empty(transfer.shape, dtype=transfer.dtype)
+        else:
+            result = out
+        view = memoryview(result).cast("B")
+
+        if transfer.data is not None:
+            view[:transfer.nbytes] = transfer.data
+        else:
+            self._read_bulk(transfer, view, deadline)
+        logging.debug("App {}: Received {} bytes of bulk data from {}".format(self.name, transfer.nbytes, name))
+        return result
+
+    def _buffer_bulk(self, names, deadline):
+        """Reads the bulk data from names (or from any host if None) which recv_array did not receive yet"""
+        for name in list(self._bulk):
+            if names is not None and name not in names:
+                continue
+            for transfer in list(self._bulk[name]):
+                if transfer.data is None:
+                    data = bytearray(transfer.nbytes)
+                    try:
+                        self._read_bulk(transfer, memoryview(data), deadline)
+                    except Exception:
+                        # The connection is dropped, so the data can never be received
+                        self._bulk[name].remove(transfer)
+                        self._bulk_arrivals.remove(name)
+                        raise
+                    transfer.data = data
+                    logging.debug("App {}: Buffered {} bytes of bulk data from {}".format(
+                        self.name, transfer.nbytes, name))
+
+    def _read_bulk(self, transfer, view, deadline):
+        """Reads the bulk data of a transfer into view, and continues reading the socket after it"""
+        s = transfer.sock
+        received = min(len(transfer.prefix), transfer.nbytes)
+        view[:received] = transfer.prefix[:received]
+        try:
+            while received < transfer.nbytes:
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RuntimeError("Timeout: Bulk data not received")
+                    s.settimeout(remaining)
+                try:
+                    n = s.recv_into(view[received:transfer.nbytes])
+                except socket.timeout:
+                    raise RuntimeError("Timeout: Bulk data not received")
+                if n == 0:
+                    raise ConnectionError("Connection closed during bulk transfer from {}".format(
+                        self._names.get(s)))
+                received += n
+        except Exception:
+            self._drop(s)
+            raise
+        s.settimeout(None)
+
+        # Continue reading the socket, starting with what was received after the bulk data
+        self._buffers[s] += transfer.prefix[transfer.nbytes:]
+        self._selector.register(s, selectors.EVENT_READ)
+        self._parse(s)
+
+    def _wait(self, condition, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not condition():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise RuntimeError("Timeout: No message received")
+            self._process_events(remaining)
+
+    def _process_events(self, timeout, cancellable=True):
+        for key, _ in self._selector.select(timeout):
+            if key.fileobj is self._wake_recv:
+                if cancellable:
+                    self._cancelled()
+            elif key.fileobj is self._server:
+                self._accept()
+            else:
+                self._read(key.fileobj)
+
+    def _accept(self):
+        try:
+            s, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        s.setblocking(True)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._add_socket(s, None)
+
+    def _add_socket(self, s, name):
+        self._names[s] = name
+        self._buffers[s] = bytearray()
+        self._selector.register(s, selectors.EVENT_READ)
+
+    def _drop(self, s):
+        name = self._names.pop(s, None)
+        self._buffers.pop(s, None)
+        if self._peers.get(name) is s:
+            del self._peers[name]
+        try:
+            self._selector.unregister(s)
+        except (KeyError, ValueError):
+            pass
+        s.close()
+
+    def _read(self, s):
+        try:
+            data = s.recv(1 << 16)
+        except ConnectionResetError:
+            data = b''
+        if not data:
+            self._drop(s)
+            return
+        self._buffers[s] += data
+        self._parse(s)
+
+    def _parse(self, s):
+        """Handles the complete frames received on a socket"""
+        buf = self._buffers[s]
+        pos = 0
+        while len(buf) - pos >= _FRAME_HEADER.size:
+            tp, length = _FRAME_HEADER.unpack_from(buf, pos)
+            end = pos + _FRAME_HEADER.size + length
+            if len(buf) < end:
+                break
+            payload = bytes(buf[pos + _FRAME_HEADER.size:end])
+            pos = end
+            if tp == FRAME_BULK:
+                # Stop reading this socket until the bulk data is received by recv_array
+                self._start_bulk(s, payload, bytes(buf[pos:]))
+                pos = len(buf)
+                break
+            self._handle_frame(s, tp, payload)
+        del buf[:pos]
+
+    def _start_bulk(self, s, payload, prefix):
+        name = self._names[s]
+        self._selector.unregister(s)
+        self._bulk[name].append(_BulkTransfer(s, json.loads(payload.decode("utf-8")), prefix))
+        self._bulk_arrivals.append(name)
+
+    def _handle_frame(self, s, tp, payload):
+        if tp == FRAME_HELLO:
+            name = payload.decode("utf-8")
+            self._names[s] = name
+            # Messages to this peer can be sent back over the same connection
+            self._peers.setdefault(name, s)
+        elif tp == FRAME_MSG:
+            name = self._names[s]
+            self._queues[name].append(payload)
+            self._arrivals.append(name)
+        else:
+            logging.warning("App {}: Unknown classical frame type {}".format(self.name, tp))
+
+    @staticmethod
+    def _send_frame(s, tp, payload):
+        s.sendall(_FRAME_HEADER.pack(tp, len(payload)) + payload)
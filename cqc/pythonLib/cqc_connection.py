@@ -30,24 +30,16 @@
 import time
 import socket
 import logging
+from contextlib import contextmanager
 
-from cqc.cqcHeader import (
-    CQC_TP_NEW_OK,
-    CQC_TP_RECV,
-    CQC_TP_EPR_OK,
-    CQC_TP_MEASOUT,
-    CQC_TP_EXPIRE,
-    CQC_TP_INF_TIME,
-    Header,
-    CQCHeader,
-    CQCMeasOutHeader,
-    CQCTimeinfoHeader,
-    CQCXtraQubitHeader,
-)
-from cqc.entInfoHeader import EntInfoHeader
+import numpy as np
+
+from cqc.cqcHeader import CQC_TP_NEW_OK, CQCType
 from cqc.hostConfig import cqc_node_id_from_addrinfo
+from cqc.util import CQCMessageReader, parse_reply
 from .cqc_handler import CQCHandler
-from .util import CQCUnsuppError
+from .cqc_classical import CQCClassicalChannels
+from .util import CQCUnsuppError, CQCGeneralError, CQCTimeoutError
 from .qubit import qubit
 
 try:
@@ -64,7 +56,8 @@ class CQCConnection(CQCHandler):
     """Handler to be used when sending commands over a socket."""
     def __init__(self, name, socket_address=None, appID=None, pend_messages=False,
                  retry_connection=True, conn_retry_time=0.1, log_level=None, backend=None,
-                 use_classical_communication=True, network_name=None):
+                 use_classical_communication=True, network_name=None, auto_batch=False,
+                 optimize=False, schedule=False, timeout=None):
         """
         Initialize a connection to the cqc server.
 
@@ -92,12 +85,24 @@ class CQCConnection(CQCHandler):
                 Whether to use the built-in classical communication or not.
             :param network_name: None or str
                 Used if simulaqron is used to load socket addresses for the backend
+            :param auto_batch: bool
+                Whether to batch consecutive commands which need no reply, see CQCHandler.put_command.
+            :param optimize: bool
+                Whether to optimize pending sequences of commands before sending them, see PeepholeOptimizer.
+            :param schedule: bool
+                Whether to reorder pending sequences of commands to group independent commands, see GateScheduler.
+            :param timeout: float or None
+                Maximum number of seconds to wait for a reply from the backend, None waits forever.
+                A CQCTimeoutError is raised on timeout, see readMessage.
         """
 
         super().__init__(
             name=name,
             app_id=appID,
             pend_messages=pend_messages,
+            auto_batch=auto_batch,
+            optimize=optimize,
+            schedule=schedule,
         )
 
         self._setup_logging(log_level)
@@ -106,13 +111,13 @@ class CQCConnection(CQCHandler):
         self._conn_retry_time = conn_retry_time
 
         # Buffer received data
-        self.buf = None
-
-        # ClassicalServer
-        self._classicalServer = None
+        self._reader = CQCMessageReader()
 
-        # Classical connections in the application network
-        self._classicalConn = {}
+        # Maximum time to wait for a reply and the deadline of the current call (see deadline), if any
+        self.timeout = timeout
+        self._deadline = None
+        # Set when a reply did not arrive in time, later replies can then not be matched to their request anymore
+        self._out_of_sync = False
 
         # Get network configuraton and addresses
         addr, cqc_net, app_net = self._setup_network_data(
@@ -124,6 +129,11 @@ class CQCConnection(CQCHandler):
         self._cqcNet = cqc_net
         self._appNet = app_net
 
+        # Classical channels in the application network
+        self._classical = None
+        if app_net is not None:
+            self._classical = CQCClassicalChannels(self.name, app_net, conn_retry_time=self._conn_retry_time)
+
         # Open a socket to the backend
         self._s = None
         cqc_socket = self._setup_socket(addr=addr, retry_connection=retry_connection)
@@ -227,15 +237,17 @@ class CQCConnection(CQCHandler):
         Flushes remaining headers, releases all qubits, closes the 
         connections, and removes the app ID from the used app IDs.
         """
-        super().close()
+        if self._out_of_sync:
+            # Releasing the qubits would mix up the replies, the backend cleans up when the socket is closed
+            self._pop_app_id()
+        else:
+            super().close()
 
         if self._s is not None:
             self._s.close()
 
-        self.closeClassicalServer()
-
-        for name in list(self._classicalConn):
-            self.closeClassicalChannel(name)
+        if self._classical is not None:
+            self._classical.close()
 
     def new_qubitID(self, print_cqc=False):
         """Provide new qubit ID.
@@ -252,95 +264,79 @@ class CQCConnection(CQCHandler):
 
         return otherHdr.qubit_id
 
-    def startClassicalServer(self):
-        """Sets up a server for the application communication, 
-        if not already set up.
-        """
-        if self._appNet is None:
+    def _get_classical_channels(self):
+        if self._classical is None:
             raise ValueError(
                 "Since use_classical_communication was set to False upon init, the built-in classical communication"
                 "cannot be used."
             )
+        return self._classical
 
-        if not self._classicalServer:
-            logging.debug("App {}: Starting classical server".format(self.name))
-            # Get host data
-            myHost = self._appNet.hostDict[self.name]
-            hostaddr = myHost.addr
-
-            # Setup server
-            s = socket.socket(hostaddr[0], hostaddr[1], hostaddr[2])
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind(hostaddr[4])
-            s.listen(1)
-            (conn, addr) = s.accept()
-            logging.debug("App {}: Classical server started".format(self.name))
-            self._classicalServer = conn
+    def startClassicalServer(self):
+        """Sets up a server for the application communication,
+        if not already set up.
+        """
+        self._get_classical_channels().start_server()
 
     def closeClassicalServer(self):
         """Closes classical server."""
+        if self._classical is not None:
+            self._classical.close_server()
+
+    def recvClassical(self, timout=None, msg_size=None, close_after=False, name=None):
+        """
+        Receive classical message.
+
+        Messages are framed, so a complete message is returned as sent by sendClassical.
+
+        - **Arguments**
+
+            :timout:        Seconds to wait for a message, None waits forever. A RuntimeError is raised on timeout.
+            :msg_size:      Not used anymore, the size of the message is given by the sender.
+            :close_after:   Whether to close the classical server after receiving.
+            :name:          Only receive a message from this host, by default a message from any host is received.
+        """
+        self.flush_batch()
+        classical = self._get_classical_channels()
+        logging.debug("App {}: Trying to receive classical message".format(self.name))
+        msg = classical.recv(name=name, timeout=timout)
+        if close_after:
+            self.closeClassicalServer()
+        return msg
+
+    def recv_any(self, names, timeout=None):
+        """
+        Receive the first classical message which arrives from any of the given hosts.
+
+        - **Arguments**
+
+            :names:         The names of the hosts in the application network.
+            :timeout:       Seconds to wait for a message, None waits forever. A RuntimeError is raised on timeout.
+
+        Returns a tuple (name, message).
+        """
+        self.flush_batch()
+        return self._get_classical_channels().recv_any(names, timeout=timeout)
+
+    def cancel_classical(self):
+        """
+        Cancels waiting for a classical message or connection, for example from another thread.
+        The waiting call raises a CQCCancelledError.
+        """
+        self._get_classical_channels().cancel()
 
-        if self._classicalServer:
-            logging.debug("App {}: Closing classical server".format(self.name))
-            self._classicalServer.close()
-            logging.debug("App {}: Classical server closed".format(self.name))
-            self._classicalServer = None
-
-    def recvClassical(self, timout=1, msg_size=1024, close_after=True):
-        """Receive classical message."""
-
-        if not self._classicalServer:
-            self.startClassicalServer()
-        for _ in range(10 * timout):
-            logging.debug("App {}: Trying to receive classical message".format(self.name))
-            msg = self._classicalServer.recv(msg_size)
-            if len(msg) > 0:
-                logging.debug("App {}: Received classical message".format(self.name))
-                if close_after:
-                    self.closeClassicalServer()
-                return msg
-            time.sleep(0.1)
-        raise RuntimeError("Timeout: No message received")
-
-    def openClassicalChannel(self, name):
+    def openClassicalChannel(self, name, timeout=None):
         """
         Opens a classical connection to another host in the application network.
+        The connection stays open until closeClassicalChannel or close is called.
 
         - **Arguments**
 
             :name:        The name of the host in the application network.
-            :timout:    The time to try to connect to the server. When timout is reached an RuntimeError is raised.
+            :timeout:     Seconds to keep trying while the host is not listening, None tries forever.
+                          A RuntimeError is raised on timeout.
         """
-        if self._appNet is None:
-            raise ValueError(
-                "Since use_classical_communication was set to False upon init, the built-in classical communication"
-                "cannot be used."
-            )
-        if name not in self._classicalConn:
-            logging.debug("App {}: Opening classical channel to {}".format(self.name, name))
-            if name in self._appNet.hostDict:
-                remoteHost = self._appNet.hostDict[name]
-            else:
-                raise ValueError("Host name '{}' is not in the cqc network".format(name))
-
-            addr = remoteHost.addr
-            while True:
-                try:
-                    s = socket.socket(addr[0], addr[1], addr[2])
-                    s.connect(addr[4])
-                    logging.debug("App {}: Classical channel to {} opened".format(self.name, name))
-                    break
-                except ConnectionRefusedError:
-                    logging.debug(
-                        "App {}: Could not open classical channel to {}, trying again..".format(self.name, name)
-                    )
-                    time.sleep(self._conn_retry_time)
-                except Exception as e:
-                    logging.warning(
-                        "App {} : Critical error when connection to app node {}: {}".format(self.name, name, e)
-                    )
-                    break
-            self._classicalConn[name] = s
+        self._get_classical_channels().open(name, timeout=timeout)
 
     def closeClassicalChannel(self, name):
         """
@@ -350,34 +346,60 @@ class CQCConnection(CQCHandler):
 
             :name:        The name of the host in the application network.
         """
-        if name in self._classicalConn:
-            logging.debug("App {}: Closing classical channel to {}".format(self.name, name))
-            s = self._classicalConn.pop(name)
-            s.close()
-            logging.debug("App {}: Classical channel to {} closed".format(self.name, name))
+        if self._classical is not None:
+            self._classical.close_channel(name)
 
-    def sendClassical(self, name, msg, close_after=True):
+    def sendClassical(self, name, msg, close_after=False):
         """
         Sends a classical message to another host in the application network.
+        The connection is opened if needed and kept open for later messages.
 
         - **Arguments**
 
             :name:        The name of the host in the application network.
             :msg:        The message to send. Should be either a int in range(0,256) or a list of such ints.
-            :timout:    The time to try to connect to the server. When timout is reached an RuntimeError is raised.
+            :close_after:   Whether to close the connection after sending.
         """
-        if name not in self._classicalConn:
-            self.openClassicalChannel(name)
+        self.flush_batch()
+        classical = self._get_classical_channels()
         try:
             to_send = bytes([int(msg)])
         except (TypeError, ValueError):
             to_send = bytes(msg)
         logging.debug("App {}: Sending classical message {} to {}".format(self.name, to_send, name))
-        self._classicalConn[name].send(to_send)
+        classical.send(name, to_send)
         logging.debug("App {}: Classical message {} to {} sent".format(self.name, to_send, name))
         if close_after:
             self.closeClassicalChannel(name)
 
+    def send_array(self, name, data):
+        """
+        Sends a numpy array or a bytes-like object to another host in the application network.
+        The data is streamed in chunks, so it can be much larger than a classical message.
+
+        - **Arguments**
+
+            :name:        The name of the host in the application network.
+            :data:        The numpy array or bytes-like object to send.
+        """
+        self.flush_batch()
+        self._get_classical_channels().send_array(name, data)
+
+    def recv_array(self, name=None, out=None, timeout=None):
+        """
+        Receives a numpy array or bytes sent by send_array.
+
+        - **Arguments**
+
+            :name:        Only receive from this host, by default data from any host is received.
+            :out:         Optional preallocated writable buffer, for example a numpy array, to receive the data in.
+            :timeout:     Seconds to wait for the data, None waits forever.
+
+        Returns a numpy array (or a bytearray if bytes were sent), or out if it is given.
+        """
+        self.flush_batch()
+        return self._get_classical_channels().recv_array(name=name, out=out, timeout=timeout)
+
     def _handle_create_qubits(self, num_qubits, notify):
         qubits = []
         for _ in range(num_qubits):
@@ -395,95 +417,75 @@ class CQCConnection(CQCHandler):
 
         return qubits
 
-    def readMessage(self, maxsize=192):  # WHAT IS GOOD SIZE?
+    @contextmanager
+    def deadline(self, timeout):
+        """
+        Context manager bounding the time spent waiting for replies from the backend within the block.
+        All replies have to be read within timeout seconds from entering the block, otherwise a CQCTimeoutError
+        is raised. A deadline nested inside another one can only shorten it. A timeout of None sets no deadline.
+
+        After a CQCTimeoutError the replies of the backend can no longer be matched to the requests, so the
+        connection can only be closed.
+        """
+        outer_deadline = self._deadline
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+            if outer_deadline is None or deadline < outer_deadline:
+                self._deadline = deadline
+        try:
+            yield
+        finally:
+            self._deadline = outer_deadline
+
+    def readMessage(self, maxsize=4096):
         """Receive the whole message from cqc server.
 
         Returns (CQCHeader,None,None), (CQCHeader,CQCNotifyHeader,None) 
         or (CQCHeader,CQCNotifyHeader,EntInfoHeader) depending on the 
         type of message.
 
-        Maxsize is the max size of message.
+        Maxsize is the max number of bytes to receive at once.
+
+        Raises CQCTimeoutError if the message does not arrive within self.timeout seconds, or before the
+        deadline of the current call (see deadline).
         """
+        if self._out_of_sync:
+            raise CQCGeneralError("A reply from the backend timed out before, the connection can only be closed")
 
-        # Initialize checks
-        gotCQCHeader = False
-        if self.buf:
-            checkedBuf = False
-        else:
-            checkedBuf = True
+        deadline = self._deadline
+        if self.timeout is not None:
+            read_deadline = time.monotonic() + self.timeout
+            if deadline is None or read_deadline < deadline:
+                deadline = read_deadline
 
-        while True:
-            # If buf does not contain enough data, read in more
-            if checkedBuf:
-                # Receive data
+        try:
+            while True:
+                message = self._reader.next_message()
+                if message is not None:
+                    break
+                # Not a complete message in the buffer yet, read in more
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise socket.timeout()
+                    self._s.settimeout(remaining)
                 data = self._s.recv(maxsize)
+                if not data:
+                    raise CQCGeneralError("Connection to the CQC backend was closed")
+                self._reader.feed(data)
+        except socket.timeout:
+            self._out_of_sync = True
+            raise CQCTimeoutError("App {}: No reply from the backend in time".format(self.name))
+        finally:
+            if deadline is not None:
+                self._s.settimeout(None)
 
-                # Read whatever we received into a buffer
-                if self.buf:
-                    self.buf += data
-                else:
-                    self.buf = data
-
-                    # If we don't have the CQC header yet, try and read it in full.
-            if not gotCQCHeader:
-                if len(self.buf) < CQCHeader.HDR_LENGTH:
-                    # Not enough data for CQC header, return and wait for the rest
-                    checkedBuf = True
-                    continue
-
-                    # Got enough data for the CQC Header so read it in
-                gotCQCHeader = True
-                rawHeader = self.buf[0:CQCHeader.HDR_LENGTH]
-                currHeader = CQCHeader(rawHeader)
-
-                # Remove the header from the buffer
-                self.buf = self.buf[CQCHeader.HDR_LENGTH : len(self.buf)]
-
-                # Check for error
-                self.check_error(currHeader)
-
-                # Check whether we already received all the data
-            if len(self.buf) < currHeader.length:
-                # Still waiting for data
-                checkedBuf = True
-                continue
-            else:
-                break
-                # We got all the data, read other headers if there is any
-        if currHeader.length == 0:
-            return currHeader, None, None
-        else:
-            if currHeader.tp == CQC_TP_INF_TIME:
-                timeinfo_header = self._extract_header(CQCTimeinfoHeader)
-                return currHeader, timeinfo_header, None
-            elif currHeader.tp == CQC_TP_MEASOUT:
-                measout_header = self._extract_header(CQCMeasOutHeader)
-                return currHeader, measout_header, None
-            elif currHeader.tp in [CQC_TP_RECV, CQC_TP_NEW_OK, CQC_TP_EXPIRE]:
-                xtra_qubit_header = self._extract_header(CQCXtraQubitHeader)
-                return currHeader, xtra_qubit_header, None
-            elif currHeader.tp == CQC_TP_EPR_OK:
-                xtra_qubit_header = self._extract_header(CQCXtraQubitHeader)
-                ent_info_hdr = self._extract_header(EntInfoHeader)
-                return currHeader, xtra_qubit_header, ent_info_hdr
-
-    def _extract_header(self, header_class):
-        """
-        Extracts the given header class from the first part of the current buffer.
-        :param header_class: Subclassed from `cqc.backend.cqcHeader.Header`
-        :return: An instance of the class
-        """
-        if not issubclass(header_class, Header):
-            raise ValueError("header_class {} is not a subclass of Header".format(header_class))
+        header, body = message
 
-        try:
-            rawHeader = self.buf[:header_class.HDR_LENGTH]
-        except IndexError:
-            raise ValueError("Got a header message of unexpected size")
-        self.buf = self.buf[header_class.HDR_LENGTH: len(self.buf)]
-        header = header_class(rawHeader)
+        # Check for error
+        self.check_error(header)
 
-        return header
+        return parse_reply(header, body)
 
     def sendQubit(self, q, name, remote_appID=0, notify=True, block=True, remote_socket=None):
         """Sends qubit to another node in the cqc network. 
@@ -508,7 +510,7 @@ class CQCConnection(CQCHandler):
             remote_socket=remote_socket,
         )
 
-    def createEPR(self, name, remote_appID=0, notify=True, block=True, remote_socket=None):
+    def createEPR(self, name, remote_appID=0, notify=True, block=True, remote_socket=None, timeout=None):
         """Creates epr with other host in cqc network.
 
         - **Arguments**
@@ -518,14 +520,40 @@ class CQCConnection(CQCHandler):
             :nofify:     Do we wish to be notified when done.
             :block:         Do we want the qubit to be blocked
             :remote_socket: tuple (str, int) of ip and port number. Needed if no cqcFile was specified
+            :timeout:       Seconds to wait for the pair, None waits forever. A CQCTimeoutError is raised on timeout.
         """
-        return super().createEPR(
-            name,
-            remote_appID=remote_appID,
-            notify=notify,
-            block=block,
-            remote_socket=remote_socket,
-        )
+        with self.deadline(timeout):
+            return super().createEPR(
+                name,
+                remote_appID=remote_appID,
+                notify=notify,
+                block=block,
+                remote_socket=remote_socket,
+            )
+
+    def recvEPR(self, notify=True, block=True, timeout=None):
+        """Receives a qubit from an EPR-pair generated with another node.
+
+        - **Arguments**
+
+            :nofify:     Do we wish to be notified when done.
+            :block:         Do we want the qubit to be blocked
+            :timeout:       Seconds to wait for the pair, None waits forever. A CQCTimeoutError is raised on timeout.
+        """
+        with self.deadline(timeout):
+            return super().recvEPR(notify=notify, block=block)
+
+    def recvQubit(self, notify=True, block=True, timeout=None):
+        """Receives a qubit.
+
+        - **Arguments**
+
+            :nofify:     Do we wish to be notified when done.
+            :block:         Do we want the qubit to be blocked
+            :timeout:       Seconds to wait for the qubit, None waits forever. A CQCTimeoutError is raised on timeout.
+        """
+        with self.deadline(timeout):
+            return super().recvQubit(notify=notify, block=block)
 
     def _handle_epr_response(self, notify):
         # Get RECV message
@@ -540,31 +568,59 @@ class CQCConnection(CQCHandler):
             message = self.readMessage()
             self.print_CQC_msg(message)
 
-        # initialize the qubit
-        q = qubit(self, createNew=False)
-
-        q._set_entanglement_info(entInfoHdr)
-        q._qID = q_id
-        # Activate and return qubit
-        q._set_active(True)
-        return q
+        # initialize and activate the qubit
+        return qubit._from_backend(self, q_id, entInfoHdr)
 
     def _handle_factory_response(self, num_iter, response_amount, should_notify=False):
         """Handles the responses from a factory command and returns a list of results"""
-        res = []
+        return list(self._iter_factory_response(num_iter, response_amount, should_notify=should_notify))
+
+    def _iter_factory_response(self, num_iter, response_amount, should_notify=False):
+        """Handles the responses from a factory command and yields the results as they are read"""
         for _ in range(num_iter):
             for _ in range(response_amount):
                 message = self.readMessage()
                 self.check_error(message[0])
                 # TODO handle new qubit!
-                res.append(self.parse_CQC_msg(message))
+                yield self.parse_CQC_msg(message)
                 self.print_CQC_msg(message)
 
         if should_notify:
             message = self.readMessage()
             self.check_error(message[0])
 
-        return res
+    def _read_measurement_summary(self, num_iter, aggregate, num_slots, should_notify=False):
+        """Handles the response from a factory with aggregated outcomes and returns a list of CQCMeasCountHeaders"""
+        message = self.readMessage()
+        self.print_CQC_msg(message)
+        if message[0].tp != CQCType.MEASOUT_SUMMARY:
+            raise CQCGeneralError("Expected aggregated measurement outcomes, got a message of type {}".format(
+                message[0].tp))
+
+        if should_notify:
+            done_message = self.readMessage()
+            self.check_error(done_message[0])
+
+        return message[2]
+
+    def _read_packed_outcomes(self, num_iter, num_slots, should_notify=False):
+        """Reads the packed outcomes of a factory and returns them as an array of shape (num_iter, num_slots)"""
+        message = self.readMessage()
+        self.print_CQC_msg(message)
+        if message[0].tp != CQCType.MEASOUT_PACKED:
+            raise CQCGeneralError("Expected packed measurement outcomes, got a message of type {}".format(
+                message[0].tp))
+        packed_header, payload = message[1], message[2]
+        if packed_header.num_outcomes != num_iter * num_slots:
+            raise CQCGeneralError("Expected {} measurement outcomes, got {}".format(
+                num_iter * num_slots, packed_header.num_outcomes))
+
+        if should_notify:
+            done_message = self.readMessage()
+            self.check_error(done_message[0])
+
+        outcomes = np.unpackbits(np.frombuffer(payload, dtype=np.uint8), count=packed_header.num_outcomes)
+        return outcomes.reshape(num_iter, num_slots)
 
     def return_meas_outcome(self):
         """Return measurement outcome."""
@@ -29,10 +29,14 @@
 
 import abc
 import math
+import time
 import logging
 import warnings
 from typing import Any, List
-from itertools import count
+from itertools import count, chain, islice, repeat
+from collections import defaultdict, deque
+
+import numpy as np
 
 from cqc.cqcHeader import (
     CQC_VERSION,
@@ -64,6 +68,7 @@ from cqc.cqcHeader import (
     CQC_CMD_RECV,
     CQC_CMD_EPR_RECV,
     CQC_CMD_ALLOCATE,
+    CQC_CMD_RELEASE,
     CQC_TP_FACTORY,
     Header,
     CQCHeader,
@@ -74,7 +79,9 @@ from cqc.cqcHeader import (
     CQCRotationHeader,
     CQCXtraQubitHeader,
     CQCCommunicationHeader,
+    CQCMeasCountHeader,
     CQCType,
+    CQCAggregateMode,
 )
 from .util import (
     CQCUnsuppError,
@@ -85,6 +92,9 @@ from .util import (
     ProgressBar,
 )
 from .qubit import qubit
+from .peephole import PeepholeOptimizer
+from .scheduler import GateScheduler
+from .profiler import CQCProfiler
 
 
 class CQCHandler(abc.ABC):
@@ -96,13 +106,20 @@ class CQCHandler(abc.ABC):
 
     _appIDs = {}
 
-    def __init__(self, name, app_id=None, pend_messages=False, notify=True):
+    # Thresholds for auto_batch: batched commands are sent when there are this many,
+    # or when a command is put while the first batched command is older than this (in seconds)
+    auto_batch_max_commands = 256
+    auto_batch_max_age = 0.01
+
+    def __init__(self, name, app_id=None, pend_messages=False, notify=True, auto_batch=False, optimize=False,
+                 schedule=False):
 
         self.name = name
 
         # This flag is used to check if CQCConnection is opened using a 'with' statement.
         # Otherwise an deprecation warning is printed when instantiating qubits.
         self._opened_with_with = False
+        self._logged_with_info = False
 
         # Set an app ID
         self._appID = self._get_new_app_id(app_id)
@@ -110,17 +127,36 @@ class CQCHandler(abc.ABC):
         # This is a sort of global notify
         self.notify = notify
 
-        # All qubits active for this connection
-        self.active_qubits = []
+        # All qubits active for this connection, by qubit ID
+        self._active_qubits = {}
 
         # List of pended header objects waiting to be sent to the backend
         self._pending_headers = []  # ONLY cqc.cqcHeader.Header objects should be in this list
+        # Total length in bytes of the pended headers
+        self._pending_length = 0
+        # Cache of type headers, see _type_header
+        self._type_headers = {}
+
+        # If True, commands which need no reply are batched by put_command and sent together
+        # when a reply is needed, a threshold is hit or the connection is closed
+        self.auto_batch = auto_batch
+        self._batch = []
+        self._batch_commands = 0
+        self._batch_notify = False
+        self._batch_start = None
+
+        # If set, pending sequences, CQCMix programs and batches are optimized before they are sent
+        self.optimizer = PeepholeOptimizer() if optimize else None
+
+        # If set, pending sequences are reordered to group independent commands before they are sent
+        self.scheduler = GateScheduler() if schedule else None
 
         # Bool that indicates whether we are in a factory and thus should pend commands
         self.pend_messages = pend_messages
 
         # Keep track of pending messages
         self._pending_headers = []
+        self._pending_length = 0
 
     @property
     def pend_messages(self):
@@ -133,6 +169,11 @@ class CQCHandler(abc.ABC):
     def __str__(self):
         return "CQC handler for node '{}'".format(self.name)
 
+    @property
+    def active_qubits(self):
+        """List of the qubits which are active for this connection."""
+        return list(self._active_qubits.values())
+
     def _get_new_app_id(self, app_id):
         """Finds a new app ID if not specific"""
         name = self.name
@@ -197,6 +238,20 @@ class CQCHandler(abc.ABC):
         """Handles the responses from a factory command and returns a list of results"""
         pass
 
+    def _iter_factory_response(self, num_iter, response_amount, should_notify=False):
+        """Handles the responses from a factory command and yields the results as they are read"""
+        yield from self._handle_factory_response(num_iter, response_amount, should_notify=should_notify)
+
+    @abc.abstractmethod
+    def _read_measurement_summary(self, num_iter, aggregate, num_slots, should_notify=False):
+        """Handles the response from a factory with aggregated outcomes and returns a list of CQCMeasCountHeaders"""
+        pass
+
+    @abc.abstractmethod
+    def _read_packed_outcomes(self, num_iter, num_slots, should_notify=False):
+        """Reads the packed outcomes of a factory and returns them as an array of shape (num_iter, num_slots)"""
+        pass
+
     @abc.abstractmethod
     def get_remote_from_directory_or_address(self, name, **kwargs):
         """Returns the remote address of a given node"""
@@ -235,16 +290,54 @@ class CQCHandler(abc.ABC):
 
     def commit_headers(self, headers):
         """Packs a list of headers and commits the message"""
+        self.flush_batch()
         msg = b''
         for header in headers:
             msg += header.pack()
         self.commit(msg)
 
+    def _add_to_batch(self, headers):
+        """Adds a command (without its CQC header) to the batch, and sends the batch if a threshold is hit"""
+        if self._batch_commands == 0:
+            self._batch_start = time.monotonic()
+        self._batch.extend(headers[1:])
+        self._batch_commands += 1
+        self._batch_notify = self._batch_notify or headers[1].notify
+        if (self._batch_commands >= self.auto_batch_max_commands
+                or time.monotonic() - self._batch_start >= self.auto_batch_max_age):
+            self.flush_batch()
+
+    def flush_batch(self):
+        """Sends the commands batched by auto_batch as one message, and waits for the notification."""
+        if self._batch_commands == 0:
+            return
+        headers = self._batch
+        should_notify = self._batch_notify
+        self._batch = []
+        self._batch_commands = 0
+        self._batch_notify = False
+
+        if self.optimizer is not None:
+            headers = self.optimizer.optimize(headers)
+            if not headers:
+                return
+
+        hdr = CQCHeader()
+        hdr.setVals(CQC_VERSION, CQC_TP_COMMAND, self._appID, sum(header.HDR_LENGTH for header in headers))
+        logging.debug("App {} sends {} batched headers".format(self.name, len(headers)))
+        self.commit(b''.join(header.pack() for header in [hdr] + headers))
+
+        if should_notify:
+            message = self.readMessage()
+            self._assert_done_message(message)
+            self.print_CQC_msg(message)
+
     def put_command(self, qID, command, read_notify=True, **kwargs):
         """Puts a new command to be executed.
 
-        If self.pend_messages is set to True, the messages are kept until flushing,
-        otherwise they are commited directly.
+        If self.pend_messages is set to True, the messages are kept until flushing.
+        Otherwise, if self.auto_batch is set to True and the command needs no reply, it is
+        batched with the following commands, see flush_batch. Otherwise it is commited directly.
 
         Parameters
         ----------
@@ -257,19 +350,26 @@ class CQCHandler(abc.ABC):
             elsewhere (e.g. createEPR)
         """
         headers = self.construct_command_headers(qID=qID, command=command, **kwargs)
-        str_of_headers = "".join(["\t{}\n".format(header) for header in headers])
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            str_of_headers = "".join(["\t{}\n".format(header) for header in headers])
+        else:
+            str_of_headers = None
         if self.pend_messages:
             headers = self._update_headers_before_pending(headers)
-            logging.debug("App {} pends a command with headers:\n{}".format(
-                self.name,
-                str_of_headers,
-            ))
+            if str_of_headers is not None:
+                logging.debug("App {} pends a command with headers:\n{}".format(
+                    self.name,
+                    str_of_headers,
+                ))
             self.pend_headers(headers)
+        elif self.auto_batch and read_notify and not self.shouldReturn(command):
+            self._add_to_batch(headers)
         else:
-            logging.debug("App {} sends a command with headers:\n{}".format(
-                self.name,
-                str_of_headers,
-            ))
+            if str_of_headers is not None:
+                logging.debug("App {} sends a command with headers:\n{}".format(
+                    self.name,
+                    str_of_headers,
+                ))
             self.commit_headers(headers)
             if read_notify:
                 notify = kwargs.get("notify", True)
@@ -295,6 +395,12 @@ class CQCHandler(abc.ABC):
     
     def pend_header(self, header: Header) -> None:
         self._pending_headers.append(header)
+        self._pending_length += header.HDR_LENGTH
+
+    def _set_pending_headers(self, headers):
+        """Replaces the list of pending headers, e.g. by an optimized one"""
+        self._pending_headers = headers
+        self._pending_length = sum(header.HDR_LENGTH for header in headers)
 
     def construct_command(self, qID, command, **kwargs):
         """Construct a commmand and packs it in it's binary form.
@@ -385,6 +491,7 @@ class CQCHandler(abc.ABC):
 
     def sendSimple(self, tp):
         """Construct and commit simple message."""
+        self.flush_batch()
         msg = self.construct_simple(tp)
         self.commit(msg)
 
@@ -392,10 +499,10 @@ class CQCHandler(abc.ABC):
         """Handle exiting of context."""
 
         if release_qubits:
-            for q in list(self.active_qubits):
-                q.release()
+            self.release_qubits(self.active_qubits)
 
         # Flush all remaining commands and the releases
+        self.flush_batch()
         self.flush()
 
         self._pop_app_id()
@@ -432,6 +539,47 @@ class CQCHandler(abc.ABC):
 
         return qubits
 
+    def release_qubits(self, qubits, notify=True, block=True):
+        """Releases the given qubits.
+
+        All RELEASE commands are sent as one sequence, so the backend only sends a
+        single notification for all of them.
+
+        :param qubits: The qubits to release
+        :param notify: Do we wish to be notified when done
+        :param block: Do we want the qubits to be blocked
+        """
+        qubits = list(qubits)
+        if len(qubits) == 0:
+            return
+
+        notify = self.notify and notify
+
+        for q in qubits:
+            q._set_active(False)
+
+        if self.pend_messages:
+            for q in qubits:
+                self.put_command(qID=q._qID, command=CQC_CMD_RELEASE, notify=notify, block=block)
+            return
+
+        # Only the last command asks for a notification, since the backend sends one for the whole sequence
+        headers = []
+        for i, q in enumerate(qubits):
+            cmd_hdr = CQCCmdHeader()
+            cmd_hdr.setVals(q._qID, CQC_CMD_RELEASE, notify and i == len(qubits) - 1, block, 0)
+            headers.append(cmd_hdr)
+
+        hdr = CQCHeader()
+        hdr.setVals(CQC_VERSION, CQC_TP_COMMAND, self._appID, len(headers) * CQCCmdHeader.HDR_LENGTH)
+        logging.debug("App {} releases {} qubits".format(self.name, len(qubits)))
+        self.commit_headers([hdr] + headers)
+
+        if notify:
+            message = self.readMessage()
+            self._assert_done_message(message)
+            self.print_CQC_msg(message)
+
     def sendGetTime(self, qID, notify=1, block=1, action=0):
         """Sends get-time message
 
@@ -443,6 +591,8 @@ class CQCHandler(abc.ABC):
             :block:         Do we want the qubit to be blocked
             :action:     Are there more commands to be executed
         """
+        self.flush_batch()
+
         # Send Header
         hdr = CQCHeader()
         hdr.setVals(CQC_VERSION, CQC_TP_GET_TIME, self._appID, CQCCmdHeader.HDR_LENGTH)
@@ -575,12 +725,8 @@ class CQCHandler(abc.ABC):
             # Get qubit id
             q_id = self.new_qubitID(print_cqc=True)
 
-            # initialize the qubit
-            q = qubit(self, createNew=False)
-            q._qID = q_id
-
-            # Activate and return qubit
-            q._set_active(True)
+            # initialize and activate the qubit
+            q = qubit._from_backend(self, q_id)
 
             # Read the notify message
             if notify:
@@ -598,12 +744,31 @@ class CQCHandler(abc.ABC):
         """
         return self.flush_factory(1, do_sequence)
 
-    def flush_factory(self, num_iter, do_sequence=False, block_factory=False):
+    def flush_factory(self, num_iter, do_sequence=False, block_factory=False, aggregate=None, stream=False):
         """
         Flushes the current pending sequence in a factory. It is performed multiple times
         :param num_iter: The amount of times the current pending sequence is performed
-        :return: A list of outcomes/qubits that are produced by the commands
+        :param aggregate: None, 'counts', 'histogram' or 'packed' (or a CQCAggregateMode).
+            If given, the backend sends back the measurement outcomes in a single message instead of one message
+            per outcome. The sequence can then only return measurement outcomes, and num_iter may exceed 255.
+            With 'counts' a list with the number of 1-outcomes of every measurement in the sequence is returned,
+            with 'histogram' a dict from the tuple of outcomes of an iteration to the number of occurrences and
+            with 'packed' a numpy array of shape (num_iter, number of measurements) with all outcomes.
+        :param stream: If True, a generator is returned which yields the outcomes/qubits as they are read, or with
+            aggregate='packed' the arrays of outcomes of at most 255 iterations at a time. The sequence is sent in
+            factories of at most 255 iterations, and the next factory is only sent when the results of the
+            previous one are being read, so the results of at most two factories are buffered.
+            The connection should not be used for anything else until the generator is exhausted or closed.
+        :return: A list of outcomes/qubits that are produced by the commands, or the aggregated outcomes
         """
+        aggregate = self._aggregate_mode(aggregate)
+        self.flush_batch()
+
+        if self.optimizer is not None:
+            self._set_pending_headers(self.optimizer.optimize(self._pending_headers))
+        if self.scheduler is not None:
+            self._set_pending_headers(self.scheduler.schedule(self._pending_headers))
+
         if len(self._pending_headers) == 0:
             return []
 
@@ -612,6 +777,7 @@ class CQCHandler(abc.ABC):
 
         # Store how many of the headers we send will get a response message from the backend
         response_amount = 0
+        num_measurements = 0
 
         # Loop over the pending_headers to determine the total length and set should_notify
         for header in self._pending_headers:
@@ -624,6 +790,33 @@ class CQCHandler(abc.ABC):
                 # Remember this header if we expect a return messge
                 if self.shouldReturn(header.instr):
                     response_amount += 1
+                if header.instr in (CQC_CMD_MEASURE, CQC_CMD_MEASURE_INPLACE):
+                    num_measurements += 1
+
+        if aggregate:
+            if response_amount != num_measurements:
+                raise ValueError("An aggregated factory can only return measurement outcomes")
+            if aggregate == CQCAggregateMode.HISTOGRAM and num_measurements > CQCMeasCountHeader.MAX_SLOTS:
+                raise ValueError(
+                    "A histogram can be made of at most {} measurements".format(CQCMeasCountHeader.MAX_SLOTS)
+                )
+            if stream and aggregate != CQCAggregateMode.PACKED:
+                raise ValueError("Only packed outcomes can be streamed")
+
+        if aggregate or stream or num_iter > CQCFactoryHeader.MAX_NUM_ITER:
+            messages = self._factory_messages(num_iter, should_notify, block_factory, aggregate)
+            if aggregate in (CQCAggregateMode.COUNTS, CQCAggregateMode.HISTOGRAM):
+                return self._read_aggregated_factories(messages, aggregate, num_measurements, should_notify)
+            results = self._stream_factory(messages, aggregate, response_amount, num_measurements, should_notify)
+            if stream:
+                return results
+            if aggregate == CQCAggregateMode.PACKED:
+                chunks = list(results)
+                if not chunks:
+                    # No iterations, so there is nothing to concatenate
+                    return np.zeros((0, num_measurements), dtype=np.uint8)
+                return np.concatenate(chunks)
+            return list(results)
 
         # Determine the CQC Header type
         if num_iter == 1:
@@ -635,6 +828,7 @@ class CQCHandler(abc.ABC):
             factory_header.setVals(num_iter, should_notify, block_factory)
             # Insert the factory header at the front
             self._pending_headers.insert(0, factory_header)
+            self._pending_length += factory_header.HDR_LENGTH
             
         # Insert the cqc header
         self.insert_cqc_header(cqc_type)
@@ -651,6 +845,118 @@ class CQCHandler(abc.ABC):
         # Return information that the backend returned
         return res
 
+    @staticmethod
+    def _aggregate_mode(aggregate):
+        """Converts the aggregate argument of flush_factory to a CQCAggregateMode"""
+        if aggregate is None:
+            return CQCAggregateMode.NONE
+        if isinstance(aggregate, str):
+            try:
+                return CQCAggregateMode[aggregate.upper()]
+            except KeyError:
+                raise ValueError("Unknown aggregate mode '{}', use 'counts', 'histogram' or 'packed'".format(aggregate))
+        return CQCAggregateMode(aggregate)
+
+    def _factory_messages(self, num_iter, should_notify, block_factory, aggregate):
+        """
+        Packs the pending sequence in factories of at most CQCFactoryHeader.MAX_NUM_ITER iterations, num_iter
+        iterations in total, and resets the pending headers.
+        Returns an iterator of (number of iterations, message) for all factories.
+        """
+        full_factories, rest = divmod(num_iter, CQCFactoryHeader.MAX_NUM_ITER)
+
+        factory_header = CQCFactoryHeader()
+        factory_header.setVals(0, should_notify, block_factory, aggregate)
+        self._pending_headers.insert(0, factory_header)
+        self._pending_length += factory_header.HDR_LENGTH
+        self.insert_cqc_header(CQC_TP_FACTORY)
+
+        messages = {}
+        for chunk in (CQCFactoryHeader.MAX_NUM_ITER, rest):
+            factory_header.setVals(chunk, should_notify, block_factory, aggregate)
+            messages[chunk] = b''.join([header.pack() for header in self._pending_headers])
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("App {} sends {} factories with the following headers:\n{}".format(
+                self.name,
+                full_factories + (rest > 0),
+                "\n".join("\t{}".format(header) for header in self._pending_headers),
+            ))
+        self.reset_pending_headers()
+
+        chunks = repeat((CQCFactoryHeader.MAX_NUM_ITER, messages[CQCFactoryHeader.MAX_NUM_ITER]), full_factories)
+        if rest:
+            return chain(chunks, [(rest, messages[rest])])
+        return chunks
+
+    def _read_aggregated_factories(self, messages, aggregate, num_slots, should_notify):
+        """Sends the factories with aggregated measurement outcomes one by one and returns the combined outcomes."""
+        aggregated = defaultdict(int)
+        for chunk, message in messages:
+            self.commit(message)
+            for count_header in self._read_measurement_summary(chunk, aggregate, num_slots, should_notify):
+                aggregated[count_header.key] += count_header.count
+
+        if aggregate == CQCAggregateMode.COUNTS:
+            return [aggregated[slot] for slot in range(num_slots)]
+        return {
+            tuple((key >> slot) & 1 for slot in range(num_slots)): occurrences
+            for key, occurrences in sorted(aggregated.items())
+        }
+
+    def _stream_factory(self, messages, aggregate, response_amount, num_slots, should_notify):
+        """
+        Generator sending the factories and yielding their results as they are read.
+        The next factory is sent before the results of the current one are read, so that the backend can continue
+        while the results are consumed, but no more than two factories are outstanding.
+        If the generator is closed early, or an error is raised, the replies of the factories that are already sent
+        are read and dropped. If that is not possible, the connection is marked as out of sync.
+        """
+        outstanding = deque()
+
+        def send_next():
+            for chunk, message in islice(messages, 1):
+                self.commit(message)
+                outstanding.append(chunk)
+
+        def chunk_results(chunk):
+            if aggregate == CQCAggregateMode.PACKED:
+                yield self._read_packed_outcomes(chunk, num_slots, should_notify)
+            else:
+                yield from self._iter_factory_response(chunk, response_amount, should_notify=should_notify)
+
+        def drain_outstanding():
+            for chunk in outstanding:
+                try:
+                    deque(chunk_results(chunk), maxlen=0)
+                except CQCGeneralError:
+                    # An error from the backend ends the reply of its factory
+                    pass
+
+        current = None
+        send_next()
+        try:
+            while outstanding:
+                send_next()
+                current = chunk_results(outstanding.popleft())
+                for result in current:
+                    yield result
+                current = None
+        except GeneratorExit:
+            # Read the remaining replies, so that the connection can be used again
+            if current is not None:
+                deque(current, maxlen=0)
+            drain_outstanding()
+            raise
+        except CQCGeneralError:
+            # An error from the backend ends the reply of the current factory, so only the replies of the
+            # factories sent after it are left
+            drain_outstanding()
+            raise
+        except BaseException:
+            # The reply of the current factory is only partly read, so later replies cannot be matched anymore
+            self._out_of_sync = True
+            raise
+
     def send_pending_headers(self) -> List[Any]:
         """
         Sends all pending headers.
@@ -658,17 +964,17 @@ class CQCHandler(abc.ABC):
         """
 
         # Send all pending headers
-        to_log = "App {} sends a message with the following headers:\n".format(self.name)
-        msg = b''
-        for header in self._pending_headers:
-            to_log += "\t{}\n".format(header)
-            msg += header.pack()
-        logging.debug(to_log[:-1])
-        self.commit(msg)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("App {} sends a message with the following headers:\n{}".format(
+                self.name,
+                "\n".join("\t{}".format(header) for header in self._pending_headers),
+            ))
+        self.commit(b''.join([header.pack() for header in self._pending_headers]))
 
     def reset_pending_headers(self):
         """Sets the list of pending headers to empty """
         self._pending_headers = []
+        self._pending_length = 0
 
     def set_pending(self, pend_messages):
         """Set the pend_messages flag.
@@ -677,6 +983,8 @@ class CQCHandler(abc.ABC):
         If false, all commands are directly send to the back_end
         :param pend_messages: Boolean to indicate if messages should pend or not
         """
+        self.flush_batch()
+
         # Check if the list is not empty, give a warning if it isn't
         if self._pending_headers:
             logging.warning("List of pending headers is not empty, flushing them")
@@ -689,25 +997,46 @@ class CQCHandler(abc.ABC):
         Invoke this method *after* all other headers are pended, so that the correct message length is calculated.
         """
 
-        # Count the total message length
-        message_length = 0
-        for header in self._pending_headers:
-            message_length += header.HDR_LENGTH
-
         # Build the CQC Header
         cqc_header = CQCHeader()
-        cqc_header.setVals(CQC_VERSION, cqc_type, self._appID, message_length)
+        cqc_header.setVals(CQC_VERSION, cqc_type, self._appID, self._pending_length)
 
         # Insert CQC Header at the front
         self._pending_headers.insert(0, cqc_header)
+        self._pending_length += cqc_header.HDR_LENGTH
+
+    def _type_header(self, cqc_type: CQCType, length: int) -> CQCTypeHeader:
+        """
+        Returns a CQCTypeHeader with the given type and length.
+        These are cached and shared, so the returned header should never be modified.
+        """
+        header = self._type_headers.get((cqc_type, length))
+        if header is None:
+            header = CQCTypeHeader()
+            header.setVals(cqc_type, length)
+            self._type_headers[(cqc_type, length)] = header
+        return header
 
     def _pend_type_header(self, cqc_type: CQCType, length: int) -> None:
         """
-        Creates a CQCTypeHeader and pends it.
+        Pends a CQCTypeHeader.
         """
-        header = CQCTypeHeader()
-        header.setVals(cqc_type, length)
-        self.pend_header(header)
+        self.pend_header(self._type_header(cqc_type, length))
+
+    def profile(self, rtt=None):
+        """
+        Returns a CQCProfiler attributing the time spent in this connection to the phases of the protocol.
+        Use it as a context manager, for example::
+
+            with cqc.profile() as p:
+                ...
+            print(p.summary())
+            p.write_collapsed("cqc.folded")
+
+        :param rtt: Round-trip time of the network to the backend in seconds, if known. The time waiting for
+            replies is then split in network and backend time.
+        """
+        return CQCProfiler(self, rtt=rtt)
 
     def tomography(self, preparation, iterations, progress=True):
         """
@@ -832,6 +1161,12 @@ class CQCHandler(abc.ABC):
             logging.debug("CQC tells App {}: 'Measurement outcome is {}'".format(self.name, otherHdr.outcome))
         elif hdr.tp == CQC_TP_INF_TIME:
             logging.debug("CQC tells App {}: 'Timestamp is {}'".format(self.name, otherHdr.datetime))
+        elif hdr.tp == CQCType.MEASOUT_PACKED:
+            logging.debug("CQC tells App {}: '{} packed outcomes'".format(self.name, otherHdr.num_outcomes))
+        elif hdr.tp == CQCType.MEASOUT_SUMMARY:
+            logging.debug(
+                "CQC tells App {}: 'Aggregated outcomes of {} iterations'".format(self.name, otherHdr.num_iter)
+            )
 
     def parse_CQC_msg(self, message, q=None, is_factory=False):
         """
@@ -856,9 +1191,9 @@ class CQCHandler(abc.ABC):
         if hdr.tp in {CQC_TP_RECV, CQC_TP_NEW_OK, CQC_TP_EPR_OK}:
             if is_factory:
                 q._set_active(False)  # Set qubit to inactive so it can't be used anymore
-                q = qubit(self, createNew=False)
+                q = None
             if q is None:
-                q = qubit(self, createNew=False)
+                return qubit._from_backend(self, otherHdr.qubit_id, entInfoHdr)
             q._qID = otherHdr.qubit_id
             q._set_entanglement_info(entInfoHdr)
             q._set_active(True)
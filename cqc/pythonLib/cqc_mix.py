@@ -27,13 +27,23 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import struct
 from typing import Union
 from anytree import NodeMixin
 
 from cqc.cqcHeader import (
     CQC_CMD_MEASURE,
     CQC_CMD_MEASURE_INPLACE,
+    CQC_VERSION,
+    CQCHeader,
+    CQCCmdHeader,
+    CQCXtraQubitHeader,
+    CQCAssignHeader,
     CQCIfHeader,
+    CQCIfExprHeader,
+    CQCAssignExprHeader,
+    CQCExprHeader,
+    CQCExprOpcode,
     CQCTypeHeader,
     CQCFactoryHeader,
     CQCType,
@@ -44,7 +54,66 @@ from .qubit import qubit
 from .cqc_connection import CQCConnection
 
 
-class CQCVariable:
+class _ExpressionOperators:
+    """
+    Private mixin class, defining the operators which build a CQCExpression from CQCVariables,
+    logical functions, expressions and integers.
+    """
+
+    def __and__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.AND, other)
+
+    def __rand__(self, other):
+        return CQCExpression.combine(other, CQCExprOpcode.AND, self)
+
+    def __or__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.OR, other)
+
+    def __ror__(self, other):
+        return CQCExpression.combine(other, CQCExprOpcode.OR, self)
+
+    def __xor__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.XOR, other)
+
+    def __rxor__(self, other):
+        return CQCExpression.combine(other, CQCExprOpcode.XOR, self)
+
+    def __add__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.ADD, other)
+
+    def __radd__(self, other):
+        return CQCExpression.combine(other, CQCExprOpcode.ADD, self)
+
+    def __sub__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.SUB, other)
+
+    def __rsub__(self, other):
+        return CQCExpression.combine(other, CQCExprOpcode.SUB, self)
+
+    def __eq__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.EQ, other)
+
+    def __ne__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.NEQ, other)
+
+    def __lt__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.LT, other)
+
+    def __le__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.LE, other)
+
+    def __gt__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.GT, other)
+
+    def __ge__(self, other):
+        return CQCExpression.combine(self, CQCExprOpcode.GE, other)
+
+    def __invert__(self):
+        """Logical not, i.e. 1 if the value is 0 and 0 otherwise"""
+        return CQCExpression.of(self).get_negation()
+
+
+class CQCVariable(_ExpressionOperators):
     """
     Instances of this class are returned by measure command, if executed inside a CQCMix context.
     A CQCVariable holds a reference ID with which one can refer to the outcome of the measurement.
@@ -68,16 +137,20 @@ class CQCVariable:
         return self._ref_id
 
     # override the == operator
-    # other can be a CQCVariable or int
-    def __eq__(self, other: Union['CQCVariable', int]):
-        return _LogicalFunction(self, CQCLogicalOperator.EQ, other)
+    # other can be a CQCVariable or int, or an expression
+    def __eq__(self, other: Union['CQCVariable', int, 'CQCExpression']):
+        if isinstance(other, (CQCVariable, int)):
+            return _LogicalFunction(self, CQCLogicalOperator.EQ, other)
+        return super().__eq__(other)
     
     # override the != operator
-    def __ne__(self, other: Union['CQCVariable', int]):
-        return _LogicalFunction(self, CQCLogicalOperator.NEQ, other)
+    def __ne__(self, other: Union['CQCVariable', int, 'CQCExpression']):
+        if isinstance(other, (CQCVariable, int)):
+            return _LogicalFunction(self, CQCLogicalOperator.NEQ, other)
+        return super().__ne__(other)
 
 
-class _LogicalFunction:
+class _LogicalFunction(_ExpressionOperators):
     """
     Private helper class. This class should never be used outside this pythonLib.
     """
@@ -130,12 +203,80 @@ class _LogicalFunction:
         )
         return header
 
+    def to_expression(self) -> 'CQCExpression':
+        """
+        Returns the CQCExpression equivalent to this logical function.
+        """
+        opcode = CQCExprOpcode.EQ if self.operator == CQCLogicalOperator.EQ else CQCExprOpcode.NEQ
+        return CQCExpression.combine(self.operand_one, opcode, self.operand_two)
+
+
+class CQCExpression(_ExpressionOperators):
+    """
+    A classical expression which is evaluated by the backend, for example a parity of measurement outcomes.
+
+    Expressions are built by applying the operators ^, &, |, +, -, ==, !=, <, <=, >, >= and ~ (logical not)
+    to CQCVariables, integers and other expressions, e.g. (m1 ^ m2) == 1. They can be used as condition of
+    CQCMix.cqc_if, in which case the body is executed if the expression is non-zero, or be assigned to a
+    CQCVariable with CQCMix.assign.
+    The expression is sent as a sequence of instructions for a stack machine, see CQCExprOpcode.
+    """
+
+    def __init__(self, instructions):
+        """
+        - **Arguments**
+
+            :instructions:      List of (CQCExprOpcode, operand) tuples.
+        """
+        self.instructions = instructions
+
+    @staticmethod
+    def of(operand: Union['CQCExpression', CQCVariable, _LogicalFunction, int]) -> 'CQCExpression':
+        """
+        Returns operand as a CQCExpression.
+        """
+        if isinstance(operand, CQCExpression):
+            return operand
+        if isinstance(operand, CQCVariable):
+            return CQCExpression([(CQCExprOpcode.PUSH_REF, operand.ref_id)])
+        if isinstance(operand, _LogicalFunction):
+            return operand.to_expression()
+        if isinstance(operand, int):
+            if operand < 0:
+                raise ValueError("Values in expressions cannot be negative, got {}".format(operand))
+            return CQCExpression([(CQCExprOpcode.PUSH_VALUE, int(operand))])
+        raise TypeError("Cannot use {} in a CQCExpression".format(type(operand)))
+
+    @staticmethod
+    def combine(first_operand, opcode: CQCExprOpcode, second_operand) -> 'CQCExpression':
+        """
+        Returns the expression applying the binary operator given by opcode to the operands.
+        """
+        first_operand = CQCExpression.of(first_operand)
+        second_operand = CQCExpression.of(second_operand)
+        return CQCExpression(first_operand.instructions + second_operand.instructions + [(opcode, 0)])
+
+    def get_negation(self) -> 'CQCExpression':
+        return CQCExpression(self.instructions + [(CQCExprOpcode.NOT, 0)])
+
+    def get_CQCExprHeaders(self):
+        """
+        Builds the headers holding the instructions of this expression.
+        """
+        headers = []
+        for opcode, operand in self.instructions:
+            header = CQCExprHeader()
+            header.setVals(opcode, operand)
+            headers.append(header)
+        return headers
+
 
 class CQCMixConnection(CQCConnection):
     """Subclass of CQCconnection to be used with CQCMix"""
     def __init__(self, name, socket_address=None, appID=None, pend_messages=False,
                  retry_connection=True, conn_retry_time=0.1, log_level=None, backend=None,
-                 use_classical_communication=True, network_name=None):
+                 use_classical_communication=True, network_name=None, auto_batch=False,
+                 optimize=False, schedule=False, timeout=None):
         super().__init__(
             name=name,
             socket_address=socket_address,
@@ -147,6 +288,10 @@ class CQCMixConnection(CQCConnection):
             backend=backend,
             use_classical_communication=use_classical_communication,
             network_name=network_name,
+            auto_batch=auto_batch,
+            optimize=optimize,
+            schedule=schedule,
+            timeout=timeout,
         )
 
         # Variable of type NodeMixin. This variable is used in CQCMix types to create a
@@ -155,13 +300,14 @@ class CQCMixConnection(CQCConnection):
 
         self._inside_cqc_mix = False
 
+        # Programs compiled with CQCMix.compile, see CQCMixProgram
+        self._mix_programs = {}
+
     def _update_headers_before_pending(self, headers):
         # Insert type headers if in cqc mix
         if self._inside_cqc_mix:
-            length = sum([hdr.HDR_LENGTH for hdr in headers[1:]])
-            tp_header = CQCTypeHeader()
-            tp_header.setVals(CQCType.COMMAND, length)
-            return [tp_header] + headers[1:]
+            # The CQC header announces the length of the command
+            return [self._type_header(CQCType.COMMAND, headers[0].length)] + headers[1:]
         else:
             return headers[1:]
 
@@ -173,6 +319,9 @@ class CQCMixConnection(CQCConnection):
 
 
 class mix_qubit(qubit):
+
+    __slots__ = ("scope_of_deactivation",)
+
     def __init__(self, cqc: CQCMixConnection, notify=True, block=True, createNew=True, q_id=None, entInfo=None):
         # This stores the scope (type NodeMixin) in which this qubit was deactivated
         # If the qubit has not yet been deactivated, this is set to None
@@ -187,6 +336,10 @@ class mix_qubit(qubit):
             entInfo=entInfo,
         )
 
+    def _init_from_backend(self, cqc, q_id):
+        self.scope_of_deactivation = None
+        super()._init_from_backend(cqc, q_id)
+
     def check_active(self):
         """
         Checks if the qubit is active
@@ -292,6 +445,10 @@ class CQCMix(NodeMixin):
 
         self._conn = cqc_connection
 
+        # If True, the program is not sent at __exit__ but its headers are kept in self._compiled_headers
+        self._compile_only = False
+        self._compiled_headers = None
+
         # Set the current scope to self
         self._conn.current_scope = self
 
@@ -306,31 +463,98 @@ class CQCMix(NodeMixin):
         
         # Only do these things if there was no exception.
         if exc_type is None:
-            # Build and insert the CQC Header
-            self._conn.insert_cqc_header(CQCType.MIX)
-
-            # Send this program to the backend
-            self._conn.send_pending_headers()
-            self._conn.reset_pending_headers()
-
-            # We expect one message back, which can be an error or TP_DONE
-            # This also blocks the program until we have received a message from the backend, 
-            # which is important because it avoids that we send more messages before the backend is finished.
-            message = self._conn.readMessage()
+            if self._conn.optimizer is not None:
+                self._conn._set_pending_headers(self._conn.optimizer.optimize_mix(self._conn._pending_headers))
+
+            try:
+                if self._compile_only:
+                    self._compiled_headers = self._conn._pending_headers
+                    self._conn.reset_pending_headers()
+                else:
+                    # Build and insert the CQC Header
+                    self._conn.insert_cqc_header(CQCType.MIX)
+
+                    # Send this program to the backend
+                    self._conn.send_pending_headers()
+                    self._conn.reset_pending_headers()
+
+                    # We expect one message back, which can be an error or TP_DONE
+                    # This also blocks the program until we have received a message from the backend, 
+                    # which is important because it avoids that we send more messages before the backend is finished.
+                    message = self._conn.readMessage()
+
+                    # Check if it is an error and assume it is a TP_DONE if it is not an error
+                    self._conn.check_error(message[0])
+            finally:
+                # Also if the backend returned an error, so that the connection can still be used
+
+                # We are no longer in a TP_MIX
+                self._conn._inside_cqc_mix = False
+
+                self._conn.pend_messages = False
+
+                # Set the current scope to None, since we exit the CQCMix context 
+                # current_scope is only used inside CQCMix contexts
+                self._conn.current_scope = None
+
+    @staticmethod
+    def compile(cqc_connection: CQCMixConnection, body, num_qubits: int) -> 'CQCMixProgram':
+        """
+        Compiles a CQCMix program once, such that it can be sent many times without building it again.
 
-            # Check if it is an error and assume it is a TP_DONE if it is not an error
-            self._conn.check_error(message[0])
+        The program is built by calling body(pgrm, *qubits), where pgrm is the CQCMix and qubits are num_qubits
+        placeholder qubits. The body should only use these qubits and the CQCVariables it creates itself.
+        Run the returned program with CQCMixProgram.run(*qubits), with the actual qubits.
 
-            # We are no longer in a TP_MIX
-            self._conn._inside_cqc_mix = False
+        Programs are cached by their structure, so compiling the same program twice returns the same
+        CQCMixProgram.
 
-            self._conn.pend_messages = False
+        - **Arguments**
 
-            # Set the current scope to None, since we exit the CQCMix context 
-            # current_scope is only used inside CQCMix contexts
-            self._conn.current_scope = None
+            :cqc_connection:    The CQCMixConnection to which the program will be sent.
+            :body:              Function building the program, called as body(pgrm, *qubits).
+            :num_qubits:        The number of qubits the program acts on.
+        """
+        conn = cqc_connection
+        if conn._inside_cqc_mix:
+            raise CQCGeneralError("Cannot compile a CQCMix program inside another CQCMix")
+
+        # Placeholder qubits get IDs which are not in use, so that we can find them in the headers
+        placeholder_ids = []
+        q_id = CQCMixProgram.MAX_QUBIT_ID
+        while len(placeholder_ids) < num_qubits:
+            if q_id not in conn._active_qubits:
+                placeholder_ids.append(q_id)
+            q_id -= 1
+        placeholders = [mix_qubit._from_backend(conn, q_id) for q_id in placeholder_ids]
+        first_ref_id = CQCVariable._next_ref_id
+
+        pgrm = CQCMix(conn)
+        pgrm._compile_only = True
+        try:
+            with pgrm:
+                body(pgrm, *placeholders)
+        finally:
+            for q in placeholders:
+                if conn._active_qubits.get(q._qID) is q:
+                    del conn._active_qubits[q._qID]
+            if conn._inside_cqc_mix:
+                # The body raised an exception, so the CQCMix did not clean up
+                conn.reset_pending_headers()
+                conn._inside_cqc_mix = False
+                conn.pend_messages = False
+                conn.current_scope = None
+
+        program = CQCMixProgram(
+            conn,
+            pgrm._compiled_headers,
+            {q_id: index for index, q_id in enumerate(placeholder_ids)},
+            range(first_ref_id, CQCVariable._next_ref_id),
+            [index for index, q in enumerate(placeholders) if not q._active],
+        )
+        return conn._mix_programs.setdefault(program, program)
 
-    def cqc_if(self, logical_function: _LogicalFunction):
+    def cqc_if(self, logical_function: Union[_LogicalFunction, CQCExpression]):
         """
         Open a Python Context Manager Type to start an if-statement block.
 
@@ -341,10 +565,36 @@ class CQCMix(NodeMixin):
                                     CQCVariable can be any instance that you want to test to a value, or to another  
                                     CQCVariable. The operator can be == or !=. 
                                     The value can be any integer (though only 1 and 0 make sense).
+                                    This can also be a CQCExpression, e.g. (m1 ^ m2) == 1, in which case the
+                                    body is executed if the expression evaluates to a non-zero value.
                                 
         """
         return _CQCConditional(self._conn, False, logical_function)
 
+    def assign(self, expression: Union[CQCExpression, CQCVariable, int], variable: CQCVariable = None) -> CQCVariable:
+        """
+        Assigns the value of an expression, evaluated by the backend, to a CQCVariable.
+        This can for example be used for counters: count = pgrm.assign(0), followed by pgrm.assign(count + m, count).
+
+        - **Arguments**
+
+            :expression:    The CQCExpression (or CQCVariable or integer) to evaluate.
+            :variable:      The CQCVariable to assign to. If None, a new CQCVariable is created.
+        """
+        if not self._conn._inside_cqc_mix:
+            raise CQCGeneralError("CQCMix.assign can only be used inside a CQCMix context, and not inside a loop")
+        if variable is None:
+            variable = CQCVariable()
+
+        # Remember the assignment in the enclosing conditionals, such that an ELSE can check its condition
+        scope = self._conn.current_scope
+        for conditional in (scope,) + scope.ancestors:
+            if isinstance(conditional, _CQCConditional):
+                conditional._assigned_ref_ids.add(variable.ref_id)
+
+        _pend_assignment(self._conn, expression, variable)
+        return variable
+
     def cqc_else(self):
         """
         Open a Python Context Manager Type to start an else-statement block.
@@ -365,6 +615,148 @@ class CQCMix(NodeMixin):
         return _CQCFactory(self._conn, times)
 
 
+def _pend_assignment(cqc_connection, expression: Union[CQCExpression, CQCVariable, int], variable: CQCVariable):
+    """
+    Pends the headers assigning the value of expression to variable.
+    """
+    expr_headers = CQCExpression.of(expression).get_CQCExprHeaders()
+    expr_length = len(expr_headers) * CQCExprHeader.HDR_LENGTH
+    assign_header = CQCAssignExprHeader()
+    assign_header.setVals(variable.ref_id, expr_length)
+    cqc_connection._pend_type_header(CQCType.ASSIGN_EXPR, CQCAssignExprHeader.HDR_LENGTH + expr_length)
+    cqc_connection.pend_header(assign_header)
+    cqc_connection.pend_headers(expr_headers)
+
+
+class CQCMixProgram:
+    """
+    A compiled CQCMix program, see CQCMix.compile.
+
+    The program is kept as the bytes of the message together with the offsets of the qubit IDs and the
+    reference IDs in it. When the program is run, the IDs of the given qubits are written at these offsets.
+    The reference IDs are allocated once, when the program is compiled, and reused by every run, such that
+    the backend does not store new references on every run.
+    """
+
+    # Qubit IDs and reference IDs are unsigned short and unsigned int, respectively
+    MAX_QUBIT_ID = 0xFFFF
+    _QUBIT_ID = struct.Struct("!H")
+    _REF_ID = struct.Struct("!I")
+
+    # Offset of the second operand in a CQCIfHeader
+    _IF_SECOND_OPERAND_OFFSET = struct.calcsize("!IBB")
+    # Offset of the operand in a CQCExprHeader
+    _EXPR_OPERAND_OFFSET = struct.calcsize("!B")
+
+    def __init__(self, cqc_connection, headers, qubit_indices, ref_ids, deactivated):
+        """
+        - **Arguments**
+
+            :cqc_connection:    The CQCMixConnection the program is run on.
+            :headers:           The headers of the program, excluding the CQC header.
+            :qubit_indices:     Dictionary from the placeholder qubit IDs used in the headers to the index of the qubit.
+            :ref_ids:           The reference IDs of the CQCVariables created by the program.
+            :deactivated:       The indices of the qubits which are no longer active after the program.
+        """
+        self._conn = cqc_connection
+        self.num_qubits = len(qubit_indices)
+        self.num_variables = len(ref_ids)
+        self._deactivated = deactivated
+        self._ref_start = ref_ids.start
+
+        # Find the offsets of the IDs, and replace them by their index so that the template does not depend on them
+        self._qubit_offsets = []
+        self._ref_offsets = []
+        offset = 0
+        for header in headers:
+            if isinstance(header, (CQCCmdHeader, CQCXtraQubitHeader)) and header.qubit_id in qubit_indices:
+                self._qubit_offsets.append((offset, qubit_indices[header.qubit_id]))
+            elif isinstance(header, CQCAssignHeader) and header.ref_id in ref_ids:
+                self._ref_offsets.append((offset, header.ref_id - ref_ids.start))
+            elif isinstance(header, CQCAssignExprHeader) and header.ref_id in ref_ids:
+                self._ref_offsets.append((offset, header.ref_id - ref_ids.start))
+            elif isinstance(header, CQCExprHeader) and header.opcode == CQCExprOpcode.PUSH_REF \
+                    and header.operand in ref_ids:
+                self._ref_offsets.append((offset + self._EXPR_OPERAND_OFFSET, header.operand - ref_ids.start))
+            elif isinstance(header, CQCIfHeader):
+                if header.first_operand in ref_ids:
+                    self._ref_offsets.append((offset, header.first_operand - ref_ids.start))
+                if header.type_of_second_operand == CQCIfHeader.TYPE_REF_ID and header.second_operand in ref_ids:
+                    self._ref_offsets.append(
+                        (offset + self._IF_SECOND_OPERAND_OFFSET, header.second_operand - ref_ids.start))
+            offset += header.HDR_LENGTH
+
+        template = bytearray(b''.join([header.pack() for header in headers]))
+        for offset, index in self._qubit_offsets:
+            self._QUBIT_ID.pack_into(template, offset, index)
+        for offset, index in self._ref_offsets:
+            self._REF_ID.pack_into(template, offset, index)
+        self._template = bytes(template)
+
+    @property
+    def _structure(self):
+        """
+        The program without its IDs. The offsets are part of it, since the template alone does not tell a
+        placeholder apart from an actual qubit whose ID equals the index of the placeholder.
+        """
+        return (
+            self.num_qubits,
+            self._template,
+            tuple(self._qubit_offsets),
+            tuple(self._ref_offsets),
+            tuple(self._deactivated),
+        )
+
+    @property
+    def structural_hash(self):
+        """Hash of the program, which is the same for programs with the same structure"""
+        return hash(self._structure)
+
+    def __hash__(self):
+        return self.structural_hash
+
+    def __eq__(self, other):
+        if not isinstance(other, CQCMixProgram):
+            return NotImplemented
+        return self._structure == other._structure
+
+    def __len__(self):
+        """The length of the program in bytes, excluding the CQC header"""
+        return len(self._template)
+
+    def run(self, *qubits):
+        """
+        Sends the program to the backend, acting on the given qubits, and waits until it is executed.
+
+        - **Arguments**
+
+            :qubits:    The qubits to run the program on, in the same order as passed to the body when compiling.
+        """
+        if len(qubits) != self.num_qubits:
+            raise ValueError("The program acts on {} qubits, got {}".format(self.num_qubits, len(qubits)))
+        for q in qubits:
+            q.check_active()
+
+        conn = self._conn
+        data = bytearray(self._template)
+        for offset, index in self._qubit_offsets:
+            self._QUBIT_ID.pack_into(data, offset, qubits[index]._qID)
+        for offset, index in self._ref_offsets:
+            self._REF_ID.pack_into(data, offset, self._ref_start + index)
+
+        cqc_header = CQCHeader()
+        cqc_header.setVals(CQC_VERSION, CQCType.MIX, conn._appID, len(data))
+        conn.flush_batch()
+        conn.commit(cqc_header.pack() + data)
+
+        # As for CQCMix, we expect one message back, which can be an error or TP_DONE
+        message = conn.readMessage()
+        conn.check_error(message[0])
+
+        for index in self._deactivated:
+            qubits[index]._set_active(False)
+
+
 class _CQCFactory:
     """
     Private class to create factories inside CQCMix contexts. Never explicitely instantiate this class outside 
@@ -390,8 +782,9 @@ class _CQCFactory:
         factory_header = CQCFactoryHeader()
         factory_header.setVals(self._repetition_amount)
 
-        # Pend the headers
+        # Pend the headers, and remember where the body starts so that we can compute its length at __exit__
         self._conn.pend_header(self.type_header)
+        self._body_start = self._conn._pending_length
         self._conn.pend_header(factory_header)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -400,16 +793,8 @@ class _CQCFactory:
         # Therefore, we set this bool to True
         self._conn._inside_cqc_mix = True
 
-        # Calculate the length of the body of the factory
-        # Loop in reverse through all pending_headers to calculate the length of all headers
-        index = len(self._conn._pending_headers) - 1
-        body_length = 0
-        while self._conn._pending_headers[index] is not self.type_header:
-            body_length += self._conn._pending_headers[index].HDR_LENGTH
-            index -= 1
-        
-        # Set the correct length
-        self.type_header.length = body_length
+        # Set the length of the body of the factory
+        self.type_header.length = self._conn._pending_length - self._body_start
 
 
 class _CQCConditional(NodeMixin):
@@ -437,21 +822,57 @@ class _CQCConditional(NodeMixin):
             if _CQCConditional._last_closed_conditional is None:
                 raise CQCGeneralError('Cannot use an ELSE if there is no IF directly before it.')
             else:
+                last_if = _CQCConditional._last_closed_conditional
+                # A plain IF header compares the variables themselves, so the negation would not be the opposite
+                # of the IF if its body assigned to them. Expressions are stored before the IF, see __enter__.
+                if isinstance(last_if._logical_function, _LogicalFunction):
+                    operands = [last_if._logical_function.operand_one, last_if._logical_function.operand_two]
+                    if any(isinstance(operand, CQCVariable) and operand.ref_id in last_if._assigned_ref_ids
+                           for operand in operands):
+                        raise CQCGeneralError(
+                            'Cannot use an ELSE after an IF which assigns to a variable of its condition. '
+                            'Use an expression as condition instead, e.g. m + 0 == 1.'
+                        )
                 # Get the negation of the logical function of the IF, 
                 # which will be the logical function for this ELSE statement
-                logical_function = _CQCConditional._last_closed_conditional._logical_function.get_negation()
+                logical_function = last_if._logical_function.get_negation()
             
         self._logical_function = logical_function
 
+        # The reference IDs of the variables which are assigned to inside the body, see CQCMix.assign
+        self._assigned_ref_ids = set()
+
     def __enter__(self):
-        # Pend CQC Type header
-        self._conn._pend_type_header(CQCType.IF, CQCIfHeader.HDR_LENGTH)
+        if isinstance(self._logical_function, CQCExpression) and not self.is_else:
+            # The body can assign to the variables of the expression, so the value of the expression is stored
+            # in a hidden variable first. Both the IF and the ELSE test this variable.
+            condition = CQCVariable()
+            _pend_assignment(self._conn, self._logical_function, condition)
+            self._logical_function = CQCExpression.of(condition)
+
+        if isinstance(self._logical_function, CQCExpression):
+            # Build the IF header, and store it so we can modify its length at __exit__
+            expr_headers = self._logical_function.get_CQCExprHeaders()
+            expr_length = len(expr_headers) * CQCExprHeader.HDR_LENGTH
+            self.header = CQCIfExprHeader()
+            self.header.setVals(expr_length, length=0)
+
+            # Pend CQC Type header, the IF header and the expression
+            self._conn._pend_type_header(CQCType.IF_EXPR, CQCIfExprHeader.HDR_LENGTH + expr_length)
+            self._conn.pend_header(self.header)
+            self._conn.pend_headers(expr_headers)
+        else:
+            # Pend CQC Type header
+            self._conn._pend_type_header(CQCType.IF, CQCIfHeader.HDR_LENGTH)
+
+            # Build the IF header, and store it so we can modify its length at __exit__
+            self.header = self._logical_function.get_CQCIfHeader()
 
-        # Build the IF header, and store it so we can modify its length at __exit__
-        self.header = self._logical_function.get_CQCIfHeader()
+            # Pend the IF header
+            self._conn.pend_header(self.header)
 
-        # Pend the IF header
-        self._conn.pend_header(self.header)
+        # Remember where the body starts so that we can compute its length at __exit__
+        self._body_start = self._conn._pending_length
 
         # Register the parent scope, and set the current scope to self
         self.parent = self._conn.current_scope
@@ -465,16 +886,8 @@ class _CQCConditional(NodeMixin):
         else:
             _CQCConditional._last_closed_conditional = self
 
-        # Calculate the length of the body of the conditional
-        # Loop in reverse through all pending_headers to calculate the lenght of all headers
-        index = len(self._conn._pending_headers) - 1
-        body_length = 0
-        while self._conn._pending_headers[index] is not self.header:
-            body_length += self._conn._pending_headers[index].HDR_LENGTH
-            index -= 1
-        
-        # Set the correct length
-        self.header.length = body_length
+        # Set the length of the body of the conditional
+        self.header.length = self._conn._pending_length - self._body_start
             
         # Set the scope to the parent scope
         self._conn.current_scope = self.parent
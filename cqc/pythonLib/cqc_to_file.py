@@ -28,17 +28,56 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
-
-from cqc.cqcHeader import CQCCmdHeader, CQC_CMD_MEASURE, CQC_CMD_MEASURE_INPLACE
+import gzip
+
+import numpy as np
+
+from cqc.util import parse_cqc_message
+from cqc.cqcHeader import (
+    CQCCmdHeader,
+    CQCMeasCountHeader,
+    CQCAggregateMode,
+    CQC_CMD_MEASURE,
+    CQC_CMD_MEASURE_INPLACE,
+)
 from .qubit import qubit
 from .cqc_handler import CQCHandler
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 class CQCToFile(CQCHandler):
     """Handler to be used when writing the CQC commands to a file."""
 
     def __init__(self, name=None, file='CQC_File', pend_messages=False,
-                 overwrite=False, binary=True):
+                 overwrite=False, binary=True, buffer_size=1 << 16,
+                 max_file_size=None, compression=None, readable=False):
+        """
+        Initialize a handler which writes the CQC messages to a file.
+
+        The file is kept open for the lifetime of the handler. In binary mode, messages are collected in
+        a buffer which is written to the file when it exceeds `buffer_size` bytes, and on `close()`.
+        In text mode, each message is written as a line and flushed directly. By default this line is the repr of
+        the bytes of the message, with readable=True it lists the decoded headers instead.
+
+        - **Arguments**
+            :param name:            Name of the handler, defaults to the name of the file.
+            :param file:            The file to which the commands will be written.
+            :param pend_messages:   True if you want to wait with writing messages until flush().
+            :param overwrite:       Whether to overwrite the file if there is already one with the same name.
+            :param binary:          Whether to write the messages in binary form or as text.
+            :param buffer_size:     int
+                Number of bytes to buffer before writing to the file (binary mode only).
+            :param max_file_size:   int or None
+                If set, a new file is started when the current one would exceed this many bytes.
+                The n-th new file is named as the first one with '.n' appended.
+            :param compression:     None, 'gzip' or 'zstd'
+                Compress the written stream (binary mode only). 'zstd' requires the zstandard package.
+            :param readable:        Whether to write the decoded headers of the messages (text mode only).
+        """
 
         if name is None:
             name = file
@@ -50,6 +89,20 @@ class CQCToFile(CQCHandler):
 
         self.binary = binary
 
+        if compression not in (None, 'gzip', 'zstd'):
+            raise ValueError("Unknown compression {}, should be None, 'gzip' or 'zstd'".format(compression))
+        if compression is not None and not binary:
+            raise ValueError("Compression is only supported when binary=True")
+        if readable and binary:
+            raise ValueError("Readable output is only supported when binary=False")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("Compression 'zstd' requires the zstandard package to be installed")
+        self.compression = compression
+        self.readable = readable
+
+        self.buffer_size = buffer_size
+        self.max_file_size = max_file_size
+
         self.file = file
 
         # Check if file exists
@@ -72,6 +125,19 @@ class CQCToFile(CQCHandler):
                         self.file = self.file + str(num)
                         break 
 
+        # All files written so far, the last one is the current one
+        self.files = [self.file]
+
+        # The file handle is opened when the first message is written
+        self._file_handle = None
+
+        # Number of (uncompressed) bytes written to the current file, including the buffer
+        self._file_size = 0
+
+        # Messages waiting to be written to the file
+        self._write_buffer = []
+        self._write_buffer_size = 0
+
         # Don't want notify when writing to file
         self.notify = False
 
@@ -83,19 +149,70 @@ class CQCToFile(CQCHandler):
         """
 
         if self.binary is True:
-            with open(self.file, 'ab') as f:
-                f.write(msg)
+            if self.max_file_size is not None and self._file_size > 0:
+                if self._file_size + len(msg) > self.max_file_size:
+                    self._rotate_file()
+            self._write_buffer.append(msg)
+            self._write_buffer_size += len(msg)
+            self._file_size += len(msg)
+            if self._write_buffer_size >= self.buffer_size:
+                self.flush_file()
+        elif self.readable:
+            self._get_file_handle().write("; ".join(str(header) for header in parse_cqc_message(msg)) + '\n')
         else:
-            with open(self.file, 'a') as f:      
-                f.write(str(msg) + '\n')
+            self._get_file_handle().write(str(msg) + '\n')
+
+    def flush_file(self):
+        """Writes the buffered messages to the file."""
+        if self._write_buffer:
+            self._get_file_handle().write(b''.join(self._write_buffer))
+            self._write_buffer = []
+            self._write_buffer_size = 0
+
+    def _get_file_handle(self):
+        if self._file_handle is None:
+            if not self.binary:
+                # Line buffered, such that each message is in the file directly
+                self._file_handle = open(self.file, 'a', buffering=1)
+            elif self.compression == 'gzip':
+                self._file_handle = gzip.open(self.file, 'ab')
+            elif self.compression == 'zstd':
+                raw = open(self.file, 'ab')
+                self._file_handle = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+            else:
+                self._file_handle = open(self.file, 'ab')
+        return self._file_handle
+
+    def _close_file_handle(self):
+        self.flush_file()
+        if self._file_handle is not None:
+            self._file_handle.close()
+            self._file_handle = None
+
+    def _rotate_file(self):
+        """Closes the current file and continues writing in a new one."""
+        self._close_file_handle()
+        self.file = "{}.{}".format(self.files[0], len(self.files))
+        try:
+            os.remove(self.file)
+        except FileNotFoundError:
+            pass
+        self.files.append(self.file)
+        self._file_size = 0
+
+    def close(self, release_qubits=True):
+        """Handle closing actions.
+
+        Flushes remaining headers, releases all qubits and writes everything to the file.
+        """
+        super().close(release_qubits=release_qubits)
+
+        self._close_file_handle()
 
-    def _handle_create_qubits(self, num_qubits):
+    def _handle_create_qubits(self, num_qubits, notify=True):
         qubits = []
         for _ in range(num_qubits):
-            q = qubit(self, createNew=False)
-            q._qID = self.new_qubitID()
-            q._set_active(True)
-            qubits.append(q)
+            qubits.append(qubit._from_backend(self, self.new_qubitID()))
 
         return qubits
 
@@ -117,19 +234,22 @@ class CQCToFile(CQCHandler):
         return 0, 0
 
     def _handle_epr_response(self, notify):
-        # Initialize the qubit
-        q = qubit(self, createNew=False)
-
         entInfoHdr = None  # TODO: create function that returns some fake entanglement info
-        q_id = self.new_qubitID()
 
-        q._set_entanglement_info(entInfoHdr)
-        q._qID = q_id
+        # Initialize, activate and return the qubit
+        return qubit._from_backend(self, self.new_qubitID(), entInfoHdr)
 
-        # Activate and return qubit
-        q._set_active(True)
+    def _read_measurement_summary(self, num_iter, aggregate, num_slots, should_notify=False):
+        """Builds an artificial summary where all outcomes are 0"""
+        if aggregate == CQCAggregateMode.COUNTS:
+            return []
+        count_header = CQCMeasCountHeader()
+        count_header.setVals(0, num_iter)
+        return [count_header]
 
-        return q
+    def _read_packed_outcomes(self, num_iter, num_slots, should_notify=False):
+        """Builds artificial outcomes which are all 0"""
+        return np.zeros((num_iter, num_slots), dtype=np.uint8)
 
     def return_meas_outcome(self):
         """Return measurement outcome."""
@@ -155,15 +275,6 @@ class CQCToFile(CQCHandler):
                         res.append(self.return_meas_outcome())
                     # TODO entanglement information etc
                     else:
-                        q = None
-                        if num_iter != 1:
-                            q._set_active(False)
-                            q = qubit(self, createNew=False)
-                        if q is None:
-                            q = qubit(self, createNew=False)
-                        q._qID = self.new_qubitID()
-                        q._set_entanglement_info(None)
-                        q._set_active(True)
-                        res.append(q)
+                        res.append(qubit._from_backend(self, self.new_qubitID()))
 
         return res
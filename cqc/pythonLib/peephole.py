@@ -0,0 +1,295 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+
+from cqc.cqcHeader import (
+    CQCCmdHeader,
+    CQCIfHeader,
+    CQCIfExprHeader,
+    CQCRotationHeader,
+    CQCType,
+    CQCTypeHeader,
+    CQCXtraQubitHeader,
+    CQC_CMD_I,
+    CQC_CMD_X,
+    CQC_CMD_Y,
+    CQC_CMD_Z,
+    CQC_CMD_H,
+    CQC_CMD_K,
+    CQC_CMD_ROT_X,
+    CQC_CMD_ROT_Y,
+    CQC_CMD_ROT_Z,
+    CQC_CMD_CNOT,
+    CQC_CMD_CPHASE,
+)
+
+# Gates which are their own inverse, so that two of them on the same qubit(s) cancel
+_SELF_INVERSE = {CQC_CMD_X, CQC_CMD_Y, CQC_CMD_Z, CQC_CMD_H, CQC_CMD_K, CQC_CMD_CNOT, CQC_CMD_CPHASE}
+_ROTATIONS = {CQC_CMD_ROT_X, CQC_CMD_ROT_Y, CQC_CMD_ROT_Z}
+
+# Rotations are in steps of 2pi/256
+_ROTATION_STEPS = 256
+
+
+class PeepholeStats:
+    """Statistics of one or more optimization passes."""
+
+    def __init__(self, headers_before=0, headers_after=0, bytes_before=0, bytes_after=0,
+                 cancelled=0, fused=0, dropped=0):
+        self.headers_before = headers_before
+        self.headers_after = headers_after
+        self.bytes_before = bytes_before
+        self.bytes_after = bytes_after
+        # Number of commands removed since they cancelled against another command
+        self.cancelled = cancelled
+        # Number of rotations merged into a preceding rotation
+        self.fused = fused
+        # Number of commands removed since they do nothing (identities and rotations over 0)
+        self.dropped = dropped
+
+    @property
+    def headers_saved(self):
+        return self.headers_before - self.headers_after
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_before - self.bytes_after
+
+    def __iadd__(self, other):
+        self.headers_before += other.headers_before
+        self.headers_after += other.headers_after
+        self.bytes_before += other.bytes_before
+        self.bytes_after += other.bytes_after
+        self.cancelled += other.cancelled
+        self.fused += other.fused
+        self.dropped += other.dropped
+        return self
+
+    def __str__(self):
+        return ("Peephole: {} -> {} headers, {} -> {} bytes ({} cancelled, {} fused, {} dropped)".format(
+            self.headers_before, self.headers_after, self.bytes_before, self.bytes_after,
+            self.cancelled, self.fused, self.dropped))
+
+
+class _Command:
+    """A command in a sequence, i.e. a command header together with the headers belonging to it."""
+
+    __slots__ = ("headers", "cmd", "xtra")
+
+    def __init__(self, headers, cmd=None, xtra=None):
+        self.headers = headers
+        # None if these headers are not a single command (e.g. the body of an IF inside a CQCMix)
+        self.cmd = cmd
+        self.xtra = xtra
+
+    @property
+    def qubits(self):
+        """The IDs of the qubits the command acts on"""
+        if self.cmd.instr in (CQC_CMD_CNOT, CQC_CMD_CPHASE) and isinstance(self.xtra, CQCXtraQubitHeader):
+            return self.cmd.qubit_id, self.xtra.qubit_id
+        return (self.cmd.qubit_id,)
+
+
+def _split_sequence(headers):
+    """Splits a list of headers into commands, returns None if the headers are not a sequence of commands"""
+    commands = []
+    for header in headers:
+        if isinstance(header, CQCCmdHeader):
+            commands.append(_Command([header], header))
+        elif commands and len(commands[-1].headers) == 1:
+            commands[-1].headers.append(header)
+            commands[-1].xtra = header
+        else:
+            return None
+    return commands
+
+
+class PeepholeOptimizer:
+    """
+    Optimizes sequences of pending commands before they are sent to the backend.
+
+    Within a sequence, the optimizer
+
+    * cancels pairs of self-inverse gates (X, Y, Z, H, K, CNOT and CPHASE) on the same qubits,
+    * fuses consecutive rotations around the same axis of the same qubit, modulo 2pi,
+    * drops identities and rotations over 0.
+
+    Gates only cancel or fuse if no other command acts on their qubits in between.
+    Commands with the action flag set and, inside a CQCMix, IF and FACTORY blocks are never touched
+    and act as a barrier for all qubits. If any of the original commands asked for a notification,
+    so does one of the remaining ones.
+
+    The statistics of the last pass are kept in last_stats and those of all passes in total_stats.
+    """
+
+    def __init__(self):
+        self.last_stats = PeepholeStats()
+        self.total_stats = PeepholeStats()
+
+    def optimize(self, headers):
+        """
+        Optimizes a sequence of command headers, i.e. command headers each followed by their extra header,
+        as pended by CQCHandler outside a CQCMix.
+
+        :param headers: List of headers. The list is not modified, the headers in it may be
+        :return: The optimized list of headers
+        """
+        commands = _split_sequence(headers)
+        if commands is None:
+            return self._unchanged(headers)
+        return self._run(headers, commands)
+
+    def optimize_mix(self, headers):
+        """
+        Optimizes the body of a CQCMix program. Only the commands on the top level of the program are
+        optimized, IF and FACTORY blocks are kept as they are.
+
+        :param headers: List of headers (without the CQC header). The list is not modified, the headers in it may be
+        :return: The optimized list of headers
+        """
+        commands = self._split_mix(headers)
+        if commands is None:
+            return self._unchanged(headers)
+        return self._run(headers, commands)
+
+    def _unchanged(self, headers):
+        logging.debug("Peephole: could not parse the sequence of headers, not optimizing it")
+        length = sum(header.HDR_LENGTH for header in headers)
+        self._record(PeepholeStats(len(headers), len(headers), length, length))
+        return headers
+
+    def _run(self, headers, commands):
+        stats = PeepholeStats(headers_before=len(headers), bytes_before=sum(h.HDR_LENGTH for h in headers))
+        commands = self._optimize_commands(commands, stats)
+        headers = [header for command in commands for header in command.headers]
+        stats.headers_after = len(headers)
+        stats.bytes_after = sum(header.HDR_LENGTH for header in headers)
+        self._record(stats)
+        return headers
+
+    def _record(self, stats):
+        self.last_stats = stats
+        self.total_stats += stats
+        if stats.headers_saved:
+            logging.debug(str(stats))
+
+    @staticmethod
+    def _split_mix(headers):
+        """Splits the body of a CQCMix program into commands, returns None if the body cannot be parsed"""
+        commands = []
+        index = 0
+        while index < len(headers):
+            type_header = headers[index]
+            if not isinstance(type_header, CQCTypeHeader):
+                return None
+            # Collect the headers announced by the type header
+            length = type_header.length
+            if type_header.type in (CQCType.IF, CQCType.IF_EXPR) and index + 1 < len(headers) \
+                    and isinstance(headers[index + 1], (CQCIfHeader, CQCIfExprHeader)):
+                length += headers[index + 1].length
+            end = index + 1
+            while length > 0 and end < len(headers):
+                length -= headers[end].HDR_LENGTH
+                end += 1
+            if length != 0:
+                return None
+
+            block = headers[index:end]
+            if type_header.type == CQCType.COMMAND and isinstance(block[1], CQCCmdHeader) and len(block) <= 3:
+                commands.append(_Command(block, block[1], block[2] if len(block) == 3 else None))
+            else:
+                commands.append(_Command(block))
+            index = end
+        return commands
+
+    def _optimize_commands(self, commands, stats):
+        should_notify = False
+        kept = []
+        # For each qubit, the indices into kept of the commands acting on it
+        on_qubit = {}
+
+        for command in commands:
+            cmd = command.cmd
+            if cmd is None or cmd.action:
+                # Nothing can be moved past this
+                on_qubit = {}
+                kept.append(command)
+                continue
+
+            should_notify = should_notify or cmd.notify
+            instr = cmd.instr
+
+            is_rotation = instr in _ROTATIONS and isinstance(command.xtra, CQCRotationHeader)
+            if instr == CQC_CMD_I or (is_rotation and command.xtra.step % _ROTATION_STEPS == 0):
+                stats.dropped += 1
+                continue
+
+            qubits = command.qubits
+            previous_index = self._last_on(on_qubit, qubits)
+            previous = kept[previous_index] if previous_index is not None else None
+            if previous is not None and previous.cmd.instr == instr and previous.qubits == qubits:
+                if instr in _SELF_INVERSE:
+                    kept[previous_index] = None
+                    for qubit_id in qubits:
+                        on_qubit[qubit_id].pop()
+                    stats.cancelled += 2
+                    continue
+                if is_rotation and isinstance(previous.xtra, CQCRotationHeader):
+                    step = (previous.xtra.step + command.xtra.step) % _ROTATION_STEPS
+                    stats.fused += 1
+                    if step == 0:
+                        kept[previous_index] = None
+                        on_qubit[qubits[0]].pop()
+                        stats.dropped += 1
+                    else:
+                        previous.xtra.step = step
+                    continue
+
+            for qubit_id in qubits:
+                on_qubit.setdefault(qubit_id, []).append(len(kept))
+            kept.append(command)
+
+        kept = [command for command in kept if command is not None]
+
+        # Make sure that we still get notified if this was asked for
+        if should_notify:
+            commands_left = [command.cmd for command in kept if command.cmd is not None]
+            if commands_left and not any(cmd.notify for cmd in commands_left):
+                commands_left[-1].notify = True
+
+        return kept
+
+    @staticmethod
+    def _last_on(on_qubit, qubits):
+        """Returns the index of the last command acting on the qubits, if this is the same command for all qubits"""
+        indices = {on_qubit[qubit_id][-1] if on_qubit.get(qubit_id) else None for qubit_id in qubits}
+        if len(indices) != 1:
+            return None
+        return indices.pop()
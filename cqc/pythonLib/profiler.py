@@ -0,0 +1,287 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import time
+import functools
+from collections import defaultdict
+
+from cqc.cqcHeader import _CMD_TO_STRING
+
+# Methods of a CQCHandler which are timed, per phase they are attributed to.
+# Time spent in a method and not in one of the other timed methods it calls is attributed to its phase.
+_PHASES = {
+    "put_command": "client",
+    "commit_command": "client",
+    "flush": "client",
+    "flush_factory": "client",
+    "flush_batch": "client",
+    "createEPR": "client",
+    "recvEPR": "client",
+    "sendQubit": "client",
+    "recvQubit": "client",
+    "commit": "send",
+    "readMessage": "wait",
+    "sendClassical": "classical",
+    "recvClassical": "classical",
+    "recv_any": "classical",
+    "send_array": "classical",
+    "recv_array": "classical",
+}
+
+# Timed methods which take the command type as second argument
+_COMMAND_METHODS = {"put_command", "commit_command"}
+
+_PHASE_ORDER = ["client", "send", "wait", "network", "backend", "classical"]
+
+# Files in this directory are part of the library, the call site is the first frame outside of it
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+
+class _Call:
+    """A timed method call which has not returned yet."""
+
+    __slots__ = ("name", "operation", "site", "start", "child_time")
+
+    def __init__(self, name, operation, site, start):
+        self.name = name
+        self.operation = operation
+        self.site = site
+        self.start = start
+        # Time spent in timed methods called by this one
+        self.child_time = 0.0
+
+
+class CQCProfiler:
+    """
+    Attributes the wall time spent in a CQCHandler to phases of the protocol, per operation and per call site.
+
+    Use it as a context manager, usually through CQCHandler.profile::
+
+        with cqc.profile() as p:
+            ...
+        print(p.summary())
+        p.write_collapsed("cqc.folded")
+
+    The phases are:
+
+    * client: time spent in the library building, packing and parsing messages,
+    * send: time spent sending to the backend,
+    * wait: time spent waiting for replies of the backend, i.e. the backend processing plus the network round-trip.
+      If the round-trip time rtt is given, this is split in network (rtt per reply) and backend (the rest),
+    * classical: time spent in the classical communication with other hosts.
+
+    The operation is the command type for commands (e.g. MEASURE), also for the reply read after it,
+    and otherwise the name of the method called (e.g. flush_factory or createEPR).
+    The call site is the innermost frame outside of the cqc package from which the library was called.
+    """
+
+    def __init__(self, cqc, rtt=None):
+        """
+        :param cqc: The CQCHandler to profile
+        :param rtt: float or None
+            Round-trip time of the network to the backend in seconds, if known
+        """
+        self._cqc = cqc
+        self.rtt = rtt
+        # Seconds spent per (call site, operation, phase)
+        self.times = defaultdict(float)
+        # Number of calls per (call site, operation)
+        self.calls = defaultdict(int)
+        # Number of replies read per (call site, operation)
+        self.replies = defaultdict(int)
+        self.wall_time = 0.0
+
+        self._stack = []
+        self._last_command = None
+        self._start = None
+        # Instance attributes replaced by the hooks, None if there was none
+        self._replaced = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Starts profiling by hooking the methods of the CQCHandler."""
+        if self._start is not None:
+            raise RuntimeError("The profiler is already started")
+        for name in _PHASES:
+            method = getattr(self._cqc, name, None)
+            if method is None:
+                continue
+            self._replaced[name] = self._cqc.__dict__.get(name)
+            setattr(self._cqc, name, self._hook(name, method))
+        self._start = time.perf_counter()
+
+    def stop(self):
+        """Stops profiling and restores the methods of the CQCHandler."""
+        if self._start is None:
+            return
+        self.wall_time += time.perf_counter() - self._start
+        self._start = None
+        for name, replaced in self._replaced.items():
+            if replaced is None:
+                delattr(self._cqc, name)
+            else:
+                setattr(self._cqc, name, replaced)
+        self._replaced = {}
+
+    def _hook(self, name, method):
+        @functools.wraps(method)
+        def hooked(*args, **kwargs):
+            self._enter(name, args, kwargs)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._exit()
+        return hooked
+
+    def _enter(self, name, args, kwargs):
+        if name in _COMMAND_METHODS:
+            command = kwargs["command"] if "command" in kwargs else args[1]
+            self._last_command = _CMD_TO_STRING.get(command, str(command))
+
+        if self._stack:
+            # Nested calls are part of the operation of the outermost one
+            outer = self._stack[-1]
+            operation, site = outer.operation, outer.site
+        else:
+            site = self._call_site()
+            if name in _COMMAND_METHODS:
+                operation = self._last_command
+            elif name == "readMessage" and self._last_command is not None:
+                # The reply of the last command
+                operation = self._last_command
+            else:
+                operation = name
+            self.calls[site, operation] += 1
+        self._stack.append(_Call(name, operation, site, time.perf_counter()))
+
+    def _exit(self):
+        call = self._stack.pop()
+        elapsed = time.perf_counter() - call.start
+        phase = _PHASES[call.name]
+        self.times[call.site, call.operation, phase] += elapsed - call.child_time
+        if phase == "wait":
+            self.replies[call.site, call.operation] += 1
+        if self._stack:
+            self._stack[-1].child_time += elapsed
+
+    @staticmethod
+    def _call_site():
+        frame = sys._getframe(3)
+        while frame is not None and frame.f_code.co_filename.startswith(_PACKAGE_DIR):
+            frame = frame.f_back
+        if frame is None:
+            return "<cqc>"
+        return "{}:{}:{}".format(os.path.basename(frame.f_code.co_filename), frame.f_code.co_name, frame.f_lineno)
+
+    def phase_times(self):
+        """
+        Returns a dict from (call site, operation, phase) to seconds.
+        If rtt is set, the wait phase is split in network and backend.
+        """
+        if self.rtt is None:
+            return dict(self.times)
+        times = {}
+        for (site, operation, phase), seconds in self.times.items():
+            if phase == "wait":
+                network = min(seconds, self.rtt * self.replies[site, operation])
+                times[site, operation, "network"] = network
+                times[site, operation, "backend"] = seconds - network
+            else:
+                times[site, operation, phase] = seconds
+        return times
+
+    def collapsed(self):
+        """
+        Returns the lines of a collapsed stack file, as used by flamegraph.pl or speedscope, with the stacks
+        call site;operation;phase and the time in microseconds.
+        """
+        lines = []
+        for (site, operation, phase), seconds in sorted(self.phase_times().items()):
+            microseconds = int(round(seconds * 1e6))
+            if microseconds > 0:
+                lines.append("{};{};{} {}".format(site, operation, phase, microseconds))
+        return lines
+
+    def write_collapsed(self, path):
+        """Writes the collapsed stacks (see collapsed) to a file."""
+        with open(path, "w") as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
+
+    def summary(self, by="operation"):
+        """
+        Returns a table with the time per phase in milliseconds, per operation (by='operation') or per call site
+        (by='site'), followed by the totals and whether the time is mostly spent waiting for the backend or in
+        the client.
+        """
+        if by not in ("operation", "site"):
+            raise ValueError("Can only summarize by 'operation' or 'site'")
+        times = self.phase_times()
+        phases = [phase for phase in _PHASE_ORDER if any(key[2] == phase for key in times)]
+
+        rows = defaultdict(lambda: defaultdict(float))
+        calls = defaultdict(int)
+        for (site, operation, phase), seconds in times.items():
+            rows[operation if by == "operation" else site][phase] += seconds
+        for (site, operation), num_calls in self.calls.items():
+            calls[operation if by == "operation" else site] += num_calls
+
+        width = max([len(by)] + [len(key) for key in rows])
+        header = "{:<{}} {:>8}".format(by, width, "calls") + "".join(" {:>10}".format(p) for p in phases)
+        lines = [header + " {:>10}".format("total"), "-" * (len(header) + 11)]
+        totals = defaultdict(float)
+        for key, row in sorted(rows.items(), key=lambda item: -sum(item[1].values())):
+            line = "{:<{}} {:>8}".format(key, width, calls[key])
+            for phase in phases:
+                line += " {:>10.3f}".format(row[phase] * 1e3)
+                totals[phase] += row[phase]
+            lines.append(line + " {:>10.3f}".format(sum(row.values()) * 1e3))
+        line = "{:<{}} {:>8}".format("total", width, sum(calls.values()))
+        for phase in phases:
+            line += " {:>10.3f}".format(totals[phase] * 1e3)
+        total = sum(totals.values())
+        lines.append(line + " {:>10.3f}".format(total * 1e3))
+
+        lines.append("")
+        lines.append("Wall time {:.3f} ms, of which {:.3f} ms outside of CQC calls.".format(
+            self.wall_time * 1e3, max(self.wall_time - total, 0.0) * 1e3))
+        waiting = totals["wait"] + totals["network"] + totals["backend"]
+        if total > 0:
+            bound = "waiting for the backend (round-trips)" if waiting > totals["client"] else "the client (CPU)"
+            lines.append("{:.0f}% of the time in CQC calls is spent waiting for the backend, so the program is bound "
+                         "by {}.".format(100 * waiting / total, bound))
+        return "\n".join(lines)
@@ -60,6 +60,8 @@ class qubit:
     A qubit.
     """
 
+    __slots__ = ("_cqc", "notify", "_active", "_qID", "_entInfo", "_remote_entNode")
+
     def __init__(self, cqc, notify=True, block=True, createNew=True, q_id=None, entInfo=None):
         """
         Initializes the qubit. The cqc connection must be given.
@@ -81,8 +83,9 @@ class qubit:
         self.notify = cqc.notify
 
         # Check if the cqc connection was openened using a 'with' statement
-        # If not, raise a deprecation warning
-        if not self._cqc._opened_with_with:
+        # If not, log a deprecation message (once per connection)
+        if not self._cqc._opened_with_with and not self._cqc._logged_with_info:
+            self._cqc._logged_with_info = True
             logging.info(
                 "You should open CQCConnection in a context, i.e. using 'with CQCConnection(...) as cqc:'. "
                 "Then qubits will be automatically released by the end of the program, independently of what happens. "
@@ -94,7 +97,7 @@ class qubit:
 
         if createNew:
             # print info
-            logging.debug("App {} tells CQC: 'Create qubit'".format(self._cqc.name))
+            logging.debug("App %s tells CQC: 'Create qubit'", self._cqc.name)
 
             # Create new qubit at the cqc server
             # TODO how to handle pending headers
@@ -119,6 +122,34 @@ class qubit:
         # Entanglement information
         self._set_entanglement_info(entInfo)
 
+    @classmethod
+    def _from_backend(cls, cqc, q_id, ent_info=None):
+        """
+        Returns an active qubit object for a qubit which the backend already created, for example
+        as a response to a factory or an EPR request. Skips the checks and logging of __init__.
+
+        - **Arguments**
+
+            :cqc:         The CQCconnection used
+            :q_id:         Qubit id given by the backend
+            :ent_info:     Entanglement information, if qubit is part of EPR-pair
+        """
+        q = cls.__new__(cls)
+        q._init_from_backend(cqc, q_id)
+        if ent_info is None:
+            q._entInfo = None
+            q._remote_entNode = None
+        else:
+            q._set_entanglement_info(ent_info)
+        return q
+
+    def _init_from_backend(self, cqc, q_id):
+        self._cqc = cqc
+        self.notify = cqc.notify
+        self._qID = q_id
+        self._active = True
+        cqc._active_qubits[q_id] = self
+
     def __str__(self):
         if self.active:
             return "Qubit at the node {}".format(self._cqc.name)
@@ -134,7 +165,7 @@ class qubit:
 
         # Lookup remote entangled node
         self._remote_entNode = None
-        if self._entInfo:
+        if ent_info is not None:
             ip = self._entInfo.node_B
             port = self._entInfo.port_B
             try:
@@ -194,11 +225,11 @@ class qubit:
         if self._active == be_active:
             return
 
+        active_qubits = self._cqc._active_qubits
         if be_active:
-            self._cqc.active_qubits.append(self)
-        else:
-            if self in self._cqc.active_qubits:
-                self._cqc.active_qubits.remove(self)
+            active_qubits[self._qID] = self
+        elif active_qubits.get(self._qID) is self:
+            del active_qubits[self._qID]
         self._active = be_active
 
     def _single_qubit_gate(self, command, notify, block):
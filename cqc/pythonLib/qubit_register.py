@@ -0,0 +1,183 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import numpy as np
+
+from .qubit import qubit
+
+
+class QubitRegister:
+    """
+    A register of qubits on the same connection.
+
+    Operations on the register act on all its qubits and are sent to the backend as one sequence,
+    so they take a single round-trip. If the connection is already pending messages (for example
+    inside a CQCMix), the commands are pended as usual instead.
+
+    Indexing with an int returns a qubit, indexing with a slice, a list of indices or a boolean mask
+    returns a new register with the selected qubits, e.g. ``reg[[0, 2]].X()`` or ``reg[mask].H()``.
+    """
+
+    def __init__(self, cqc, num_qubits=None, qubits=None, notify=True, block=True):
+        """
+        - **Arguments**
+
+            :cqc:           The CQCConnection used
+            :num_qubits:    The number of qubits to allocate (in one ALLOCATE command)
+            :qubits:        Existing qubits to form the register from, instead of allocating new ones
+            :nofify:        Do we wish to be notified when the qubits are allocated.
+            :block:         Do we want the qubits to be blocked
+        """
+        if (num_qubits is None) == (qubits is None):
+            raise ValueError("Specify either num_qubits or qubits")
+        if qubits is None:
+            qubits = cqc.create_qubits(num_qubits, block=block, notify=notify)
+        self._cqc = cqc
+        self._qubits = list(qubits)
+
+    def __len__(self):
+        return len(self._qubits)
+
+    def __iter__(self):
+        return iter(self._qubits)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._qubits[key]
+        if isinstance(key, slice):
+            return QubitRegister(self._cqc, qubits=self._qubits[key])
+        key = np.asarray(key)
+        if key.dtype == bool:
+            if key.shape != (len(self),):
+                raise IndexError("Boolean mask of shape {} does not match register of {} qubits".format(
+                    key.shape, len(self)))
+            key = np.flatnonzero(key)
+        return QubitRegister(self._cqc, qubits=[self._qubits[i] for i in key])
+
+    def __str__(self):
+        return "Register of {} qubits at the node {}".format(len(self), self._cqc.name)
+
+    @property
+    def qubits(self):
+        return list(self._qubits)
+
+    def _sequence(self, pend_commands, aggregate=None):
+        """
+        Calls pend_commands, which puts commands on the connection, and sends these as one sequence.
+        Returns the results of the sequence, or None if the connection was already pending messages.
+        See flush_factory for aggregate.
+        """
+        cqc = self._cqc
+        if cqc.pend_messages:
+            pend_commands()
+            return None
+        cqc.pend_messages = True
+        try:
+            pend_commands()
+            if aggregate is None:
+                return cqc.flush()
+            return cqc.flush_factory(1, aggregate=aggregate)
+        finally:
+            # Also if pending or flushing failed, such that later commands are not pended
+            cqc.reset_pending_headers()
+            cqc.pend_messages = False
+
+    def _single_qubit_gate(self, gate, notify, block):
+        self._sequence(lambda: [gate(q, notify=notify, block=block) for q in self._qubits])
+
+    def I(self, notify=True, block=True):
+        """Performs an identity gate on all qubits."""
+        self._single_qubit_gate(qubit.I, notify, block)
+
+    def X(self, notify=True, block=True):
+        """Performs a X on all qubits."""
+        self._single_qubit_gate(qubit.X, notify, block)
+
+    def Y(self, notify=True, block=True):
+        """Performs a Y on all qubits."""
+        self._single_qubit_gate(qubit.Y, notify, block)
+
+    def Z(self, notify=True, block=True):
+        """Performs a Z on all qubits."""
+        self._single_qubit_gate(qubit.Z, notify, block)
+
+    def T(self, notify=True, block=True):
+        """Performs a T gate on all qubits."""
+        self._single_qubit_gate(qubit.T, notify, block)
+
+    def H(self, notify=True, block=True):
+        """Performs a Hadamard on all qubits."""
+        self._single_qubit_gate(qubit.H, notify, block)
+
+    def K(self, notify=True, block=True):
+        """Performs a K gate on all qubits."""
+        self._single_qubit_gate(qubit.K, notify, block)
+
+    def rot_X(self, step, notify=True, block=True):
+        """Rotates all qubits around the x-axis with the angle of step*2*pi/256 radians."""
+        self._sequence(lambda: [q.rot_X(step, notify=notify, block=block) for q in self._qubits])
+
+    def rot_Y(self, step, notify=True, block=True):
+        """Rotates all qubits around the y-axis with the angle of step*2*pi/256 radians."""
+        self._sequence(lambda: [q.rot_Y(step, notify=notify, block=block) for q in self._qubits])
+
+    def rot_Z(self, step, notify=True, block=True):
+        """Rotates all qubits around the z-axis with the angle of step*2*pi/256 radians."""
+        self._sequence(lambda: [q.rot_Z(step, notify=notify, block=block) for q in self._qubits])
+
+    def cnot(self, targets, notify=True, block=True):
+        """Applies a cnot from every qubit of this register onto the qubit at the same index in targets."""
+        if len(targets) != len(self):
+            raise ValueError("Register of {} qubits cannot be paired with {} targets".format(len(self), len(targets)))
+        self._sequence(lambda: [c.cnot(t, notify=notify, block=block) for c, t in zip(self._qubits, targets)])
+
+    def cnot_chain(self, notify=True, block=True):
+        """Applies a cnot from each qubit onto the next one, e.g. to prepare a GHZ state after H on the first."""
+        self[:-1].cnot(self[1:], notify=notify, block=block)
+
+    def measure_all(self, inplace=False, block=True):
+        """
+        Measures all qubits in the standard basis and returns the outcomes as a numpy array of bits.
+        If the connection is pending messages, the results of the individual measurements are returned as a list.
+
+        - **Arguments**
+
+            :inplace:     If false, measure destructively.
+            :block:         Do we want the qubits to be blocked
+        """
+        if self._cqc.pend_messages:
+            return [q.measure(inplace=inplace, block=block) for q in self._qubits]
+        # The outcomes are sent back bit-packed in a single message
+        outcomes = self._sequence(lambda: [q.measure(inplace=inplace, block=block) for q in self._qubits],
+                                  aggregate="packed")
+        return outcomes[0]
+
+    def release(self, notify=True, block=True):
+        """Releases all qubits with a single message."""
+        self._cqc.release_qubits(self._qubits, notify=notify, block=block)
@@ -0,0 +1,145 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from cqc.cqcHeader import (
+    CQC_CMD_NEW,
+    CQC_CMD_MEASURE,
+    CQC_CMD_MEASURE_INPLACE,
+    CQC_CMD_SEND,
+    CQC_CMD_RECV,
+    CQC_CMD_EPR,
+    CQC_CMD_EPR_RECV,
+    CQC_CMD_ALLOCATE,
+    CQC_CMD_RELEASE,
+)
+from .peephole import _split_sequence
+
+_MEASUREMENTS = {CQC_CMD_MEASURE, CQC_CMD_MEASURE_INPLACE}
+
+# Commands which change the set of qubits, nothing is moved past these
+_BARRIERS = {CQC_CMD_NEW, CQC_CMD_SEND, CQC_CMD_RECV, CQC_CMD_EPR, CQC_CMD_EPR_RECV, CQC_CMD_ALLOCATE, CQC_CMD_RELEASE}
+
+
+class GateScheduler:
+    """
+    Reorders a sequence of pending commands such that independent commands are grouped together.
+
+    The scheduler builds a dependency graph of the commands, where a command depends on the previous
+    commands acting on one of its qubits. The commands are then put in layers of mutually independent
+    commands, where each command is placed in the first layer possible, except for measurements which are
+    placed in the last layer possible. The sequence is sent layer by layer.
+
+    The measurements keep their order, so that the outcomes are returned in the same order as without
+    scheduling. Commands which create, release or send qubits, as well as commands with the action flag set,
+    are never reordered.
+
+    The number of layers of the last scheduled sequence is kept in last_depth.
+    """
+
+    def __init__(self):
+        self.last_depth = 0
+
+    def schedule(self, headers):
+        """
+        Reorders a sequence of command headers, i.e. command headers each followed by their extra header,
+        as pended by CQCHandler outside a CQCMix.
+
+        :param headers: List of headers, which is not modified
+        :return: The reordered list of headers
+        """
+        layers = self.layers(headers)
+        if layers is None:
+            self.last_depth = len(headers)
+            return headers
+        return [header for layer in layers for command in layer for header in command]
+
+    def layers(self, headers):
+        """
+        Puts a sequence of command headers in layers of commands which can be executed in parallel.
+
+        :param headers: List of headers, which is not modified
+        :return: List of layers, each a list of commands, each a list of headers. None if the headers
+                 are not a sequence of commands.
+        """
+        commands = _split_sequence(headers)
+        if commands is None:
+            return None
+
+        # Dependencies between the commands, by index
+        successors = [[] for _ in commands]
+        layer_of = [0] * len(commands)
+
+        # The last command on each qubit, the last measurement and the last barrier
+        last_on_qubit = {}
+        last_measurement = None
+        last_barrier = None
+        # The commands since the last barrier
+        since_barrier = []
+
+        for index, command in enumerate(commands):
+            cmd = command.cmd
+            is_barrier = cmd.action or cmd.instr in _BARRIERS
+            if is_barrier:
+                dependencies = set(since_barrier)
+                last_on_qubit = {}
+                last_measurement = None
+                since_barrier = []
+            else:
+                dependencies = {last_on_qubit[qubit_id] for qubit_id in command.qubits if qubit_id in last_on_qubit}
+                if cmd.instr in _MEASUREMENTS:
+                    if last_measurement is not None:
+                        dependencies.add(last_measurement)
+                    last_measurement = index
+                for qubit_id in command.qubits:
+                    last_on_qubit[qubit_id] = index
+                since_barrier.append(index)
+            if last_barrier is not None:
+                dependencies.add(last_barrier)
+            if is_barrier:
+                last_barrier = index
+
+            for dependency in dependencies:
+                successors[dependency].append(index)
+                layer_of[index] = max(layer_of[index], layer_of[dependency] + 1)
+
+        depth = max(layer_of, default=-1) + 1
+
+        # Move measurements to the last layer possible. Going backwards, the layers of the successors are final.
+        for index in reversed(range(len(commands))):
+            if commands[index].cmd.instr in _MEASUREMENTS:
+                layer_of[index] = min((layer_of[successor] for successor in successors[index]), default=depth) - 1
+
+        layers = [[] for _ in range(depth)]
+        for index, command in enumerate(commands):
+            layers[layer_of[index]].append(command.headers)
+        # Moving the measurements can leave layers empty
+        layers = [layer for layer in layers if layer]
+
+        self.last_depth = len(layers)
+        return layers
@@ -78,6 +78,10 @@ class CQCTimeoutError(CQCGeneralError):
     pass
 
 
+class CQCCancelledError(CQCGeneralError):
+    pass
+
+
 class CQCInuseError(CQCGeneralError):
     pass
 
@@ -1,4 +1,3 @@
-from cqc.pythonLib import qubit
 import numpy as np
 
 
@@ -12,11 +11,7 @@ def initialize_Qubit_register(num_qubit, Owner):
     :param Owner: The owner of the qubit / CQCConnection.
     """
 
-    qubits = []
-    for x in range(0, num_qubit):
-        one_more_qubit = qubit(Owner)
-        qubits.append(one_more_qubit)
-    return qubits
+    return Owner.create_qubits(num_qubit)
 
 
 def create_Nqubit_Wstate(num_qubit, Owner):
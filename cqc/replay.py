@@ -0,0 +1,273 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Replays a binary CQC trace, for example written by CQCToFile, against a CQC backend.
+
+Can be used as a library through `replay_trace` or from the command line:
+
+    python -m cqc.replay TRACE --host HOST --port PORT [--rate RATE]
+"""
+
+import sys
+import time
+import struct
+import logging
+import argparse
+
+from cqc.cqcHeader import (
+    CQCHeader,
+    CQCCmdHeader,
+    CQCFactoryHeader,
+    CQCXtraQubitHeader,
+    CQCType,
+    CQC_CMD_NEW,
+    CQC_CMD_MEASURE,
+    CQC_CMD_MEASURE_INPLACE,
+    CQC_CMD_RECV,
+    CQC_CMD_EPR,
+    CQC_CMD_EPR_RECV,
+    CQC_CMD_ALLOCATE,
+)
+from cqc.trace import CQCTraceReader
+from cqc.util import iter_cqc_headers
+
+# Commands for which the qubit ID in the command header is not the ID of an existing qubit
+_QUBIT_CREATING_COMMANDS = {CQC_CMD_NEW, CQC_CMD_RECV, CQC_CMD_EPR, CQC_CMD_EPR_RECV, CQC_CMD_ALLOCATE}
+
+# Commands which get a message back (apart from the notify)
+_RETURNING_COMMANDS = {
+    CQC_CMD_NEW,
+    CQC_CMD_MEASURE,
+    CQC_CMD_MEASURE_INPLACE,
+    CQC_CMD_RECV,
+    CQC_CMD_EPR_RECV,
+    CQC_CMD_EPR,
+}
+
+# Messages sent back when a qubit is created, in the order the qubit IDs were given out while recording
+_QUBIT_CREATED_REPLIES = {CQCType.NEW_OK, CQCType.RECV, CQCType.EPR_OK}
+
+
+class ReplayResult:
+    """Outcome of a replay: the latency of each message and any errors returned by the backend."""
+
+    def __init__(self):
+        # Seconds from sending each message until its last expected reply was received
+        self.latencies = []
+        # (message index, error) for every message the backend returned an error for
+        self.errors = []
+        self.duration = 0.0
+
+    @property
+    def num_messages(self):
+        return len(self.latencies)
+
+    def percentile(self, q):
+        """Latency percentile, q in [0, 100]"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        """Produce a printable summary of the replay."""
+        if self.num_messages == 0:
+            return "No messages replayed"
+        mean = sum(self.latencies) / self.num_messages
+        rate = self.num_messages / self.duration if self.duration > 0 else float('inf')
+        return (
+            "Replayed {} messages in {:.3f} s ({:.1f} msg/s), {} errors\n"
+            "Latency: mean {:.3f} ms | p50 {:.3f} ms | p99 {:.3f} ms | max {:.3f} ms".format(
+                self.num_messages, self.duration, rate, len(self.errors),
+                1e3 * mean, 1e3 * self.percentile(50), 1e3 * self.percentile(99), 1e3 * max(self.latencies),
+            )
+        )
+
+
+def expected_replies(events):
+    """
+    Computes how many messages the backend sends back for a message, given the CQCHeaderEvents of the message.
+    """
+    cqc_header = events[0].header
+    tp = cqc_header.tp
+    if tp in (CQCType.MIX, CQCType.HELLO, CQCType.GET_TIME):
+        return 1
+    if tp not in (CQCType.COMMAND, CQCType.FACTORY):
+        return 0
+
+    num_iter = 1
+    notify = False
+    num_returns = 0
+    for event in events[1:]:
+        header = event.header
+        if isinstance(header, CQCFactoryHeader):
+            num_iter = header.num_iter
+            notify = header.notify
+        elif isinstance(header, CQCCmdHeader):
+            if tp == CQCType.COMMAND:
+                notify = notify or header.notify
+            if header.instr == CQC_CMD_ALLOCATE:
+                num_returns += header.qubit_id
+            elif header.instr in _RETURNING_COMMANDS:
+                num_returns += 1
+    return num_iter * num_returns + int(bool(notify))
+
+
+class _QubitIDMap:
+    """
+    Maps the qubit IDs of the trace to the qubit IDs given out by the backend.
+
+    The IDs in the trace are assumed to be given out in the same order as the backend creates qubits,
+    which is the case for traces written by CQCToFile.
+    """
+
+    def __init__(self):
+        self._map = {}
+        self._created = 0
+
+    def add(self, backend_id):
+        self._map[self._created] = backend_id
+        self._created += 1
+
+    def get(self, trace_id):
+        return self._map.get(trace_id, trace_id)
+
+
+def rewrite_message(data, events, app_id, qubit_ids=None):
+    """
+    Returns a copy of the message with the app ID replaced and, if qubit_ids is given, the qubit IDs mapped.
+    """
+    msg = bytearray(data)
+    for event in events:
+        header = event.header
+        if isinstance(header, CQCHeader):
+            struct.pack_into("!H", msg, event.offset + 2, app_id)
+        elif qubit_ids is None:
+            continue
+        elif isinstance(header, CQCCmdHeader):
+            if header.instr not in _QUBIT_CREATING_COMMANDS:
+                struct.pack_into("!H", msg, event.offset, qubit_ids.get(header.qubit_id))
+        elif isinstance(header, CQCXtraQubitHeader):
+            struct.pack_into("!H", msg, event.offset, qubit_ids.get(header.qubit_id))
+    return bytes(msg)
+
+
+def replay_trace(trace, cqc, rate=None, rewrite_qubit_ids=True, start=0, stop=None):
+    """
+    Sends the messages of a recorded trace to the backend of the given connection and
+    waits for the replies of each message before sending the next.
+
+    - **Arguments**
+
+        :trace:             Path to a binary trace or a CQCTraceReader
+        :cqc:               A CQCConnection (or any handler with commit and readMessage) to send the messages over
+        :rate:              Messages per second to send at, or None to send as fast as possible
+        :rewrite_qubit_ids: Whether to replace the qubit IDs of the trace by the ones given by the backend
+        :start:             Position of the first message to replay
+        :stop:              Position to stop at, None to replay until the end
+    """
+    if isinstance(trace, CQCTraceReader):
+        reader = trace
+        close_reader = False
+    else:
+        reader = CQCTraceReader(trace)
+        close_reader = True
+
+    result = ReplayResult()
+    qubit_ids = _QubitIDMap() if rewrite_qubit_ids else None
+    app_id = cqc.get_appID()
+    interval = None if rate is None else 1.0 / rate
+    t_start = time.perf_counter()
+    try:
+        for i, message in enumerate(reader.iter_messages(start=start)):
+            if stop is not None and message.index >= stop:
+                break
+            if interval is not None:
+                delay = t_start + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            events = list(iter_cqc_headers(message.data))
+            msg = rewrite_message(message.data, events, app_id, qubit_ids)
+            num_replies = expected_replies(events)
+
+            t_sent = time.perf_counter()
+            cqc.commit(msg)
+            try:
+                for _ in range(num_replies):
+                    reply = cqc.readMessage()
+                    if qubit_ids is not None and reply[0].tp in _QUBIT_CREATED_REPLIES:
+                        qubit_ids.add(reply[1].qubit_id)
+            except Exception as err:
+                # The backend stops processing a message after an error
+                logging.warning("Replay: message %s got error %s", message.index, err)
+                result.errors.append((message.index, err))
+            result.latencies.append(time.perf_counter() - t_sent)
+    finally:
+        result.duration = time.perf_counter() - t_start
+        if close_reader:
+            reader.close()
+
+    return result
+
+
+def main(argv=None):
+    from cqc.pythonLib import CQCConnection
+
+    parser = argparse.ArgumentParser(prog="python -m cqc.replay", description="Replay a binary CQC trace")
+    parser.add_argument("trace", help="Binary trace, e.g. written by CQCToFile")
+    parser.add_argument("--host", default="localhost", help="Host of the CQC backend")
+    parser.add_argument("--port", type=int, required=True, help="Port of the CQC backend")
+    parser.add_argument("--name", default="Replay", help="Name of the connection")
+    parser.add_argument("--app-id", type=int, default=None, help="App ID to use, by default an unused one")
+    parser.add_argument("--rate", type=float, default=None, help="Messages per second, default as fast as possible")
+    parser.add_argument("--start", type=int, default=0, help="Position of the first message to replay")
+    parser.add_argument("--stop", type=int, default=None, help="Position of the message to stop at")
+    parser.add_argument("--keep-qubit-ids", action="store_true",
+                        help="Send the qubit IDs of the trace as they are, instead of the IDs given by the backend")
+    args = parser.parse_args(argv)
+
+    with CQCConnection(args.name, socket_address=(args.host, args.port), appID=args.app_id,
+                       use_classical_communication=False) as cqc:
+        result = replay_trace(
+            args.trace,
+            cqc,
+            rate=args.rate,
+            rewrite_qubit_ids=not args.keep_qubit_ids,
+            start=args.start,
+            stop=args.stop,
+        )
+    print(result.summary())
+    return 1 if result.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
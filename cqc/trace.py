@@ -0,0 +1,211 @@
+#
+# Copyright (c) 2017, Stephanie Wehner and Axel Dahlberg
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. All advertising materials mentioning features or use of this software
+#    must display the following acknowledgement:
+#    This product includes software developed by Stephanie Wehner, QuTech.
+# 4. Neither the name of the QuTech organization nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDER ''AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES
+# LOSS OF USE, DATA, OR PROFITS OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import mmap
+import struct
+from array import array
+from collections import namedtuple
+
+from cqc.cqcHeader import CQCHeader
+from cqc.util import parse_cqc_message, iter_cqc_headers
+
+# A top-level CQC message in a trace.
+# index: the position of the message in the trace
+# offset: the byte offset of the CQC header of the message in the file
+# header: the CQCHeader of the message
+# data: the complete message (including the CQC header) as bytes
+CQCTraceMessage = namedtuple("CQCTraceMessage", ["index", "offset", "header", "data"])
+
+_COMPRESSED_MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+}
+
+
+class CQCTraceReader:
+    """
+    Reads a binary trace of CQC messages, for example written by CQCToFile.
+
+    The file is memory-mapped and messages are read lazily, so traces larger than the available
+    memory can be inspected. An index of the offsets of the top-level messages can be stored
+    next to the trace (with INDEX_SUFFIX appended to the file name), such that a message can be
+    looked up by its position without scanning the trace.
+    """
+
+    INDEX_SUFFIX = ".idx"
+    INDEX_MAGIC = b"CQCIDX01"
+    INDEX_HDR_FORMAT = "!8sQQ"
+
+    def __init__(self, file, use_index=True):
+        """
+        - **Arguments**
+
+            :file:          Path to the trace file
+            :use_index:     Whether to read/write the sidecar index when random access is needed.
+        """
+        self.file = file
+        self.use_index = use_index
+        self._offsets = None
+
+        self._f = open(file, 'rb')
+        self._size = os.fstat(self._f.fileno()).st_size
+        if self._size > 0:
+            self._data = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # An empty file cannot be memory-mapped
+            self._data = b''
+
+        for magic, compression in _COMPRESSED_MAGIC.items():
+            if self._data[:len(magic)] == magic:
+                self.close()
+                raise ValueError("The trace {} is compressed with {}, decompress it first".format(file, compression))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Closes the memory-map and the file."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b''
+        self._f.close()
+
+    @property
+    def index_file(self):
+        return self.file + self.INDEX_SUFFIX
+
+    def _read_header(self, offset):
+        if offset + CQCHeader.HDR_LENGTH > self._size:
+            raise ValueError("Incomplete CQC header at offset {} in {}".format(offset, self.file))
+        return CQCHeader(self._data[offset:offset + CQCHeader.HDR_LENGTH])
+
+    def iter_offsets(self):
+        """
+        Yields the offsets and CQC headers of all top-level messages by jumping from header to header.
+        Only the CQC headers are read.
+        """
+        offset = 0
+        while offset < self._size:
+            header = self._read_header(offset)
+            end = offset + CQCHeader.HDR_LENGTH + header.length
+            if end > self._size:
+                raise ValueError("Incomplete CQC message at offset {} in {}".format(offset, self.file))
+            yield offset, header
+            offset = end
+
+    def __iter__(self):
+        for index, (offset, header) in enumerate(self.iter_offsets()):
+            yield self._make_message(index, offset, header)
+
+    def _make_message(self, index, offset, header):
+        end = offset + CQCHeader.HDR_LENGTH + header.length
+        return CQCTraceMessage(index, offset, header, self._data[offset:end])
+
+    @property
+    def offsets(self):
+        """The offsets of all top-level messages, read from the sidecar index or built if needed."""
+        if self._offsets is None:
+            if self.use_index:
+                self._offsets = self._load_index()
+            if self._offsets is None:
+                self.build_index()
+        return self._offsets
+
+    def build_index(self):
+        """Scans the trace for the offsets of the top-level messages and stores them in the sidecar index."""
+        self._offsets = array('Q', (offset for offset, _ in self.iter_offsets()))
+        if self.use_index:
+            self._write_index()
+        return self._offsets
+
+    def _write_index(self):
+        offsets = array('Q', self._offsets)
+        if sys.byteorder == 'little':
+            offsets.byteswap()
+        with open(self.index_file, 'wb') as f:
+            f.write(struct.pack(self.INDEX_HDR_FORMAT, self.INDEX_MAGIC, self._size, len(offsets)))
+            f.write(offsets.tobytes())
+
+    def _load_index(self):
+        """Loads the sidecar index, returns None if it does not exist or does not belong to the trace."""
+        try:
+            with open(self.index_file, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        hdr_length = struct.calcsize(self.INDEX_HDR_FORMAT)
+        if len(raw) < hdr_length:
+            return None
+        magic, size, num_messages = struct.unpack(self.INDEX_HDR_FORMAT, raw[:hdr_length])
+        # The index is outdated if the trace has changed size since it was written
+        if magic != self.INDEX_MAGIC or size != self._size:
+            return None
+        offsets = array('Q')
+        offsets.frombytes(raw[hdr_length:])
+        if sys.byteorder == 'little':
+            offsets.byteswap()
+        if len(offsets) != num_messages:
+            return None
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        """Returns the message at the given position as a CQCTraceMessage."""
+        offsets = self.offsets
+        if index < 0:
+            index += len(offsets)
+        if not 0 <= index < len(offsets):
+            raise IndexError("Message index {} out of range".format(index))
+        offset = offsets[index]
+        return self._make_message(index, offset, self._read_header(offset))
+
+    def iter_messages(self, start=0):
+        """Yields the messages from position start onwards, seeking to start using the index."""
+        if start == 0:
+            yield from self
+            return
+        offsets = self.offsets
+        for index in range(start, len(offsets)):
+            offset = offsets[index]
+            yield self._make_message(index, offset, self._read_header(offset))
+
+    def headers(self, index):
+        """Returns all headers of the message at the given position."""
+        return parse_cqc_message(self[index].data)
+
+    def iter_headers(self):
+        """Yields a CQCHeaderEvent for every header in the trace, with offsets in the file."""
+        return iter_cqc_headers(self._data, 0, self._size)
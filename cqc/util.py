@@ -27,6 +27,8 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from collections import namedtuple
+
 from cqc.cqcHeader import (
     CQCCmdHeader,
     CQCHeader,
@@ -34,67 +36,310 @@ from cqc.cqcHeader import (
     CQCAssignHeader,
     CQCFactoryHeader,
     CQCIfHeader,
+    CQCIfExprHeader,
+    CQCAssignExprHeader,
+    CQCExprHeader,
+    CQCXtraHeader,
     CQCXtraQubitHeader,
+    CQCRotationHeader,
+    CQCCommunicationHeader,
+    CQCMeasOutHeader,
+    CQCMeasSummaryHeader,
+    CQCMeasCountHeader,
+    CQCPackedMeasOutHeader,
+    CQCTimeinfoHeader,
     CQCType,
+    CQC_CMD_SEND,
+    CQC_CMD_EPR,
     CQC_CMD_CNOT,
     CQC_CMD_CPHASE,
+    CQC_CMD_ROT_X,
+    CQC_CMD_ROT_Y,
+    CQC_CMD_ROT_Z,
     CQC_CMD_MEASURE,
     CQC_CMD_MEASURE_INPLACE,
 )
+from cqc.entInfoHeader import EntInfoHeader
+
+# A header found by the parser.
+# offset: the byte offset of the header in the parsed buffer (or stream)
+# depth: 0 for the CQC header of a message, and increasing for headers nested inside bodies
+# header: the header object
+CQCHeaderEvent = namedtuple("CQCHeaderEvent", ["offset", "depth", "header"])
+
+# Headers following the CQC header in messages sent back from the backend
+_REPLY_HEADERS = {
+    CQCType.NEW_OK: (CQCXtraQubitHeader,),
+    CQCType.RECV: (CQCXtraQubitHeader,),
+    CQCType.EXPIRE: (CQCXtraQubitHeader,),
+    CQCType.EPR_OK: (CQCXtraQubitHeader, EntInfoHeader),
+    CQCType.MEASOUT: (CQCMeasOutHeader,),
+    CQCType.INF_TIME: (CQCTimeinfoHeader,),
+}
+
+# Extra headers following a command header, for CQC version >= 1
+_COMMAND_XTRA_HEADERS = {
+    CQC_CMD_SEND: CQCCommunicationHeader,
+    CQC_CMD_EPR: CQCCommunicationHeader,
+    CQC_CMD_CNOT: CQCXtraQubitHeader,
+    CQC_CMD_CPHASE: CQCXtraQubitHeader,
+    CQC_CMD_ROT_X: CQCRotationHeader,
+    CQC_CMD_ROT_Y: CQCRotationHeader,
+    CQC_CMD_ROT_Z: CQCRotationHeader,
+    CQC_CMD_MEASURE: CQCAssignHeader,
+    CQC_CMD_MEASURE_INPLACE: CQCAssignHeader,
+}
+
+
+# Headers following the type header of an IF in a mix program, these announce the length of the body
+_IF_HEADERS = {
+    CQCType.IF: CQCIfHeader,
+    CQCType.IF_EXPR: CQCIfExprHeader,
+}
+
+
+class CQCIncompleteMessageError(ValueError):
+    pass
 
 
 def parse_cqc_message(msg):
-    # TODO finish parser
-    hdr_map = {
-        CQCType.HELLO: None,
-        CQCType.COMMAND: CQCCmdHeader,
-        CQCType.MIX: CQCTypeHeader,
-        CQCType.IF: CQCIfHeader,
-        CQCType.FACTORY: CQCFactoryHeader,
-    }
-    headers = []
-    next_hdr = CQCHeader
-    bits_to_next_first_hdr = 0
-    is_mix = False
-    while len(msg) > 0:
-        hdr = extract_header(msg, next_hdr)
-        headers.append(hdr)
-        next_hdr = None
-        msg = msg[hdr.HDR_LENGTH:]
-        if isinstance(hdr, CQCHeader):
-            bits_to_next_first_hdr = hdr.length
-            next_hdr = hdr_map[hdr.tp]
-            is_mix = hdr.tp == CQCType.MIX
-        else:
-            if isinstance(hdr, CQCCmdHeader):
-                if hdr.instr in [CQC_CMD_MEASURE, CQC_CMD_MEASURE_INPLACE]:
-                    next_hdr = CQCAssignHeader
-                if hdr.instr in [CQC_CMD_CNOT, CQC_CMD_CPHASE]:
-                    next_hdr = CQCXtraQubitHeader
-            elif isinstance(hdr, CQCTypeHeader):
-                next_hdr = hdr_map[hdr.type]
-            elif isinstance(hdr, CQCAssignHeader):
-                pass
-            elif isinstance(hdr, CQCIfHeader):
-                pass
-            elif isinstance(hdr, CQCXtraQubitHeader):
-                pass
-            elif isinstance(hdr, CQCFactoryHeader):
-                next_hdr = CQCCmdHeader
+    """
+    Parses one or more complete CQC messages and returns a flat list of all the headers.
+    """
+    return [event.header for event in iter_cqc_headers(msg)]
+
+
+def iter_cqc_headers(data, offset=0, end=None):
+    """
+    Generator yielding a CQCHeaderEvent for every header of the complete CQC messages in data[offset:end].
+    Nested bodies (mix programs, if-bodies, factories) are walked recursively.
+
+    :param data: bytes-like object (bytes, bytearray, memoryview, mmap)
+    :param offset: int
+        Where the first CQC header starts
+    :param end: int or None
+        Where the last message ends, defaults to the end of data
+    """
+    if end is None:
+        end = len(data)
+    while offset < end:
+        cqc_header = extract_header(data, CQCHeader, offset, end)
+        yield CQCHeaderEvent(offset, 0, cqc_header)
+        body_start = offset + CQCHeader.HDR_LENGTH
+        body_end = body_start + cqc_header.length
+        if body_end > end:
+            raise CQCIncompleteMessageError("Incomplete CQC message at offset {}".format(offset))
+        yield from _iter_body(data, cqc_header.tp, body_start, body_end, 1, cqc_header.version)
+        offset = body_end
+
+
+def _iter_body(data, tp, offset, end, depth, version):
+    """Yields the headers of a body of the given type in data[offset:end]"""
+    if tp in (CQCType.COMMAND, CQCType.GET_TIME):
+        yield from _iter_commands(data, offset, end, depth, version)
+    elif tp == CQCType.FACTORY:
+        factory_header = extract_header(data, CQCFactoryHeader, offset, end)
+        yield CQCHeaderEvent(offset, depth, factory_header)
+        yield from _iter_commands(data, offset + CQCFactoryHeader.HDR_LENGTH, end, depth, version)
+    elif tp == CQCType.MIX:
+        while offset < end:
+            type_header = extract_header(data, CQCTypeHeader, offset, end)
+            yield CQCHeaderEvent(offset, depth, type_header)
+            offset += CQCTypeHeader.HDR_LENGTH
+            if type_header.type in (CQCType.IF, CQCType.IF_EXPR):
+                yield from _iter_body(data, type_header.type, offset, offset + type_header.length, depth + 1, version)
+                if_header = extract_header(data, _IF_HEADERS[type_header.type], offset, end)
+                offset += type_header.length
+                # The body of the IF follows the IF header and is itself a sequence of type headers
+                yield from _iter_body(data, CQCType.MIX, offset, offset + if_header.length, depth + 1, version)
+                offset += if_header.length
             else:
-                raise NotImplementedError("for {}".format(hdr))
-            bits_to_next_first_hdr -= hdr.HDR_LENGTH
-        if bits_to_next_first_hdr <= 0:
-            next_hdr = CQCHeader
-        if next_hdr is None:
-            if is_mix:
-                next_hdr = CQCTypeHeader
+                yield from _iter_body(data, type_header.type, offset, offset + type_header.length, depth + 1, version)
+                offset += type_header.length
+    elif tp == CQCType.IF:
+        if_header = extract_header(data, CQCIfHeader, offset, end)
+        yield CQCHeaderEvent(offset, depth, if_header)
+    elif tp in (CQCType.IF_EXPR, CQCType.ASSIGN_EXPR):
+        header_class = CQCIfExprHeader if tp == CQCType.IF_EXPR else CQCAssignExprHeader
+        header = extract_header(data, header_class, offset, end)
+        yield CQCHeaderEvent(offset, depth, header)
+        offset += header_class.HDR_LENGTH
+        # The header is followed by the instructions of the expression
+        expr_end = offset + header.expr_length
+        while offset < expr_end:
+            yield CQCHeaderEvent(offset, depth, extract_header(data, CQCExprHeader, offset, end))
+            offset += CQCExprHeader.HDR_LENGTH
+    elif tp == CQCType.MEASOUT_SUMMARY:
+        yield from _iter_measurement_summary(data, offset, end, depth)
+    elif tp == CQCType.MEASOUT_PACKED:
+        # The packed outcomes following the header are no headers
+        yield CQCHeaderEvent(offset, depth, extract_header(data, CQCPackedMeasOutHeader, offset, end))
+    elif tp in _REPLY_HEADERS:
+        if offset == end:
+            # A reply without a body, as readMessage always accepted
+            return
+        for header_class in _REPLY_HEADERS[tp]:
+            header = extract_header(data, header_class, offset, end)
+            yield CQCHeaderEvent(offset, depth, header)
+            offset += header_class.HDR_LENGTH
+    elif offset < end:
+        raise ValueError("Cannot parse body of CQC type {}".format(tp))
+
+
+def _iter_commands(data, offset, end, depth, version):
+    """Yields command headers and their extra headers in data[offset:end]"""
+    while offset < end:
+        cmd_header = extract_header(data, CQCCmdHeader, offset, end)
+        yield CQCHeaderEvent(offset, depth, cmd_header)
+        offset += CQCCmdHeader.HDR_LENGTH
+        xtra_class = command_xtra_header_class(cmd_header, version)
+        if xtra_class is not None:
+            if xtra_class is CQCCommunicationHeader:
+                xtra_header = extract_header(data, xtra_class, offset, end, cqc_version=version)
             else:
-                next_hdr = CQCCmdHeader
+                xtra_header = extract_header(data, xtra_class, offset, end)
+            yield CQCHeaderEvent(offset, depth, xtra_header)
+            offset += xtra_class.HDR_LENGTH
+
+
+def _iter_measurement_summary(data, offset, end, depth):
+    """Yields the summary header and the count headers of an aggregated measurement reply in data[offset:end]"""
+    summary_header = extract_header(data, CQCMeasSummaryHeader, offset, end)
+    yield CQCHeaderEvent(offset, depth, summary_header)
+    offset += CQCMeasSummaryHeader.HDR_LENGTH
+    for _ in range(summary_header.num_entries):
+        yield CQCHeaderEvent(offset, depth, extract_header(data, CQCMeasCountHeader, offset, end))
+        offset += CQCMeasCountHeader.HDR_LENGTH
 
-    return headers
 
+def command_xtra_header_class(cmd_header, version):
+    """Returns the class of the extra header following the given command header, or None if there is none."""
+    if version < 1:
+        if cmd_header.action or cmd_header.instr in _COMMAND_XTRA_HEADERS:
+            return CQCXtraHeader
+        return None
+    return _COMMAND_XTRA_HEADERS.get(cmd_header.instr)
 
-def extract_header(msg, hdr_class):
-    hdr = hdr_class(msg[:hdr_class.HDR_LENGTH])
+
+def extract_header(msg, hdr_class, offset=0, end=None, **kwargs):
+    if end is None:
+        end = len(msg)
+    if offset + hdr_class.HDR_LENGTH > end:
+        raise CQCIncompleteMessageError("Not enough data for a {} at offset {}".format(hdr_class.__name__, offset))
+    hdr = hdr_class(bytes(msg[offset:offset + hdr_class.HDR_LENGTH]), **kwargs)
     return hdr
+
+
+def parse_reply(header, body):
+    """
+    Parses the body of a message sent back from the backend.
+
+    Returns (CQCHeader, None, None), (CQCHeader, CQCHeader, None) or (CQCHeader, CQCHeader, EntInfoHeader)
+    depending on the type of message, as expected from CQCConnection.readMessage.
+    A MEASOUT_SUMMARY is returned as (CQCHeader, CQCMeasSummaryHeader, list of CQCMeasCountHeader) and
+    a MEASOUT_PACKED as (CQCHeader, CQCPackedMeasOutHeader, bytes of packed outcomes).
+    A message without a body is returned as (CQCHeader, None, None), whatever its type.
+    """
+    if header.length == 0:
+        return header, None, None
+    if header.tp == CQCType.MEASOUT_PACKED:
+        packed_header = extract_header(body, CQCPackedMeasOutHeader)
+        start = CQCPackedMeasOutHeader.HDR_LENGTH
+        return header, packed_header, bytes(body[start:start + packed_header.payload_length])
+    if header.tp == CQCType.MEASOUT_SUMMARY:
+        events = _iter_measurement_summary(body, 0, len(body), 1)
+        summary_header = next(events).header
+        return header, summary_header, [event.header for event in events]
+    headers = [header, None, None]
+    offset = 0
+    for i, header_class in enumerate(_REPLY_HEADERS.get(header.tp, ())):
+        headers[i + 1] = extract_header(body, header_class, offset)
+        offset += header_class.HDR_LENGTH
+    return tuple(headers)
+
+
+class CQCMessageReader:
+    """
+    Incrementally splits a stream of bytes into complete top-level CQC messages.
+
+    Feed the received data with `feed` and take out complete messages with `next_message`, `messages`
+    or `events`. Data of incomplete messages is kept until the rest is fed.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        # Position of the first unread byte in the buffer
+        self._pos = 0
+        # Number of bytes of the stream removed from the front of the buffer
+        self._discarded = 0
+
+    def __len__(self):
+        """Number of buffered bytes that are not yet part of a returned message."""
+        return len(self._buf) - self._pos
+
+    def feed(self, data):
+        """Adds received data to the buffer."""
+        if self._pos > 0 and self._pos * 2 >= len(self._buf):
+            # Drop the consumed part of the buffer, at most once per half a buffer, to avoid quadratic copying
+            del self._buf[:self._pos]
+            self._discarded += self._pos
+            self._pos = 0
+        self._buf += data
+
+    def _peek_header(self):
+        if len(self) < CQCHeader.HDR_LENGTH:
+            return None
+        header = CQCHeader(bytes(self._buf[self._pos:self._pos + CQCHeader.HDR_LENGTH]))
+        if len(self) < CQCHeader.HDR_LENGTH + header.length:
+            return None
+        return header
+
+    def next_message(self):
+        """Returns the next complete message as (CQCHeader, body) or None if there is none yet."""
+        header = self._peek_header()
+        if header is None:
+            return None
+        start = self._pos + CQCHeader.HDR_LENGTH
+        self._pos = start + header.length
+        return header, bytes(self._buf[start:self._pos])
+
+    def messages(self):
+        """Yields all complete messages as (CQCHeader, body)."""
+        while True:
+            message = self.next_message()
+            if message is None:
+                return
+            yield message
+
+    def events(self):
+        """
+        Yields a CQCHeaderEvent for all headers of the complete messages, where the offsets are counted
+        from the start of the stream.
+        """
+        while True:
+            header = self._peek_header()
+            if header is None:
+                return
+            start = self._pos
+            end = start + CQCHeader.HDR_LENGTH + header.length
+            message = bytes(self._buf[start:end])
+            self._pos = end
+            stream_offset = self._discarded + start
+            for event in iter_cqc_headers(message):
+                yield event._replace(offset=stream_offset + event.offset)
+
+
+def iter_cqc_file(f, chunk_size=1 << 16):
+    """
+    Yields a CQCHeaderEvent for all headers of the messages in a file-like object opened in binary mode,
+    reading it in chunks.
+    """
+    reader = CQCMessageReader()
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        reader.feed(data)
+        yield from reader.events()
+    if len(reader) > 0:
+        raise CQCIncompleteMessageError("The stream ends with an incomplete CQC message")
@@ -28,7 +28,6 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import sys
-import json
 from cqc.pythonLib import CQCConnection, CQCNoQubitError
 
 
@@ -72,15 +71,13 @@ def main(nr_runs):
             # We save both the measurement outcome and the measurement basis
             meas_outcomes[sequence_nr] = (m, basis)
 
-            # Get the measurement outcomes from Bob
-    msg = Alice.recvClassical(msg_size=10000)
-
-    # Decode the message
-    bob_meas_outcomes = json.loads(msg.decode("utf-8"))
+        # Get the measurement outcomes from Bob
+        bob_sequence_nrs = Alice.recv_array("Bob")
+        bob_outcomes = Alice.recv_array("Bob")
 
     # Check the measurement outcomes
     errors = []
-    for (sequence_nr, mB) in bob_meas_outcomes.items():
+    for (sequence_nr, mB) in zip(bob_sequence_nrs, bob_outcomes):
         mA, basis = meas_outcomes[int(sequence_nr)]
         if basis == "Y":
             if mA == mB:  # In a noiseless situation this shouldn't happen
@@ -106,6 +103,4 @@ if __name__ == "__main__":
         nr_runs = int(sys.argv[1])
     except Exception:
         nr_runs = 500
-    if nr_runs > 1000:
-        raise ValueError("Number of EPR pairs for this example is currently restricted to less than 1000")
     main(nr_runs)
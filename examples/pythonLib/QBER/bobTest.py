@@ -28,12 +28,15 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import sys
-import json
+
+import numpy as np
+
 from cqc.pythonLib import CQCConnection
 
 
 def main(nr_runs):
-    meas_outcomes = {}
+    sequence_nrs = []
+    meas_outcomes = []
 
     # Initialize the connection
     with CQCConnection("Bob") as Bob:
@@ -57,13 +60,12 @@ def main(nr_runs):
                 q.K()
 
             m = q.measure()
-            meas_outcomes[sequence_nr] = m
-
-            # Encode the measurement outcomes to bytes, such that we can send them
-    msg = json.dumps(meas_outcomes).encode("utf-8")
+            sequence_nrs.append(sequence_nr)
+            meas_outcomes.append(m)
 
-    # Send the measurement outcomes to Alice
-    Bob.sendClassical(name="Alice", msg=msg)
+        # Send the measurement outcomes to Alice, together with the identifiers of the EPR pairs
+        Bob.send_array("Alice", np.array(sequence_nrs, dtype=np.uint32))
+        Bob.send_array("Alice", np.array(meas_outcomes, dtype=np.uint8))
 
 
 if __name__ == "__main__":
@@ -71,6 +73,4 @@ if __name__ == "__main__":
         nr_runs = int(sys.argv[1])
     except Exception:
         nr_runs = 500
-    if nr_runs > 1000:
-        raise ValueError("Number of EPR pairs for this example is currently restricted to less than 1000")
     main(nr_runs)
@@ -211,6 +211,35 @@ def test_qubitIDs(tmpdir):
         assert c._qID == 2
 
 
+def test_active_qubits(tmpdir):
+
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+
+    with CQCToFile(file=filename) as cqc:
+
+        qubits = cqc.create_qubits(3)
+        assert cqc.active_qubits == qubits
+
+        qubits[1].measure()
+        assert cqc.active_qubits == [qubits[0], qubits[2]]
+        assert not qubits[1].active
+
+    assert cqc.active_qubits == []
+
+
+def test_qubits_from_backend(tmpdir):
+
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+
+    with CQCToFile(file=filename) as cqc:
+
+        q = qubit._from_backend(cqc, 5)
+        assert q.active
+        assert cqc.active_qubits == [q]
+        assert q.entanglement_info is None
+        assert not hasattr(q, '__dict__')
+
+
 def test_measurement(tmpdir):
 
     filename = os.path.join(str(tmpdir), 'CQC_File')
@@ -260,3 +289,72 @@ def test_flush_on_exit(tmpdir):
     assert cmds[0].instr == CQC_CMD_H
     assert cmds[1].instr == CQC_CMD_X
     assert cmds[2].instr == CQC_CMD_RELEASE
+
+
+def test_buffered_binary(tmpdir):
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+
+    with CQCToFile(file=filename, buffer_size=1024) as cqc:
+
+        q = qubit(cqc)
+        q.H()
+
+        # Nothing is written before the buffer is full
+        assert not os.path.isfile(filename)
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    headers = parse_cqc_message(data)
+    cmds = [hdr for hdr in headers if isinstance(hdr, CQCCmdHeader)]
+    assert [cmd.instr for cmd in cmds] == [CQC_CMD_NEW, CQC_CMD_H, CQC_CMD_RELEASE]
+
+
+def test_rotate_files(tmpdir):
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+
+    msg_length = CQCHeader.HDR_LENGTH + CQCCmdHeader.HDR_LENGTH
+    with CQCToFile(file=filename, buffer_size=0, max_file_size=2 * msg_length) as cqc:
+
+        q = qubit(cqc)
+        for _ in range(4):
+            q.X()
+
+    # Six messages of equal length, two per file
+    assert cqc.files == [filename, filename + '.1', filename + '.2']
+    for file in cqc.files:
+        assert os.path.getsize(file) == 2 * msg_length
+
+
+def test_gzip(tmpdir):
+    import gzip
+
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+
+    with CQCToFile(file=filename, compression='gzip') as cqc:
+
+        q = qubit(cqc)
+        q.X()
+
+    with gzip.open(filename, 'rb') as f:
+        headers = parse_cqc_message(f.read())
+    cmds = [hdr for hdr in headers if isinstance(hdr, CQCCmdHeader)]
+    assert [cmd.instr for cmd in cmds] == [CQC_CMD_NEW, CQC_CMD_X, CQC_CMD_RELEASE]
+
+
+def test_readable(tmpdir):
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+
+    with CQCToFile(file=filename, binary=False, readable=True) as cqc:
+
+        q = qubit(cqc)
+        q.X()
+
+    with open(filename) as f:
+        lines = f.read().splitlines()
+
+    assert len(lines) == 3
+    assert lines[1] == (
+        "CQC Header. Version: 2 Type: 1 App ID: 0 Length: 4; "
+        "Command Header. Qubit ID: 0 Instruction: {} Notify: False Block: True Action: False".format(CQC_CMD_X)
+    )
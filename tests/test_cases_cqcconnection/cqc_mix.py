@@ -184,39 +184,23 @@ def get_expected_headers_bit_flip_code():
             version=2,
             tp=CQCType.COMMAND,
             app_id=0,
-            length=CQCCmdHeader.HDR_LENGTH
+            length=3 * CQCCmdHeader.HDR_LENGTH
         )
         + get_header(
             CQCCmdHeader, 
             qubit_id=1,
             instr=CQC_CMD_RELEASE,
-            notify=True,
+            notify=False,
             action=False,
             block=True,
-        ),
-        # BARRIER
-        get_header(
-            CQCHeader, 
-            version=2,
-            tp=CQCType.COMMAND,
-            app_id=0,
-            length=CQCCmdHeader.HDR_LENGTH
         )
         + get_header(
             CQCCmdHeader, 
             qubit_id=2,
             instr=CQC_CMD_RELEASE,
-            notify=True,
+            notify=False,
             action=False,
             block=True,
-        ),
-        # BARRIER
-        get_header(
-            CQCHeader, 
-            version=2,
-            tp=CQCType.COMMAND,
-            app_id=0,
-            length=CQCCmdHeader.HDR_LENGTH
         )
         + get_header(
             CQCCmdHeader, 
@@ -527,23 +511,15 @@ def get_expected_headers_mix_if_else():
             version=2,
             tp=CQCType.COMMAND,
             app_id=0,
-            length=CQCCmdHeader.HDR_LENGTH
+            length=2 * CQCCmdHeader.HDR_LENGTH
         )
         + get_header(
             CQCCmdHeader, 
             qubit_id=1,
             instr=CQC_CMD_RELEASE,
-            notify=True,
+            notify=False,
             action=False,
             block=True,
-        ),
-        # BARRIER
-        get_header(
-            CQCHeader, 
-            version=2,
-            tp=CQCType.COMMAND,
-            app_id=0,
-            length=CQCCmdHeader.HDR_LENGTH
         )
         + get_header(
             CQCCmdHeader, 
@@ -737,39 +713,23 @@ def get_expected_headers_mix_nested_if_else():
             version=2,
             tp=CQCType.COMMAND,
             app_id=0,
-            length=CQCCmdHeader.HDR_LENGTH
+            length=3 * CQCCmdHeader.HDR_LENGTH
         )
         + get_header(
             CQCCmdHeader, 
             qubit_id=1,
             instr=CQC_CMD_RELEASE,
-            notify=True,
+            notify=False,
             action=False,
             block=True,
-        ),
-        # BARRIER
-        get_header(
-            CQCHeader, 
-            version=2,
-            tp=CQCType.COMMAND,
-            app_id=0,
-            length=CQCCmdHeader.HDR_LENGTH
         )
         + get_header(
             CQCCmdHeader, 
             qubit_id=2,
             instr=CQC_CMD_RELEASE,
-            notify=True,
+            notify=False,
             action=False,
             block=True,
-        ),
-        # BARRIER
-        get_header(
-            CQCHeader, 
-            version=2,
-            tp=CQCType.COMMAND,
-            app_id=0,
-            length=CQCCmdHeader.HDR_LENGTH
         )
         + get_header(
             CQCCmdHeader, 
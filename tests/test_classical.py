@@ -0,0 +1,142 @@
+import socket
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from cqc.pythonLib.cqc_classical import CQCClassicalChannels
+from cqc.pythonLib.util import CQCCancelledError
+
+
+def _free_addr():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return socket.getaddrinfo("127.0.0.1", port, proto=socket.IPPROTO_TCP, family=socket.AF_INET)[0]
+
+
+@pytest.fixture
+def channels():
+    app_net = SimpleNamespace(hostDict={name: SimpleNamespace(addr=_free_addr()) for name in ["Alice", "Bob", "Eve"]})
+    channels = {name: CQCClassicalChannels(name, app_net) for name in app_net.hostDict}
+    for c in channels.values():
+        c.start_server()
+    yield channels
+    for c in channels.values():
+        c.close()
+
+
+def test_send_recv(channels):
+    alice, bob = channels["Alice"], channels["Bob"]
+    for i in range(10):
+        alice.send("Bob", bytes([i]))
+    alice.send("Bob", b"x" * 100000)
+    assert [bob.recv(timeout=1) for _ in range(10)] == [bytes([i]) for i in range(10)]
+    assert bob.recv(timeout=1) == b"x" * 100000
+
+    # Bob replies over the connection opened by Alice
+    bob.send("Alice", b"reply")
+    assert alice.recv("Bob", timeout=1) == b"reply"
+    assert len(alice._names) == 1
+
+
+def test_recv_from(channels):
+    alice, bob, eve = channels["Alice"], channels["Bob"], channels["Eve"]
+    alice.send("Eve", b"from alice")
+    bob.send("Eve", b"from bob")
+    assert eve.recv("Bob", timeout=1) == b"from bob"
+    assert eve.recv(timeout=1) == b"from alice"
+    with pytest.raises(RuntimeError):
+        eve.recv(timeout=0.01)
+
+
+def test_recv_any(channels):
+    alice, bob, eve = channels["Alice"], channels["Bob"], channels["Eve"]
+    eve.send("Alice", b"from eve")
+    bob.send("Alice", b"from bob")
+    eve.send("Alice", b"again from eve")
+    assert alice.recv_any(["Bob", "Eve"], timeout=1) == ("Eve", b"from eve")
+    assert alice.recv_any(["Bob"], timeout=1) == ("Bob", b"from bob")
+    with pytest.raises(RuntimeError):
+        alice.recv_any(["Bob"], timeout=0.01)
+    assert alice.recv_any(["Bob", "Eve"], timeout=1) == ("Eve", b"again from eve")
+
+
+def test_cancel(channels):
+    alice = channels["Alice"]
+    timer = threading.Timer(0.05, alice.cancel)
+    timer.start()
+    with pytest.raises(CQCCancelledError):
+        alice.recv(timeout=5)
+    timer.join()
+    with pytest.raises(RuntimeError):
+        alice.recv(timeout=0.01)
+
+
+def test_open_timeout(channels):
+    alice, bob = channels["Alice"], channels["Bob"]
+    bob.close_server()
+    with pytest.raises(RuntimeError):
+        alice.open("Bob", timeout=0.05)
+    timer = threading.Timer(0.05, alice.cancel)
+    timer.start()
+    with pytest.raises(CQCCancelledError):
+        alice.open("Bob", timeout=5)
+    timer.join()
+
+
+def test_reconnect(channels):
+    alice, bob = channels["Alice"], channels["Bob"]
+    alice.send("Bob", b"1")
+    assert bob.recv(timeout=1) == b"1"
+    bob.close_channel("Alice")
+    alice.send("Bob", b"2")
+    alice.send("Bob", b"3")
+    assert bob.recv(timeout=1) == b"2"
+    assert bob.recv(timeout=1) == b"3"
+
+
+def test_send_recv_array(channels):
+    alice, bob = channels["Alice"], channels["Bob"]
+    data = np.arange(1000000, dtype=np.int32).reshape(1000, 1000)
+    alice.send("Bob", b"before")
+    sender = threading.Thread(target=alice.send_array, args=("Bob", data), kwargs={"chunk_size": 4096})
+    sender.start()
+    received = bob.recv_array("Alice", timeout=5)
+    sender.join()
+    alice.send("Bob", b"after")
+    assert received.dtype == data.dtype
+    assert np.array_equal(received, data)
+    assert bob.recv(timeout=1) == b"before"
+    assert bob.recv(timeout=1) == b"after"
+
+    alice.send_array("Bob", b"blob")
+    out = bytearray(10)
+    assert bob.recv_array(out=out, timeout=1) is out
+    assert out[:4] == b"blob"
+
+    alice.send_array("Bob", np.ones(3, dtype=np.uint8))
+    with pytest.raises(ValueError):
+        bob.recv_array(out=bytearray(2), timeout=1)
+    out = np.zeros(3, dtype=np.uint8)
+    bob.recv_array(out=out, timeout=1)
+    assert list(out) == [1, 1, 1]
+
+
+def test_recv_after_array(channels):
+    alice, bob = channels["Alice"], channels["Bob"]
+    data = np.arange(100000, dtype=np.int64)
+
+    def send():
+        alice.send_array("Bob", data, chunk_size=4096)
+        alice.send("Bob", b"after")
+
+    sender = threading.Thread(target=send)
+    sender.start()
+    # The message following the bulk data can be received before the bulk data
+    assert bob.recv("Alice", timeout=5) == b"after"
+    sender.join()
+    received = bob.recv_array("Alice", timeout=1)
+    assert np.array_equal(received, data)
@@ -0,0 +1,112 @@
+import pytest
+
+from cqc.cqcHeader import CQCExprOpcode
+from cqc.loopback import LoopbackBackend
+from cqc.pythonLib import CQCExpression, CQCMix, CQCMixConnection, CQCVariable, mix_qubit
+from cqc.pythonLib.util import CQCGeneralError
+
+
+@pytest.fixture
+def cqc():
+    with LoopbackBackend(seed=1) as backend:
+        with CQCMixConnection("Alice", socket_address=backend.socket_address,
+                              use_classical_communication=False) as cqc:
+            yield cqc
+
+
+def _qubits(cqc, *values):
+    qubits = [mix_qubit(cqc) for _ in values]
+    for q, value in zip(qubits, values):
+        if value:
+            q.X()
+    return qubits
+
+
+def test_build_expression():
+    m1 = CQCVariable()
+    m2 = CQCVariable()
+    expression = (m1 ^ m2) == 1
+    assert isinstance(expression, CQCExpression)
+    assert expression.instructions == [
+        (CQCExprOpcode.PUSH_REF, m1.ref_id),
+        (CQCExprOpcode.PUSH_REF, m2.ref_id),
+        (CQCExprOpcode.XOR, 0),
+        (CQCExprOpcode.PUSH_VALUE, 1),
+        (CQCExprOpcode.EQ, 0),
+    ]
+    # Comparing a variable to a value still gives a plain IF
+    assert not isinstance(m1 == 1, CQCExpression)
+    assert ((m1 == 1) & (m2 != m1)).instructions[-1] == (CQCExprOpcode.AND, 0)
+    with pytest.raises(ValueError):
+        m1 + (-1)
+
+
+@pytest.mark.parametrize("a, b", [(0, 0), (0, 1), (1, 0), (1, 1)])
+def test_parity(cqc, a, b):
+    q1, q2, target = _qubits(cqc, a, b, 0)
+    with CQCMix(cqc) as pgrm:
+        m1 = q1.measure()
+        m2 = q2.measure()
+        with pgrm.cqc_if(m1 ^ m2 == 1):
+            target.X()
+        with pgrm.cqc_else():
+            target.H()
+            target.H()
+    assert target.measure() == a ^ b
+
+
+def test_counter(cqc):
+    qubits = _qubits(cqc, 1, 0, 1, 1)
+    target = mix_qubit(cqc)
+    with CQCMix(cqc) as pgrm:
+        count = pgrm.assign(0)
+        for q in qubits:
+            pgrm.assign(count + q.measure(), count)
+        with pgrm.cqc_if((count >= 3) & ~(count > 3)):
+            target.X()
+    assert target.measure() == 1
+
+
+def test_unassigned_reference(cqc):
+    q = mix_qubit(cqc)
+    with pytest.raises(CQCGeneralError):
+        with CQCMix(cqc) as pgrm:
+            with pgrm.cqc_if(CQCVariable() + 1 == 1):
+                q.X()
+    q.release()
+
+
+def test_compiled(cqc):
+    def body(pgrm, q1, q2, target):
+        with pgrm.cqc_if(q1.measure() ^ q2.measure()):
+            target.X()
+    program = CQCMix.compile(cqc, body, 3)
+    for a, b in [(0, 1), (1, 1)]:
+        q1, q2, target = _qubits(cqc, a, b, 0)
+        program.run(q1, q2, target)
+        assert target.measure() == a ^ b
+
+
+def test_assign_in_if(cqc):
+    target = mix_qubit(cqc)
+    with CQCMix(cqc) as pgrm:
+        count = pgrm.assign(0)
+        with pgrm.cqc_if(count + 0 == 0):
+            pgrm.assign(count + 1, count)
+        with pgrm.cqc_else():
+            target.X()
+    assert target.measure() == 0
+
+
+def test_assign_in_plain_if(cqc):
+    with CQCMix(cqc) as pgrm:
+        m = pgrm.assign(0)
+        with pgrm.cqc_if(m == 0):
+            pgrm.assign(m + 1, m)
+        with pytest.raises(CQCGeneralError):
+            pgrm.cqc_else()
+
+
+def test_assign_outside_mix(cqc):
+    with pytest.raises(CQCGeneralError):
+        CQCMix(cqc).assign(0)
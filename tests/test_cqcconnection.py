@@ -1,8 +1,12 @@
+import socket
+import time
+
 import pytest
 
 from cqc.util import parse_cqc_message
 from cqc.pythonLib import CQCConnection, qubit
 from cqc.pythonLib import CQCMixConnection
+from cqc.pythonLib.util import CQCGeneralError, CQCTimeoutError
 from cqc.cqcHeader import (
     CQCCmdHeader,
     CQCHeader,
@@ -117,3 +121,37 @@ def test_commands(conn_type, commands_to_apply, get_expected_headers, monkeypatc
         # Excluding None gives the opportunity to not specify all expected headers but still check the number of them
         if expected is not None:
             assert got == expected
+
+
+@pytest.fixture
+def silent_backend():
+    """A backend which accepts connections but never replies."""
+    server = socket.socket()
+    server.bind(("localhost", 0))
+    server.listen(8)
+    yield server.getsockname()
+    server.close()
+
+
+def test_timeouts(silent_backend):
+    with CQCConnection("Alice", socket_address=silent_backend, use_classical_communication=False) as cqc:
+        start = time.monotonic()
+        with pytest.raises(CQCTimeoutError):
+            cqc.createEPR("Bob", remote_socket=("localhost", 8001), timeout=0.1)
+        assert time.monotonic() - start < 1
+        # The reply could still arrive, so the connection can not be used anymore
+        with pytest.raises(CQCGeneralError):
+            cqc.readMessage()
+
+    with CQCConnection("Alice", socket_address=silent_backend, use_classical_communication=False,
+                       timeout=0.1) as cqc:
+        with pytest.raises(CQCTimeoutError):
+            qubit(cqc)
+
+    with CQCConnection("Alice", socket_address=silent_backend, use_classical_communication=False,
+                       timeout=10) as cqc:
+        start = time.monotonic()
+        # The deadline of a call also bounds the timeout of the connection
+        with cqc.deadline(0.1), pytest.raises(CQCTimeoutError):
+            cqc.recvQubit()
+        assert time.monotonic() - start < 1
@@ -0,0 +1,265 @@
+from itertools import islice
+
+import numpy as np
+import pytest
+
+from cqc.cqcHeader import CQC_CMD_MEASURE, CQC_CMD_MEASURE_INPLACE, CQC_CMD_NEW
+from cqc.loopback import LoopbackBackend, StateVectorSimulator, GATES
+from cqc.pythonLib import CQCConnection, CQCMix, CQCMixConnection, mix_qubit, qubit
+from cqc.pythonLib.util import CQCNoQubitError, CQCUnknownError
+
+
+@pytest.fixture
+def backend():
+    with LoopbackBackend(seed=1) as backend:
+        yield backend
+
+
+def _connect(backend, name="Alice", connection_class=CQCConnection, **kwargs):
+    return connection_class(name, socket_address=backend.socket_address, use_classical_communication=False, **kwargs)
+
+
+def test_simulator_bell_state():
+    sim = StateVectorSimulator(seed=0)
+    sim.new("a")
+    sim.new("b")
+    sim.apply(GATES["H"], "a")
+    sim.cnot("a", "b")
+    assert np.allclose(sim.state("a", "b"), np.array([1, 0, 0, 1]) / np.sqrt(2))
+    outcome = sim.measure("a")
+    assert sim.num_qubits == 1
+    assert sim.measure("b") == outcome
+
+
+def test_gates(backend):
+    with _connect(backend) as cqc:
+        q = qubit(cqc)
+        q.X()
+        assert q.measure(inplace=True) == 1
+        q.H()
+        q.Z()
+        q.H()
+        assert q.measure(inplace=True) == 0
+        q.rot_X(128)
+        assert q.measure() == 1
+
+
+def test_entanglement(backend):
+    with _connect(backend) as cqc:
+        for _ in range(10):
+            a = qubit(cqc)
+            b = qubit(cqc)
+            a.H()
+            a.cnot(b)
+            assert a.measure() == b.measure()
+
+
+def test_epr_between_apps(backend):
+    with _connect(backend, "Alice") as alice, _connect(backend, "Bob") as bob:
+        q = alice.createEPR("Bob", remote_appID=bob._appID, remote_socket=backend.socket_address)
+        r = bob.recvEPR()
+        assert q.measure() == r.measure()
+
+
+def test_no_qubit(backend):
+    with _connect(backend) as cqc:
+        cqc.create_qubits(16)
+        with pytest.raises(CQCNoQubitError):
+            qubit(cqc)
+
+
+def test_mix(backend):
+    with _connect(backend, connection_class=CQCMixConnection) as cqc:
+        for _ in range(5):
+            q = mix_qubit(cqc)
+            q.H()
+            with CQCMix(cqc) as pgrm:
+                m = q.measure(inplace=True)
+                with pgrm.cqc_if(m == 0):
+                    q.X()
+            assert q.measure() == 1
+
+
+def test_release_qubits(backend):
+    with _connect(backend) as cqc:
+        qubits = cqc.create_qubits(10)
+        cqc.release_qubits(qubits[:5])
+        assert backend.message_handler.simulator.num_qubits == 5
+        assert cqc.active_qubits == qubits[5:]
+    assert backend.message_handler.simulator.num_qubits == 0
+
+
+def test_auto_batch(backend):
+    with _connect(backend, auto_batch=True) as cqc:
+        sent = []
+        commit = cqc.commit
+        cqc.commit = lambda msg: sent.append(msg) or commit(msg)
+
+        q = qubit(cqc)
+        r = qubit(cqc)
+        sent.clear()
+        for _ in range(3):
+            q.X()
+        q.H()
+        q.cnot(r)
+        assert sent == []
+        # Measuring sends the batch first
+        assert q.measure() == r.measure()
+        assert len(sent) == 3
+
+        cqc.auto_batch_max_commands = 2
+        sent.clear()
+        q = qubit(cqc)
+        q.X()
+        q.X()
+        q.X()
+        assert len(sent) == 2
+    assert backend.message_handler.simulator.num_qubits == 0
+
+
+def test_aggregated_factory(backend):
+    with _connect(backend) as cqc:
+        sent = []
+        commit = cqc.commit
+        cqc.commit = lambda msg: sent.append(msg) or commit(msg)
+
+        q = qubit(cqc)
+        r = qubit(cqc)
+        q.X()
+        cqc.set_pending(True)
+        q.measure(inplace=True)
+        r.measure(inplace=True)
+        sent.clear()
+        assert cqc.flush_factory(600, aggregate="counts") == [600, 0]
+        # The iterations are split in factories of at most 255
+        assert len(sent) == 3
+
+        r.reset()
+        r.H()
+        q.measure(inplace=True)
+        r.measure(inplace=True)
+        histogram = cqc.flush_factory(300, aggregate="histogram")
+        assert set(histogram) == {(1, 0), (1, 1)}
+        assert sum(histogram.values()) == 300
+
+        cqc.put_command(0, CQC_CMD_NEW, notify=False)
+        with pytest.raises(ValueError):
+            cqc.flush_factory(10, aggregate="counts")
+        cqc.reset_pending_headers()
+        cqc.set_pending(False)
+
+
+@pytest.mark.parametrize("aggregate", ["counts", "histogram", "packed"])
+@pytest.mark.parametrize("measure_first", [False, True])
+def test_aggregated_factory_error(backend, aggregate, measure_first):
+    with _connect(backend) as cqc:
+        q = qubit(cqc)
+        cqc.set_pending(True)
+        if measure_first:
+            # The outcome of this measurement in the failed iteration is not returned
+            q.measure(inplace=True)
+        cqc.put_command(99, CQC_CMD_MEASURE, notify=False)
+        with pytest.raises(CQCUnknownError):
+            cqc.flush_factory(10, aggregate=aggregate)
+        cqc.set_pending(False)
+        # The connection can still be used
+        assert qubit(cqc).measure() == 0
+        q.release()
+
+
+def test_packed_factory(backend):
+    with _connect(backend) as cqc:
+        q = qubit(cqc)
+        r = qubit(cqc)
+        q.X()
+        r.H()
+        cqc.set_pending(True)
+        q.measure(inplace=True)
+        r.measure(inplace=True)
+        outcomes = cqc.flush_factory(300, aggregate="packed")
+        cqc.set_pending(False)
+        assert outcomes.shape == (300, 2)
+        assert outcomes.dtype == np.uint8
+        assert np.all(outcomes[:, 0] == 1)
+        # r collapsed at its first measurement
+        assert np.all(outcomes[:, 1] == outcomes[0, 1])
+
+
+def test_empty_packed_factory(backend):
+    with _connect(backend) as cqc:
+        q = qubit(cqc)
+        cqc.set_pending(True)
+        q.measure(inplace=True)
+        outcomes = cqc.flush_factory(0, aggregate="packed")
+        cqc.set_pending(False)
+        assert outcomes.shape == (0, 1)
+        q.release()
+
+
+@pytest.mark.parametrize("aggregate", [None, "packed"])
+def test_streamed_factory_error(backend, aggregate):
+    with _connect(backend) as cqc:
+        q = qubit(cqc)
+        cqc.set_pending(True)
+        if aggregate:
+            # The outcome of this measurement in the failed iteration is not returned
+            q.measure(inplace=True)
+        cqc.put_command(99, CQC_CMD_MEASURE, notify=False)
+        results = cqc.flush_factory(600, aggregate=aggregate, stream=True)
+        with pytest.raises(CQCUnknownError):
+            next(results)
+        cqc.set_pending(False)
+        # The replies of the factory sent ahead are read, so the connection can still be used
+        assert qubit(cqc).measure() == 0
+        q.release()
+
+
+def test_streamed_factory_interrupted(backend, monkeypatch):
+    with _connect(backend) as cqc:
+        q = qubit(cqc)
+        cqc.set_pending(True)
+        cqc.put_command(q._qID, CQC_CMD_MEASURE_INPLACE, notify=False)
+        results = cqc.flush_factory(10, stream=True)
+        # Interrupt at the last reply, after which the backend does not write anymore
+        assert list(islice(results, 9)) == [0] * 9
+
+        def interrupt(message):
+            raise KeyboardInterrupt()
+
+        monkeypatch.setattr(cqc, "parse_CQC_msg", interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            next(results)
+        cqc.set_pending(False)
+        # The replies are only partly read, so the connection cannot be used anymore
+        assert cqc._out_of_sync
+
+
+def test_streamed_factory(backend):
+    with _connect(backend) as cqc:
+        sent = []
+        commit = cqc.commit
+        cqc.commit = lambda msg: sent.append(msg) or commit(msg)
+
+        q = qubit(cqc)
+        q.X()
+        cqc.set_pending(True)
+        q.measure(inplace=True)
+        sent.clear()
+        results = cqc.flush_factory(600, stream=True)
+        assert sent == []
+        assert next(results) == 1
+        # At most two factories are sent ahead
+        assert len(sent) == 2
+        results.close()
+        assert len(sent) == 2
+
+        q.measure(inplace=True)
+        assert sum(cqc.flush_factory(600, stream=True)) == 600
+        q.measure(inplace=True)
+        assert cqc.flush_factory(300) == [1] * 300
+
+        q.measure(inplace=True)
+        chunks = list(cqc.flush_factory(600, aggregate="packed", stream=True))
+        assert [chunk.shape for chunk in chunks] == [(255, 1), (255, 1), (90, 1)]
+        cqc.set_pending(False)
+        assert q.measure() == 1
@@ -0,0 +1,92 @@
+import pytest
+
+from cqc.loopback import LoopbackBackend
+from cqc.pythonLib import CQCMix, CQCMixConnection, CQCVariable, mix_qubit
+from cqc.pythonLib.util import QubitNotActiveError
+
+
+def _reset_to_zero(pgrm, q):
+    m = q.measure(inplace=True)
+    with pgrm.cqc_if(m == 1):
+        q.X()
+
+
+def _correct(pgrm, q, a, b):
+    # Teleport-like corrections
+    ma = a.measure()
+    mb = b.measure()
+    with pgrm.cqc_if(mb == 1):
+        q.X()
+    with pgrm.cqc_if(ma == 1):
+        q.Z()
+    with pgrm.cqc_if(ma == mb):
+        q.H()
+
+
+@pytest.fixture
+def cqc():
+    with LoopbackBackend(seed=1) as backend:
+        with CQCMixConnection("Alice", socket_address=backend.socket_address,
+                              use_classical_communication=False) as cqc:
+            yield cqc
+
+
+def test_run(cqc):
+    program = CQCMix.compile(cqc, _reset_to_zero, 1)
+    assert cqc.active_qubits == []
+    assert program.num_qubits == 1
+    assert program.num_variables == 1
+    for _ in range(5):
+        q = mix_qubit(cqc)
+        q.X()
+        program.run(q)
+        assert q.measure() == 0
+
+
+def test_reused_ids(cqc):
+    program = CQCMix.compile(cqc, _correct, 3)
+    ref_id = CQCVariable._next_ref_id
+    for _ in range(4):
+        q, a, b = cqc.create_qubits(3)
+        a.X()
+        b.X()
+        program.run(q, a, b)
+        assert CQCVariable._next_ref_id == ref_id
+        # The qubits measured by the program are no longer active
+        assert not a.active and not b.active
+        with pytest.raises(QubitNotActiveError):
+            a.X()
+        # X, Z and H were applied, so q is in the state H|1>
+        q.H()
+        assert q.measure() == 1
+
+
+def test_cache(cqc):
+    program = CQCMix.compile(cqc, _reset_to_zero, 1)
+    assert CQCMix.compile(cqc, _reset_to_zero, 1) is program
+    assert CQCMix.compile(cqc, lambda pgrm, q: _reset_to_zero(pgrm, q), 1) is program
+    assert CQCMix.compile(cqc, _correct, 3) is not program
+
+    # A program acting on an actual qubit whose ID equals the index of a placeholder is different
+    q = mix_qubit(cqc)
+    num_qubits = q._qID + 1
+    on_placeholder = CQCMix.compile(cqc, lambda pgrm, *qubits: qubits[q._qID].X(), num_qubits)
+    on_qubit = CQCMix.compile(cqc, lambda pgrm, *qubits: q.X(), num_qubits)
+    assert on_qubit is not on_placeholder
+    on_qubit.run(*cqc.create_qubits(num_qubits))
+    assert q.measure() == 1
+
+
+def test_compile_error(cqc):
+    def body(pgrm, q):
+        q.X()
+        raise RuntimeError()
+    with pytest.raises(RuntimeError):
+        CQCMix.compile(cqc, body, 1)
+    assert not cqc.pend_messages
+    assert cqc.active_qubits == []
+
+    q = mix_qubit(cqc)
+    with pytest.raises(ValueError):
+        CQCMix.compile(cqc, _reset_to_zero, 1).run(q, q)
+    q.release()
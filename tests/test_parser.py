@@ -0,0 +1,228 @@
+import io
+
+import pytest
+
+from cqc.util import (
+    parse_cqc_message,
+    parse_reply,
+    iter_cqc_headers,
+    iter_cqc_file,
+    CQCMessageReader,
+    CQCIncompleteMessageError,
+)
+from cqc.pythonLib import CQCConnection
+from cqc.cqcHeader import (
+    CQCHeader,
+    CQCCmdHeader,
+    CQCTypeHeader,
+    CQCIfHeader,
+    CQCIfExprHeader,
+    CQCAssignExprHeader,
+    CQCExprHeader,
+    CQCExprOpcode,
+    CQCFactoryHeader,
+    CQCAssignHeader,
+    CQCRotationHeader,
+    CQCCommunicationHeader,
+    CQCXtraQubitHeader,
+    CQCMeasOutHeader,
+    CQCMeasSummaryHeader,
+    CQCMeasCountHeader,
+    CQCPackedMeasOutHeader,
+    CQCAggregateMode,
+    CQCType,
+    CQCLogicalOperator,
+    CQC_CMD_H,
+    CQC_CMD_EPR,
+    CQC_CMD_ROT_X,
+    CQC_CMD_MEASURE,
+)
+from cqc.entInfoHeader import EntInfoHeader
+
+from utilities import get_header
+
+
+def _message(tp, body=b''):
+    return get_header(CQCHeader, version=2, tp=tp, app_id=1, length=len(body)) + body
+
+
+def _cmd(instr, qubit_id=1):
+    return get_header(CQCCmdHeader, qubit_id=qubit_id, instr=instr, notify=True, block=True, action=False)
+
+
+def test_command_with_extra_headers():
+    body = (
+        _cmd(CQC_CMD_H)
+        + _cmd(CQC_CMD_ROT_X) + get_header(CQCRotationHeader, step=3)
+        + _cmd(CQC_CMD_EPR) + get_header(CQCCommunicationHeader, remote_app_id=2, remote_node=5, remote_port=8)
+        + _cmd(CQC_CMD_MEASURE) + get_header(CQCAssignHeader, ref_id=7)
+    )
+    msg = _message(CQCType.COMMAND, body)
+    events = list(iter_cqc_headers(msg))
+    classes = [type(event.header) for event in events]
+    assert classes == [
+        CQCHeader, CQCCmdHeader, CQCCmdHeader, CQCRotationHeader,
+        CQCCmdHeader, CQCCommunicationHeader, CQCCmdHeader, CQCAssignHeader,
+    ]
+    assert events[3].header.step == 3
+    assert events[5].header.remote_port == 8
+    assert events[7].header.ref_id == 7
+    assert [event.offset for event in events[:3]] == [0, 8, 12]
+
+
+def test_hello_and_factory():
+    factory_body = get_header(CQCFactoryHeader, num_iter=3, notify=True, block=False) + _cmd(CQC_CMD_H)
+    msg = _message(CQCType.HELLO) + _message(CQCType.FACTORY, factory_body)
+    headers = parse_cqc_message(msg)
+    assert [type(hdr) for hdr in headers] == [CQCHeader, CQCHeader, CQCFactoryHeader, CQCCmdHeader]
+    assert headers[0].tp == CQCType.HELLO
+    assert headers[2].num_iter == 3
+
+
+def test_mix_with_if():
+    if_body = get_header(CQCTypeHeader, tp=CQCType.COMMAND, length=4) + _cmd(CQC_CMD_H, qubit_id=2)
+    mix_body = (
+        get_header(CQCTypeHeader, tp=CQCType.COMMAND, length=8)
+        + _cmd(CQC_CMD_MEASURE) + get_header(CQCAssignHeader, ref_id=0)
+        + get_header(CQCTypeHeader, tp=CQCType.IF, length=CQCIfHeader.HDR_LENGTH)
+        + get_header(CQCIfHeader, first_operand=0, operator=CQCLogicalOperator.EQ,
+                     type_of_second_operand=CQCIfHeader.TYPE_VALUE, second_operand=1, length=len(if_body))
+        + if_body
+        + get_header(CQCTypeHeader, tp=CQCType.COMMAND, length=4) + _cmd(CQC_CMD_H, qubit_id=3)
+    )
+    events = list(iter_cqc_headers(_message(CQCType.MIX, mix_body)))
+    summary = [(type(event.header), event.depth) for event in events]
+    assert summary == [
+        (CQCHeader, 0),
+        (CQCTypeHeader, 1), (CQCCmdHeader, 2), (CQCAssignHeader, 2),
+        (CQCTypeHeader, 1), (CQCIfHeader, 2),
+        (CQCTypeHeader, 2), (CQCCmdHeader, 3),
+        (CQCTypeHeader, 1), (CQCCmdHeader, 2),
+    ]
+    assert events[-1].header.qubit_id == 3
+
+
+def test_mix_with_expressions():
+    expression = (get_header(CQCExprHeader, opcode=CQCExprOpcode.PUSH_REF, operand=0)
+                  + get_header(CQCExprHeader, opcode=CQCExprOpcode.PUSH_REF, operand=1)
+                  + get_header(CQCExprHeader, opcode=CQCExprOpcode.XOR))
+    if_body = get_header(CQCTypeHeader, tp=CQCType.COMMAND, length=4) + _cmd(CQC_CMD_H, qubit_id=2)
+    mix_body = (
+        get_header(CQCTypeHeader, tp=CQCType.ASSIGN_EXPR, length=CQCAssignExprHeader.HDR_LENGTH + len(expression))
+        + get_header(CQCAssignExprHeader, ref_id=2, expr_length=len(expression)) + expression
+        + get_header(CQCTypeHeader, tp=CQCType.IF_EXPR, length=CQCIfExprHeader.HDR_LENGTH + len(expression))
+        + get_header(CQCIfExprHeader, expr_length=len(expression), length=len(if_body)) + expression
+        + if_body
+        + get_header(CQCTypeHeader, tp=CQCType.COMMAND, length=4) + _cmd(CQC_CMD_H, qubit_id=3)
+    )
+    events = list(iter_cqc_headers(_message(CQCType.MIX, mix_body)))
+    summary = [(type(event.header), event.depth) for event in events]
+    assert summary == [
+        (CQCHeader, 0),
+        (CQCTypeHeader, 1), (CQCAssignExprHeader, 2), (CQCExprHeader, 2), (CQCExprHeader, 2), (CQCExprHeader, 2),
+        (CQCTypeHeader, 1), (CQCIfExprHeader, 2), (CQCExprHeader, 2), (CQCExprHeader, 2), (CQCExprHeader, 2),
+        (CQCTypeHeader, 2), (CQCCmdHeader, 3),
+        (CQCTypeHeader, 1), (CQCCmdHeader, 2),
+    ]
+    assert events[4].header.operand == 1
+    assert events[-1].header.qubit_id == 3
+
+
+def test_replies():
+    epr_ok = _message(CQCType.EPR_OK, get_header(CQCXtraQubitHeader, qubit_id=4) + get_header(EntInfoHeader))
+    measout = _message(CQCType.MEASOUT, get_header(CQCMeasOutHeader, outcome=1))
+    headers = parse_cqc_message(epr_ok + measout + _message(CQCType.DONE))
+    assert [type(hdr) for hdr in headers] == [
+        CQCHeader, CQCXtraQubitHeader, EntInfoHeader, CQCHeader, CQCMeasOutHeader, CQCHeader,
+    ]
+
+
+def test_measurement_summary():
+    factory_body = get_header(CQCFactoryHeader, num_iter=200, aggregate=CQCAggregateMode.HISTOGRAM) + _cmd(CQC_CMD_H)
+    assert parse_cqc_message(_message(CQCType.FACTORY, factory_body))[1].aggregate == CQCAggregateMode.HISTOGRAM
+
+    body = get_header(CQCMeasSummaryHeader, aggregate=CQCAggregateMode.HISTOGRAM, num_slots=2, num_iter=200,
+                      num_entries=2)
+    body += get_header(CQCMeasCountHeader, key=1, count=120) + get_header(CQCMeasCountHeader, key=3, count=80)
+    msg = _message(CQCType.MEASOUT_SUMMARY, body)
+    headers = parse_cqc_message(msg + _message(CQCType.DONE))
+    assert [type(hdr) for hdr in headers] == [
+        CQCHeader, CQCMeasSummaryHeader, CQCMeasCountHeader, CQCMeasCountHeader, CQCHeader,
+    ]
+
+    cqc_header, summary_header, count_headers = parse_reply(headers[0], msg[CQCHeader.HDR_LENGTH:])
+    assert summary_header.num_iter == 200
+    assert [(hdr.key, hdr.count) for hdr in count_headers] == [(1, 120), (3, 80)]
+
+
+def test_packed_outcomes():
+    payload = bytes([0b10110000])
+    msg = _message(CQCType.MEASOUT_PACKED, get_header(CQCPackedMeasOutHeader, num_outcomes=4, num_slots=2) + payload)
+    headers = parse_cqc_message(msg + _message(CQCType.DONE))
+    assert [type(hdr) for hdr in headers] == [CQCHeader, CQCPackedMeasOutHeader, CQCHeader]
+
+    _, packed_header, packed = parse_reply(headers[0], msg[CQCHeader.HDR_LENGTH:])
+    assert packed_header.payload_length == 1
+    assert packed == payload
+
+
+def test_incomplete():
+    msg = _message(CQCType.COMMAND, _cmd(CQC_CMD_H))
+    with pytest.raises(CQCIncompleteMessageError):
+        list(iter_cqc_headers(msg[:-1]))
+
+
+def test_incremental_reader():
+    msg = _message(CQCType.COMMAND, _cmd(CQC_CMD_H)) + _message(CQCType.DONE)
+    reader = CQCMessageReader()
+    events = []
+    # Feed the stream one byte at a time
+    for i in range(len(msg)):
+        reader.feed(msg[i:i + 1])
+        events += list(reader.events())
+    assert [event.offset for event in events] == [0, 8, 12]
+    assert len(reader) == 0
+
+    events = list(iter_cqc_file(io.BytesIO(2 * msg), chunk_size=5))
+    assert [event.offset for event in events] == [0, 8, 12, 20, 28, 32]
+
+
+class _ChunkedSocket:
+    """Returns the given data in small chunks"""
+    def __init__(self, data, chunk_size):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def recv(self, maxsize):
+        chunk, self.data = self.data[:self.chunk_size], self.data[self.chunk_size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+def test_read_message(mock_socket):
+    replies = (
+        _message(CQCType.MEASOUT, get_header(CQCMeasOutHeader, outcome=1))
+        + _message(CQCType.NEW_OK, get_header(CQCXtraQubitHeader, qubit_id=4))
+        + _message(CQCType.DONE)
+    )
+    with CQCConnection("Test", socket_address=('localhost', 8000), use_classical_communication=False) as cqc:
+        cqc._s = _ChunkedSocket(replies, chunk_size=3)
+        hdr, measout, _ = cqc.readMessage()
+        assert hdr.tp == CQCType.MEASOUT and measout.outcome == 1
+        hdr, xtra_qubit, _ = cqc.readMessage()
+        assert hdr.tp == CQCType.NEW_OK and xtra_qubit.qubit_id == 4
+        hdr, other, ent_info = cqc.readMessage()
+        assert hdr.tp == CQCType.DONE and other is None and ent_info is None
+
+
+def test_empty_reply(mock_socket):
+    # Replies of a type which usually has a body are accepted without one
+    replies = _message(CQCType.NEW_OK) + _message(CQCType.MEASOUT)
+    assert [type(hdr) for hdr in parse_cqc_message(replies)] == [CQCHeader, CQCHeader]
+    with CQCConnection("Test", socket_address=('localhost', 8000), use_classical_communication=False) as cqc:
+        cqc._s = _ChunkedSocket(replies, chunk_size=3)
+        for tp in (CQCType.NEW_OK, CQCType.MEASOUT):
+            hdr, other, ent_info = cqc.readMessage()
+            assert hdr.tp == tp and other is None and ent_info is None
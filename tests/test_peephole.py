@@ -0,0 +1,108 @@
+import pytest
+
+from cqc.cqcHeader import (
+    CQCCmdHeader,
+    CQCRotationHeader,
+    CQCXtraQubitHeader,
+    CQC_CMD_H,
+    CQC_CMD_I,
+    CQC_CMD_X,
+    CQC_CMD_ROT_X,
+    CQC_CMD_ROT_Z,
+    CQC_CMD_CNOT,
+    CQC_CMD_MEASURE_INPLACE,
+)
+from cqc.loopback import LoopbackBackend
+from cqc.pythonLib import CQCConnection, CQCMix, CQCMixConnection, PeepholeOptimizer, mix_qubit, qubit
+
+
+def _cmd(qubit_id, instr, notify=False, step=None, xtra_qubit_id=None):
+    cmd = CQCCmdHeader()
+    cmd.setVals(qubit_id, instr, notify, True, False)
+    headers = [cmd]
+    if step is not None:
+        xtra = CQCRotationHeader()
+        xtra.setVals(step)
+        headers.append(xtra)
+    if xtra_qubit_id is not None:
+        xtra = CQCXtraQubitHeader()
+        xtra.setVals(xtra_qubit_id)
+        headers.append(xtra)
+    return headers
+
+
+def _instrs(headers):
+    return [(header.qubit_id, header.instr) for header in headers if isinstance(header, CQCCmdHeader)]
+
+
+def test_cancel_and_fuse():
+    optimizer = PeepholeOptimizer()
+    headers = (_cmd(1, CQC_CMD_H) + _cmd(1, CQC_CMD_X) + _cmd(2, CQC_CMD_I) + _cmd(1, CQC_CMD_X) + _cmd(1, CQC_CMD_H)
+               + _cmd(1, CQC_CMD_ROT_X, step=200) + _cmd(2, CQC_CMD_H) + _cmd(1, CQC_CMD_ROT_X, step=100)
+               + _cmd(1, CQC_CMD_CNOT, xtra_qubit_id=2) + _cmd(1, CQC_CMD_CNOT, xtra_qubit_id=2, notify=True))
+    optimized = optimizer.optimize(headers)
+
+    assert _instrs(optimized) == [(1, CQC_CMD_ROT_X), (2, CQC_CMD_H)]
+    assert optimized[1].step == 44
+    # The notification that was asked for is kept
+    assert any(header.notify for header in optimized if isinstance(header, CQCCmdHeader))
+
+    stats = optimizer.last_stats
+    assert (stats.cancelled, stats.fused, stats.dropped) == (6, 1, 1)
+    assert stats.headers_saved == 11
+    assert stats.bytes_saved == sum(header.HDR_LENGTH for header in headers[:5] + headers[8:])
+
+
+def test_barriers():
+    optimizer = PeepholeOptimizer()
+    # Another command on a qubit in between, or a CNOT with the qubits swapped, prevents cancelling
+    headers = (_cmd(1, CQC_CMD_H) + _cmd(1, CQC_CMD_MEASURE_INPLACE) + _cmd(1, CQC_CMD_H)
+               + _cmd(1, CQC_CMD_CNOT, xtra_qubit_id=2) + _cmd(2, CQC_CMD_CNOT, xtra_qubit_id=1)
+               + _cmd(3, CQC_CMD_ROT_Z, step=1) + _cmd(3, CQC_CMD_CNOT, xtra_qubit_id=2)
+               + _cmd(3, CQC_CMD_ROT_Z, step=1))
+    assert optimizer.optimize(headers) == headers
+    assert optimizer.last_stats.headers_saved == 0
+
+
+@pytest.fixture
+def backend():
+    with LoopbackBackend(seed=1) as backend:
+        yield backend
+
+
+def test_pending_sequence(backend):
+    with CQCConnection("Alice", socket_address=backend.socket_address, use_classical_communication=False,
+                       optimize=True) as cqc:
+        q = qubit(cqc)
+        cqc.set_pending(True)
+        q.H()
+        q.H()
+        q.rot_X(64)
+        q.rot_X(64)
+        q.I()
+        q.measure(inplace=True)
+        q.X()
+        q.X()
+        assert cqc.flush() == [1]
+        cqc.set_pending(False)
+        assert cqc.optimizer.last_stats.headers_saved == 7
+        assert cqc.optimizer.total_stats.headers_saved == 7
+        q.release()
+
+
+def test_mix(backend):
+    with CQCMixConnection("Alice", socket_address=backend.socket_address, use_classical_communication=False,
+                          optimize=True) as cqc:
+        q = mix_qubit(cqc)
+        with CQCMix(cqc) as pgrm:
+            q.X()
+            q.X()
+            m = q.measure(inplace=True)
+            with pgrm.cqc_if(m == 0):
+                # Not on the top level of the program, so not optimized
+                q.X()
+                q.X()
+            q.H()
+            q.H()
+        assert q.measure() == 0
+        assert cqc.optimizer.last_stats.cancelled == 4
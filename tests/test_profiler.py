@@ -0,0 +1,58 @@
+import pytest
+
+from cqc.loopback import LoopbackBackend
+from cqc.pythonLib import CQCConnection, CQCProfiler, qubit
+
+
+@pytest.fixture
+def backend():
+    with LoopbackBackend(seed=1) as backend:
+        yield backend
+
+
+def test_profile(backend, tmpdir):
+    with CQCConnection("Alice", socket_address=backend.socket_address, use_classical_communication=False) as cqc:
+        with cqc.profile(rtt=0.0) as p:
+            q = qubit(cqc)
+            q.H()
+            q.measure()
+            cqc.set_pending(True)
+            r = qubit(cqc)
+            r.X()
+            r.measure(inplace=True)
+            cqc.flush_factory(3)
+            cqc.set_pending(False)
+            r.release()
+        # The methods of the connection are restored
+        assert "put_command" not in cqc.__dict__
+        assert isinstance(p, CQCProfiler)
+
+    operations = {operation for (site, operation, phase) in p.times}
+    assert {"NEW", "H", "MEASURE", "flush_factory", "RELEASE"} <= operations
+    assert all(site.startswith("test_profiler.py:test_profile:") for (site, operation, phase) in p.times)
+    calls = {}
+    replies = {}
+    for (site, operation), num_calls in p.calls.items():
+        calls[operation] = calls.get(operation, 0) + num_calls
+    for (site, operation), num_replies in p.replies.items():
+        replies[operation] = replies.get(operation, 0) + num_replies
+    assert calls["flush_factory"] == 1
+    # A measurement is not notified, only its outcome is read
+    assert replies["MEASURE"] == 1
+    assert replies["flush_factory"] >= 3
+    # With the round-trip time given, waiting is split in network and backend
+    assert {phase for (_, _, phase) in p.phase_times()} == {"client", "send", "network", "backend"}
+
+    summary = p.summary()
+    assert "MEASURE" in summary
+    assert "backend" in summary
+    assert "test_profile" in p.summary(by="site")
+
+    path = str(tmpdir.join("cqc.folded"))
+    p.write_collapsed(path)
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert lines == p.collapsed()
+    stack, value = lines[0].rsplit(" ", 1)
+    assert len(stack.split(";")) == 3
+    assert int(value) >= 0
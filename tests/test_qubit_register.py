@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from cqc.loopback import LoopbackBackend
+from cqc.pythonLib import CQCConnection, QubitRegister
+from cqc.util import parse_cqc_message
+from cqc.cqcHeader import CQCCmdHeader, CQC_CMD_H, CQC_CMD_CNOT
+
+
+class _CountingConnection(CQCConnection):
+    """Keeps the messages committed to the backend"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.committed = []
+
+    def commit(self, msg):
+        self.committed.append(msg)
+        super().commit(msg)
+
+
+@pytest.fixture
+def cqc():
+    with LoopbackBackend(seed=2) as backend:
+        with _CountingConnection("Alice", socket_address=backend.socket_address,
+                                 use_classical_communication=False) as cqc:
+            yield cqc
+
+
+def _instructions(msg):
+    return [hdr.instr for hdr in parse_cqc_message(msg) if isinstance(hdr, CQCCmdHeader)]
+
+
+def test_ghz(cqc):
+    for _ in range(5):
+        reg = QubitRegister(cqc, 6)
+        cqc.committed.clear()
+        reg[0].H()
+        reg.cnot_chain()
+        assert _instructions(cqc.committed[-1]) == [CQC_CMD_CNOT] * 5
+        outcomes = reg.measure_all()
+        assert outcomes.dtype == np.uint8
+        assert len(set(outcomes)) == 1
+        assert len(cqc.committed) == 3
+    assert cqc.active_qubits == []
+
+
+def test_mask(cqc):
+    reg = QubitRegister(cqc, 4)
+    reg[np.array([True, False, True, False])].X()
+    reg[[1]].H()
+    reg[1].H()
+    assert list(reg.measure_all(inplace=True)) == [1, 0, 1, 0]
+    assert len(cqc.active_qubits) == 4
+    cqc.committed.clear()
+    reg.H()
+    assert len(cqc.committed) == 1
+    assert _instructions(cqc.committed[0]) == [CQC_CMD_H] * 4
+    reg.release()
+    assert cqc.active_qubits == []
+
+
+def test_pending(cqc):
+    reg = QubitRegister(cqc, 2)
+    cqc.pend_messages = True
+    reg.X()
+    assert reg.measure_all() == [None, None]
+    assert list(cqc.flush()) == [1, 1]
+    cqc.pend_messages = False
+
+
+def test_failed_sequence(cqc, monkeypatch):
+    reg = QubitRegister(cqc, 2)
+
+    def broken_pipe(msg):
+        raise BrokenPipeError()
+
+    with monkeypatch.context() as m:
+        m.setattr(cqc, "commit", broken_pipe)
+        with pytest.raises(BrokenPipeError):
+            reg.H()
+    # The connection does not pend later commands
+    assert not cqc.pend_messages
+    assert cqc._pending_headers == []
+    reg.X()
+    assert list(reg.measure_all()) == [1, 1]
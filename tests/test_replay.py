@@ -0,0 +1,95 @@
+import os
+
+from cqc.replay import replay_trace
+from cqc.util import parse_cqc_message, parse_reply
+from cqc.pythonLib import CQCToFile, qubit
+from cqc.cqcHeader import (
+    CQCHeader,
+    CQCCmdHeader,
+    CQCXtraQubitHeader,
+    CQCMeasOutHeader,
+    CQCType,
+    CQC_CMD_NEW,
+    CQC_CMD_H,
+    CQC_CMD_CNOT,
+    CQC_CMD_MEASURE,
+)
+
+from utilities import get_header
+
+
+class FakeConnection:
+    """Replies to commands as a backend would, giving out qubit IDs starting from 100"""
+    def __init__(self):
+        self.sent = []
+        self.replies = []
+        self.next_qubit_id = 100
+
+    def get_appID(self):
+        return 3
+
+    def commit(self, msg):
+        self.sent.append(msg)
+        headers = parse_cqc_message(msg)
+        cqc_header = headers[0]
+        notify = False
+        for hdr in headers[1:]:
+            if isinstance(hdr, CQCCmdHeader):
+                notify = notify or hdr.notify
+                if hdr.instr == CQC_CMD_NEW:
+                    self._reply(CQCType.NEW_OK, get_header(CQCXtraQubitHeader, qubit_id=self.next_qubit_id))
+                    self.next_qubit_id += 1
+                elif hdr.instr == CQC_CMD_MEASURE:
+                    self._reply(CQCType.MEASOUT, get_header(CQCMeasOutHeader, outcome=1))
+        if notify and cqc_header.tp == CQCType.COMMAND:
+            self._reply(CQCType.DONE)
+
+    def _reply(self, tp, body=b''):
+        hdr = CQCHeader()
+        hdr.setVals(2, tp, 3, len(body))
+        self.replies.append(parse_reply(hdr, body))
+
+    def readMessage(self):
+        return self.replies.pop(0)
+
+
+def _record(filename):
+    with CQCToFile(file=filename, overwrite=True) as cqc:
+        a = qubit(cqc)
+        b = qubit(cqc)
+        a.H()
+        a.cnot(b)
+        a.measure()
+
+
+def test_replay(tmpdir):
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+    _record(filename)
+
+    conn = FakeConnection()
+    result = replay_trace(filename, conn)
+
+    # NEW, NEW, H, CNOT, MEASURE, RELEASE
+    assert result.num_messages == 6
+    assert not result.errors
+    assert not conn.replies
+
+    headers = [parse_cqc_message(msg) for msg in conn.sent]
+    for hdrs in headers:
+        assert hdrs[0].app_id == 3
+    # The qubit IDs 0 and 1 of the trace are replaced by the ones from the backend
+    assert headers[2][1].instr == CQC_CMD_H and headers[2][1].qubit_id == 100
+    assert headers[3][1].instr == CQC_CMD_CNOT and headers[3][1].qubit_id == 100
+    assert headers[3][2].qubit_id == 101
+    assert headers[5][1].qubit_id == 101
+    assert "Replayed 6 messages" in result.summary()
+
+
+def test_replay_range(tmpdir):
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+    _record(filename)
+
+    conn = FakeConnection()
+    result = replay_trace(filename, conn, rewrite_qubit_ids=False, start=2, stop=4, rate=1000)
+    assert result.num_messages == 2
+    assert parse_cqc_message(conn.sent[0])[1].qubit_id == 0
@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+from cqc.cqcHeader import (
+    CQCCmdHeader,
+    CQCRotationHeader,
+    CQCXtraQubitHeader,
+    CQC_CMD_X,
+    CQC_CMD_Y,
+    CQC_CMD_Z,
+    CQC_CMD_T,
+    CQC_CMD_H,
+    CQC_CMD_K,
+    CQC_CMD_ROT_X,
+    CQC_CMD_ROT_Y,
+    CQC_CMD_ROT_Z,
+    CQC_CMD_CNOT,
+    CQC_CMD_CPHASE,
+    CQC_CMD_MEASURE_INPLACE,
+    CQC_CMD_NEW,
+)
+from cqc.loopback import GATES, LoopbackBackend, StateVectorSimulator, rotation
+from cqc.pythonLib import CQCConnection, GateScheduler
+
+_SINGLE_QUBIT_GATES = {CQC_CMD_X: "X", CQC_CMD_Y: "Y", CQC_CMD_Z: "Z", CQC_CMD_T: "T", CQC_CMD_H: "H", CQC_CMD_K: "K"}
+_ROTATIONS = {CQC_CMD_ROT_X: "X", CQC_CMD_ROT_Y: "Y", CQC_CMD_ROT_Z: "Z"}
+
+
+def _cmd(qubit_id, instr, step=None, xtra_qubit_id=None):
+    cmd = CQCCmdHeader()
+    cmd.setVals(qubit_id, instr, False, True, False)
+    headers = [cmd]
+    if step is not None:
+        xtra = CQCRotationHeader()
+        xtra.setVals(step)
+        headers.append(xtra)
+    if xtra_qubit_id is not None:
+        xtra = CQCXtraQubitHeader()
+        xtra.setVals(xtra_qubit_id)
+        headers.append(xtra)
+    return headers
+
+
+def _random_circuit(rng, num_qubits, num_commands, measure=False):
+    single = list(_SINGLE_QUBIT_GATES) + ([CQC_CMD_MEASURE_INPLACE] if measure else [])
+    headers = []
+    for _ in range(num_commands):
+        kind = rng.randint(3)
+        qubit_id = rng.randint(num_qubits)
+        if kind == 0:
+            headers += _cmd(qubit_id, single[rng.randint(len(single))])
+        elif kind == 1:
+            headers += _cmd(qubit_id, list(_ROTATIONS)[rng.randint(3)], step=rng.randint(256))
+        else:
+            other = (qubit_id + 1 + rng.randint(num_qubits - 1)) % num_qubits
+            headers += _cmd(qubit_id, [CQC_CMD_CNOT, CQC_CMD_CPHASE][rng.randint(2)], xtra_qubit_id=other)
+    return headers
+
+
+def _simulate(headers, num_qubits):
+    sim = StateVectorSimulator(seed=0)
+    for qubit_id in range(num_qubits):
+        sim.new(qubit_id)
+    commands = [headers[i:i + 2] for i in range(len(headers)) if isinstance(headers[i], CQCCmdHeader)]
+    for cmd, *xtra in commands:
+        if cmd.instr in _SINGLE_QUBIT_GATES:
+            sim.apply(GATES[_SINGLE_QUBIT_GATES[cmd.instr]], cmd.qubit_id)
+        elif cmd.instr in _ROTATIONS:
+            sim.apply(rotation(_ROTATIONS[cmd.instr], xtra[0].step), cmd.qubit_id)
+        elif cmd.instr == CQC_CMD_CNOT:
+            sim.cnot(cmd.qubit_id, xtra[0].qubit_id)
+        elif cmd.instr == CQC_CMD_CPHASE:
+            sim.cphase(cmd.qubit_id, xtra[0].qubit_id)
+    return sim.state(*range(num_qubits))
+
+
+def _commands_on(headers, qubit_id):
+    commands = [headers[i:i + 2] for i in range(len(headers)) if isinstance(headers[i], CQCCmdHeader)]
+    on_qubit = []
+    for cmd, *xtra in commands:
+        targets = {cmd.qubit_id}
+        if xtra and isinstance(xtra[0], CQCXtraQubitHeader):
+            targets.add(xtra[0].qubit_id)
+        if qubit_id in targets:
+            on_qubit.append(id(cmd))
+    return on_qubit
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_circuits(seed):
+    rng = np.random.RandomState(seed)
+    headers = _random_circuit(rng, num_qubits=5, num_commands=40)
+    scheduler = GateScheduler()
+    scheduled = scheduler.schedule(headers)
+
+    assert sorted(map(id, scheduled)) == sorted(map(id, headers))
+    assert scheduler.last_depth <= 40
+    assert np.allclose(_simulate(scheduled, 5), _simulate(headers, 5))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_dependencies_kept(seed):
+    rng = np.random.RandomState(seed)
+    headers = _random_circuit(rng, num_qubits=4, num_commands=30, measure=True)
+    headers[10:10] = _cmd(0, CQC_CMD_NEW)
+    scheduled = GateScheduler().schedule(headers)
+
+    for qubit_id in range(4):
+        assert _commands_on(scheduled, qubit_id) == _commands_on(headers, qubit_id)
+
+    def measurements(hdrs):
+        return [id(hdr) for hdr in hdrs if isinstance(hdr, CQCCmdHeader) and hdr.instr == CQC_CMD_MEASURE_INPLACE]
+    assert measurements(scheduled) == measurements(headers)
+    # Nothing moves past the NEW command
+    new_index = next(i for i, hdr in enumerate(scheduled) if isinstance(hdr, CQCCmdHeader) and hdr.instr == CQC_CMD_NEW)
+    assert set(map(id, scheduled[:new_index])) == set(map(id, headers[:10]))
+
+
+def test_layers():
+    headers = (_cmd(0, CQC_CMD_H) + _cmd(0, CQC_CMD_MEASURE_INPLACE) + _cmd(1, CQC_CMD_H)
+               + _cmd(1, CQC_CMD_CNOT, xtra_qubit_id=2) + _cmd(3, CQC_CMD_X))
+    layers = GateScheduler().layers(headers)
+    # The measurement is pushed to the last layer
+    assert [[cmd.instr for cmd, *_ in layer] for layer in layers] == [
+        [CQC_CMD_H, CQC_CMD_H, CQC_CMD_X],
+        [CQC_CMD_MEASURE_INPLACE, CQC_CMD_CNOT],
+    ]
+
+
+def test_pending_sequence():
+    with LoopbackBackend(seed=1) as backend:
+        with CQCConnection("Alice", socket_address=backend.socket_address, use_classical_communication=False,
+                           schedule=True) as cqc:
+            qubits = cqc.create_qubits(4)
+            cqc.set_pending(True)
+            qubits[0].H()
+            qubits[0].measure(inplace=True)
+            for i in range(3):
+                qubits[i].cnot(qubits[i + 1])
+            for q in qubits:
+                q.measure(inplace=True)
+            outcomes = cqc.flush()
+            cqc.set_pending(False)
+            assert len(set(outcomes)) == 1
+            assert cqc.scheduler.last_depth == 7
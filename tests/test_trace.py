@@ -0,0 +1,63 @@
+import os
+
+from cqc.trace import CQCTraceReader
+from cqc.pythonLib import CQCToFile, qubit
+from cqc.cqcHeader import (
+    CQCType,
+    CQC_CMD_NEW,
+    CQC_CMD_X,
+    CQC_CMD_RELEASE,
+    CQCCmdHeader,
+)
+
+
+def _write_trace(filename, num_x):
+    with CQCToFile(file=filename, overwrite=True) as cqc:
+        q = qubit(cqc)
+        for _ in range(num_x):
+            q.X()
+
+
+def test_iterate(tmpdir):
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+    _write_trace(filename, 3)
+
+    with CQCTraceReader(filename) as reader:
+        messages = list(reader)
+
+    assert len(messages) == 5
+    instrs = []
+    for i, message in enumerate(messages):
+        assert message.index == i
+        assert message.header.tp == CQCType.COMMAND
+        instrs.append(CQCCmdHeader(message.data[8:12]).instr)
+    assert instrs == [CQC_CMD_NEW] + 3 * [CQC_CMD_X] + [CQC_CMD_RELEASE]
+
+
+def test_random_access(tmpdir):
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+    _write_trace(filename, 10)
+
+    with CQCTraceReader(filename) as reader:
+        assert len(reader) == 12
+        assert reader[3].offset == 3 * 12
+        hdr, cmd = reader.headers(-1)
+        assert cmd.instr == CQC_CMD_RELEASE
+        assert [m.index for m in reader.iter_messages(start=10)] == [10, 11]
+
+    # The index is stored next to the trace and reused
+    assert os.path.isfile(filename + CQCTraceReader.INDEX_SUFFIX)
+    with CQCTraceReader(filename) as reader:
+        assert reader._load_index() is not None
+        assert len(reader) == 12
+
+
+def test_outdated_index(tmpdir):
+    filename = os.path.join(str(tmpdir), 'CQC_File')
+    _write_trace(filename, 1)
+    with CQCTraceReader(filename) as reader:
+        assert len(reader) == 3
+
+    _write_trace(filename, 4)
+    with CQCTraceReader(filename) as reader:
+        assert len(reader) == 6